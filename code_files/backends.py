@@ -0,0 +1,163 @@
+# backends.py
+# Interchangeable inference backends: eager PyTorch, TorchScript, ONNX Runtime and int8 TorchScript.
+# Every backend is a callable that maps a float image batch tensor to a logits tensor,
+# so predict.py / serve.py can use them in place of the nn.Module.
+import json
+import os
+
+import numpy as np
+import torch
+
+from benchmarks.common import time_fn
+
+BACKENDS = ("torch", "torchscript", "onnx", "int8")
+
+
+def export_paths(checkpoint_path):
+    """Files written by export.py next to a checkpoint (e.g. best.pth.tar -> best.onnx)."""
+    base = checkpoint_path
+    for suffix in (".pth.tar", ".pth", ".pt", ".tar"):
+        if base.endswith(suffix):
+            base = base[:-len(suffix)]
+            break
+    return {
+        "onnx": base + ".onnx",
+        "torchscript": base + ".torchscript.pt",
+        "int8": base + ".int8.torchscript.pt",
+        "meta": base + ".export.json",
+        "report": base + ".export_report.json",
+        "int8_report": base + ".int8_report.json",
+    }
+
+
+def export_meta(config, checkpoint_path, threshold, **extra):
+    """Metadata stored next to exported models so they can be served without the checkpoint."""
+    return {
+        "model_name": config.MODEL_NAME,
+        "checkpoint": os.path.abspath(checkpoint_path),
+        "in_channels": config.IN_CHANNELS,
+        "image_size": list(config.IMAGE_SIZE),
+        "sequence_length": config.SEQUENCE_LENGTH,
+        "threshold": threshold,
+        **extra,
+    }
+
+
+def load_model_for_inference(checkpoint_path, config):
+    """
+    Builds config.MODEL_NAME, loads its weights, applies the inference optimization
+    pass (optimize.py, if config.OPTIMIZE_INFERENCE) and picks the decision threshold.
+
+    Returns:
+        (model in eval mode on config.DEVICE, threshold) or (None, None) if the checkpoint could not be loaded.
+    """
+    from model.builders import get_model
+    from utils import load_checkpoint
+    from optimize import optimize_from_config
+
+    model = get_model(config)
+    checkpoint = load_checkpoint(checkpoint_path, model, None, 0, config.DEVICE)
+    if checkpoint is None:
+        return None, None
+    threshold = config.THRESHOLD
+    if config.USE_CHECKPOINT_THRESHOLD and "threshold" in checkpoint:
+        threshold = float(checkpoint["threshold"])
+    model.eval()
+    return optimize_from_config(model, config), threshold
+
+
+class TorchBackend:
+    """Eager nn.Module."""
+    name = "torch"
+
+    def __init__(self, model):
+        self.model = model.eval()
+
+    def __call__(self, data):
+        with torch.no_grad():
+            return self.model(data)
+
+
+class TorchScriptBackend:
+    """Traced TorchScript module saved by export.py."""
+    name = "torchscript"
+
+    def __init__(self, path, device="cpu"):
+        self.device = device
+        self.module = torch.jit.load(path, map_location=device).eval()
+
+    def __call__(self, data):
+        with torch.no_grad():
+            return self.module(data.to(self.device))
+
+
+class OnnxRuntimeBackend:
+    """ONNX model on ONNX Runtime (CPU). Inputs / outputs are torch tensors on the CPU."""
+    name = "onnx"
+
+    def __init__(self, path, num_threads=None):
+        import onnxruntime as ort  # optional dependency, only needed for this backend
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.intra_op_num_threads = num_threads or torch.get_num_threads()
+        self.session = ort.InferenceSession(path, sess_options=options, providers=["CPUExecutionProvider"])
+        self.input_name = self.session.get_inputs()[0].name
+
+    def __call__(self, data):
+        inputs = np.ascontiguousarray(data.detach().cpu().numpy(), dtype=np.float32)
+        return torch.from_numpy(self.session.run(None, {self.input_name: inputs})[0])
+
+
+def _read_export_meta(meta_path, config):
+    """Loads export.py metadata and warns if it does not match the current config."""
+    if not os.path.isfile(meta_path):
+        print(f"Warning: Export metadata {meta_path} not found; assuming it matches the current config.")
+        return {}
+    with open(meta_path) as f:
+        meta = json.load(f)
+    expected = {"model_name": config.MODEL_NAME, "in_channels": config.IN_CHANNELS,
+                "image_size": list(config.IMAGE_SIZE), "sequence_length": config.SEQUENCE_LENGTH}
+    for key, value in expected.items():
+        if key in meta and meta[key] != value:
+            print(f"Warning: Exported {key}={meta[key]} but config has {value}.")
+    return meta
+
+
+def load_inference_backend(backend, checkpoint_path, config):
+    """
+    Returns (callable backend, threshold) for `backend` in BACKENDS, or (None, None) on failure.
+
+    "torch" loads the checkpoint itself; "torchscript" / "onnx" load the files
+    written by export.py ("int8": quantize.py) next to the checkpoint, and take
+    the threshold from the export metadata.
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown backend '{backend}'. Choose from {BACKENDS}.")
+    if backend == "torch":
+        model, threshold = load_model_for_inference(checkpoint_path, config)
+        return (TorchBackend(model), threshold) if model is not None else (None, None)
+
+    paths = export_paths(checkpoint_path)
+    if not os.path.isfile(paths[backend]):
+        script = "quantize.py" if backend == "int8" else "export.py"
+        print(f"ERROR: {paths[backend]} not found. Run {script} --checkpoint {checkpoint_path} first.")
+        return None, None
+    meta = _read_export_meta(paths["meta"], config)
+    threshold = config.THRESHOLD
+    if config.USE_CHECKPOINT_THRESHOLD and meta.get("threshold") is not None:
+        threshold = float(meta["threshold"])
+
+    print(f"=> Loading {backend} model from {paths[backend]}")
+    if backend == "torchscript":
+        return TorchScriptBackend(paths[backend], device=config.DEVICE), threshold
+    if backend == "int8":
+        return TorchScriptBackend(paths[backend], device="cpu"), threshold # quantized kernels are CPU-only
+    return OnnxRuntimeBackend(paths[backend]), threshold
+
+
+def time_backend(backend, data, repeats=10, warmup=2):
+    """benchmarks.common.time_fn latency of backend(data) in ms, plus "per_frame_ms" (median / batch size)."""
+    stats = time_fn(backend, data, repeats=repeats, warmup=warmup)
+    stats["per_frame_ms"] = stats["median_ms"] / data.shape[0]
+    return stats
@@ -0,0 +1,2 @@
+# benchmarks/__init__.py
+# Performance benchmarks. Run from code_files/, e.g. `python -m benchmarks.convlstm`.
@@ -0,0 +1,77 @@
+# benchmarks/attention_unet.py
+# The AttentionUNet family (width multiplier x depth x dense / depthwise-separable
+# ConvBlocks): FLOPs, parameters, CPU latency and (given checkpoints) test IoU.
+#
+#   python -m benchmarks.attention_unet --checkpoint 0.5:4:sep=checkpoints/A/best.pth.tar --test-limit 100
+import argparse
+import os
+
+import torch
+
+from config import Config
+from benchmarks.common import count_flops, count_parameters, print_table, save_results, test_set_scores, time_fn
+
+# WIDTH_MULT:DEPTH[:sep]
+DEFAULT_VARIANTS = ["1.0:4", "0.5:4", "0.25:4", "0.5:3",
+                    "1.0:4:sep", "0.5:4:sep", "0.25:4:sep", "0.25:3:sep"]
+
+
+def variant_config(config, variant):
+    """AttentionUNet config copy for a variant such as "0.5:4:sep" (ATTUNET_WIDTH_MULT=0.5, ATTUNET_DEPTH=4, ATTUNET_SEPARABLE=True)."""
+    width_mult, depth, *flags = variant.split(":")
+    if any(flag != "sep" for flag in flags):
+        raise ValueError(f"Unknown AttentionUNet variant '{variant}'; expected WIDTH_MULT:DEPTH[:sep]")
+    variant_cfg = config.for_model("AttentionUNet")
+    variant_cfg.ATTUNET_WIDTH_MULT = float(width_mult)
+    variant_cfg.ATTUNET_DEPTH = int(depth)
+    variant_cfg.ATTUNET_SEPARABLE = "sep" in flags
+    return variant_cfg
+
+
+def main():
+    config = Config()
+    parser = argparse.ArgumentParser(description="Compare the AttentionUNet width / depth / separable variants.")
+    parser.add_argument("--variants", nargs="+", default=DEFAULT_VARIANTS, help="WIDTH_MULT:DEPTH[:sep] entries.")
+    parser.add_argument("--checkpoint", action="append", default=[], metavar="VARIANT=PATH",
+                        help="Trained weights for a variant; enables the IoU column for it.")
+    parser.add_argument("--test-limit", type=int, default=None, help="Score IoU on the first N test samples only.")
+    parser.add_argument("--batch-size", type=int, default=1)
+    parser.add_argument("--image-size", type=int, nargs=2, default=list(config.IMAGE_SIZE), metavar=("W", "H"))
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--device", default="cpu")
+    parser.add_argument("--output", default=os.path.join(config.BENCHMARK_DIR, "attention_unet.json"))
+    args = parser.parse_args()
+
+    from model.builders import get_model
+    from utils import load_checkpoint
+    checkpoints = dict(spec.split("=", 1) for spec in args.checkpoint)
+    width, height = args.image_size
+    config.DEVICE = args.device
+    rows = []
+    for variant in args.variants:
+        variant_cfg = variant_config(config, variant)
+        torch.manual_seed(0)
+        model = get_model(variant_cfg).to(args.device).eval()
+        x = torch.rand(args.batch_size, config.IN_CHANNELS, height, width, device=args.device)
+        row = {"variant": variant, "features": model.features, "params_m": count_parameters(model) / 1e6,
+               "gflops": count_flops(model, x) / 1e9}
+        with torch.no_grad():
+            timing = time_fn(model, x, repeats=args.repeats, warmup=1)
+        row["latency_ms"] = timing["median_ms"]
+        row["p90_ms"] = timing["p90_ms"]
+
+        if variant in checkpoints:
+            checkpoint = load_checkpoint(checkpoints[variant], model, None, 0, args.device)
+            threshold = float(checkpoint.get("threshold", config.THRESHOLD)) if checkpoint else config.THRESHOLD
+            row.update(test_set_scores(model, variant_cfg, threshold=threshold, limit=args.test_limit))
+        rows.append(row)
+        print(f"{variant}: {row['gflops']:.1f} GFLOPs, {row['latency_ms']:.1f} ms")
+
+    print(f"\nBatch {args.batch_size}, {width}x{height}, {args.device}")
+    print_table(rows, ["variant", "params_m", "gflops", "latency_ms", "p90_ms", "IoU", "Dice Coefficient"])
+    save_results({"batch_size": args.batch_size, "image_size": [width, height], "device": args.device,
+                  "test_limit": args.test_limit, "rows": rows}, args.output)
+
+
+if __name__ == "__main__":
+    main()
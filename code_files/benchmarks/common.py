@@ -0,0 +1,219 @@
+# benchmarks/common.py
+# Shared timing / memory helpers and result writing for the benchmark scripts.
+import ctypes
+import gc
+import json
+import os
+import platform
+import threading
+import time
+
+import numpy as np
+import torch
+
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+def time_fn(fn, *args, repeats=10, warmup=2):
+    """
+    Wall-clock latency of fn(*args) in ms.
+
+    Returns:
+        dict: median_ms, mean_ms, p90_ms, p99_ms, min_ms over `repeats` timed calls.
+    """
+    for _ in range(warmup):
+        fn(*args)
+    times = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        fn(*args)
+        times.append((time.perf_counter() - started) * 1000.0)
+    times = np.asarray(times)
+    return {"median_ms": float(np.median(times)), "mean_ms": float(times.mean()),
+            "p90_ms": float(np.percentile(times, 90)), "p99_ms": float(np.percentile(times, 99)),
+            "min_ms": float(times.min())}
+
+
+def release_free_memory():
+    """Returns freed heap memory to the OS (glibc), so the next RSS baseline is not inflated by earlier runs."""
+    gc.collect()
+    try:
+        ctypes.CDLL("libc.so.6").malloc_trim(0)
+    except (OSError, AttributeError):
+        pass
+
+
+def current_rss_bytes():
+    """Resident set size of this process (Linux /proc; 0 where unavailable)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * PAGE_SIZE
+    except (OSError, IndexError, ValueError):
+        return 0
+
+
+class PeakMemory:
+    """
+    Peak memory of the enclosed block above its starting level, in MB.
+
+    On CUDA this is the allocator's peak; on the CPU the RSS is sampled on a
+    background thread every `interval` seconds, starting from a trimmed heap
+    (large tensors are mmap-backed, so they show up in and leave the RSS as
+    they are allocated and freed).
+
+    Usage:
+        with PeakMemory(device) as mem:
+            model(x)
+        mem.peak_mb
+    """
+    def __init__(self, device="cpu", interval=0.001):
+        self.cuda = str(device).startswith("cuda") and torch.cuda.is_available()
+        self.interval = interval
+        self.peak_mb = 0.0
+
+    def _sample(self):
+        while not self._stop.is_set():
+            self._peak = max(self._peak, current_rss_bytes())
+            time.sleep(self.interval)
+
+    def __enter__(self):
+        if self.cuda:
+            torch.cuda.synchronize()
+            torch.cuda.reset_peak_memory_stats()
+            self._start = torch.cuda.memory_allocated()
+        else:
+            release_free_memory()
+            self._start = self._peak = current_rss_bytes()
+            self._stop = threading.Event()
+            self._thread = threading.Thread(target=self._sample, daemon=True)
+            self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self.cuda:
+            torch.cuda.synchronize()
+            peak = torch.cuda.max_memory_allocated()
+        else:
+            self._stop.set()
+            self._thread.join()
+            peak = max(self._peak, current_rss_bytes())
+        self.peak_mb = max(0, peak - self._start) / 1e6
+        return False
+
+
+def count_parameters(model):
+    return sum(p.numel() for p in model.parameters())
+
+
+def count_flops(model, *inputs):
+    """
+    FLOPs of one forward pass (a multiply-add counts as 2), from torch's
+    operator-level counter. Only matmul / conv style ops are counted, so
+    elementwise work (BN, activations, attention products) is excluded.
+    """
+    from torch.utils.flop_counter import FlopCounterMode
+
+    counter = FlopCounterMode(display=False)
+    with torch.no_grad(), counter:
+        model(*inputs)
+    return counter.get_total_flops()
+
+
+def test_set_scores(model, config, threshold=None, limit=None):
+    """
+    Micro IoU / Dice of `model` on the first `limit` samples of the test set
+    (whole set if None), using the test.py loader for config.
+
+    Returns:
+        dict: {"IoU", "Dice Coefficient", "num_samples"}.
+    """
+    from torch.utils.data import DataLoader, Subset
+    from metric import MetricAccumulator
+    from test import get_test_loader
+
+    loader = get_test_loader(config)
+    if limit:
+        loader = DataLoader(Subset(loader.dataset, range(min(limit, len(loader.dataset)))),
+                            batch_size=loader.batch_size, shuffle=False, num_workers=loader.num_workers)
+    threshold = config.THRESHOLD if threshold is None else threshold
+    accumulator = MetricAccumulator()
+    model.eval()
+    with torch.no_grad():
+        for data, target, _ in loader:
+            accumulator.update(model(data.to(config.DEVICE)).cpu(), target, threshold=threshold)
+    metrics = accumulator.compute()
+    return {"IoU": metrics["IoU"], "Dice Coefficient": metrics["Dice Coefficient"],
+            "num_samples": accumulator.num_samples}
+
+
+def environment():
+    """Machine / library info stored with every result file."""
+    return {"python": platform.python_version(), "torch": torch.__version__, "platform": platform.platform(),
+            "processor": platform.processor(), "torch_num_threads": torch.get_num_threads(),
+            "cuda": torch.cuda.is_available()}
+
+
+def save_results(results, path):
+    """Writes {"environment": ..., "results": ...} as JSON and returns the path."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w") as f:
+        json.dump({"environment": environment(), "results": results}, f, indent=2)
+    print(f"Saved benchmark results to {path}")
+    return path
+
+
+def print_table(rows, columns):
+    """Prints rows (dicts) as a fixed-width table; floats get 2 decimals (tiny ones scientific)."""
+    def cell(value):
+        if isinstance(value, float):
+            return f"{value:.2f}" if value == 0 or abs(value) >= 0.01 else f"{value:.1e}"
+        return str(value)
+    widths = {c: max(len(c), *(len(cell(r.get(c, ""))) for r in rows)) for c in columns}
+    print("  ".join(c.rjust(widths[c]) for c in columns))
+    for row in rows:
+        print("  ".join(cell(row.get(c, "")).rjust(widths[c]) for c in columns))
+
+
+def load_baseline(path):
+    """
+    Rows of a results file written by save_results, or None if there is none.
+    Warns when it was recorded on a different machine / library setup.
+    """
+    if not os.path.isfile(path):
+        return None
+    with open(path) as f:
+        stored = json.load(f)
+    current = environment()
+    changed = [key for key, value in stored.get("environment", {}).items() if current.get(key) != value]
+    if changed:
+        print(f"Warning: Baseline {path} was recorded with different {', '.join(changed)}; comparisons may not be meaningful.")
+    return stored["results"]["rows"]
+
+
+def compare_to_baseline(rows, baseline_rows, keys, metrics, tolerance, min_delta=0.0):
+    """
+    Relative change of each `metrics` value (lower is better) against the baseline
+    row with the same `keys`. Adds "<metric>_change" to the rows.
+
+    Returns:
+        list: One message per metric that grew by more than `tolerance` (fraction)
+              and by more than `min_delta` (in the metric's own unit, so noise on
+              tiny values is not reported).
+    """
+    baseline = {tuple(row.get(key) for key in keys): row for row in baseline_rows}
+    regressions = []
+    for row in rows:
+        base = baseline.get(tuple(row.get(key) for key in keys))
+        if base is None:
+            continue
+        for metric in metrics:
+            if not base.get(metric) or row.get(metric) is None:
+                continue
+            change = row[metric] / base[metric] - 1
+            row[f"{metric}_change"] = change
+            if change > tolerance and row[metric] - base[metric] > min_delta:
+                label = " ".join(str(row[key]) for key in keys)
+                regressions.append(f"{label}: {metric} {row[metric]:.4g} vs baseline {base[metric]:.4g} "
+                                   f"(+{change:.0%}, tolerance {tolerance:.0%})")
+    return regressions
+
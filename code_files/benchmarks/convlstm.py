@@ -0,0 +1,88 @@
+# benchmarks/convlstm.py
+# ConvLSTM forward latency / memory across sequence lengths: the vectorized
+# ConvLSTMSeq.forward vs. the previous per-timestep loop, with a parity check.
+#
+#   python -m benchmarks.convlstm --seq-lens 1 2 3 5 8 --batch-size 2
+import argparse
+import os
+
+import torch
+
+from config import Config
+from model.convlstm import ConvLSTMSeq
+from benchmarks.common import PeakMemory, print_table, save_results, time_fn
+
+
+def per_step_forward(model, x):
+    """
+    The previous ConvLSTMSeq.forward: initial CNN and the full cat -> conv_gates ->
+    split -> four activations cell update, one timestep at a time. Reference for
+    parity and speed.
+    """
+    x = x if model.batch_first else x.permute(1, 0, 2, 3, 4)
+    batch_size, seq_len, _, height, width = x.size()
+    state = [(torch.zeros(batch_size, cell.hidden_dim, height, width, device=x.device),
+              torch.zeros(batch_size, cell.hidden_dim, height, width, device=x.device)) for cell in model.cell_list]
+    for t in range(seq_len):
+        step_input = model.initial_cnn(x[:, t])
+        for layer_idx, cell in enumerate(model.cell_list):
+            h, c = state[layer_idx]
+            gates = cell.conv_gates(torch.cat([step_input, h], dim=1))
+            cc_i, cc_f, cc_o, cc_g = torch.split(gates, cell.hidden_dim, dim=1)
+            c = torch.sigmoid(cc_f) * c + torch.sigmoid(cc_i) * torch.tanh(cc_g)
+            h = torch.sigmoid(cc_o) * torch.tanh(c)
+            state[layer_idx] = (h, c)
+            step_input = h
+    return model.output_conv(step_input)
+
+
+def build_model(config):
+    kernel_sizes = config.CONVLSTM_KERNEL_SIZES * len(config.CONVLSTM_HIDDEN_DIMS) \
+        if len(config.CONVLSTM_KERNEL_SIZES) == 1 else config.CONVLSTM_KERNEL_SIZES
+    return ConvLSTMSeq(in_channels=config.IN_CHANNELS, hidden_dims=config.CONVLSTM_HIDDEN_DIMS,
+                       kernel_sizes=kernel_sizes, num_classes=config.NUM_CLASSES,
+                       initial_cnn_out_channels=config.CONVLSTM_INITIAL_CNN_OUT_CHANNELS,
+                       batch_first=True)
+
+
+def main():
+    config = Config()
+    parser = argparse.ArgumentParser(description="Benchmark the vectorized ConvLSTM forward across sequence lengths.")
+    parser.add_argument("--seq-lens", type=int, nargs="+", default=[1, 2, 3, 5, 8])
+    parser.add_argument("--batch-size", type=int, default=1)
+    parser.add_argument("--image-size", type=int, nargs=2, default=list(config.IMAGE_SIZE), metavar=("W", "H"))
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--device", default=config.DEVICE)
+    parser.add_argument("--output", default=os.path.join(config.BENCHMARK_DIR, "convlstm_seq_len.json"))
+    args = parser.parse_args()
+
+    torch.manual_seed(0)
+    model = build_model(config).to(args.device).eval()
+    width, height = args.image_size
+    rows = []
+    with torch.no_grad():
+        for seq_len in args.seq_lens:
+            x = torch.rand(args.batch_size, seq_len, config.IN_CHANNELS, height, width, device=args.device)
+            max_abs_diff = float((model(x) - per_step_forward(model, x)).abs().max())
+            row = {"seq_len": seq_len, "max_abs_diff": max_abs_diff}
+            for name, fn in (("per_step", lambda v: per_step_forward(model, v)), ("vectorized", model)):
+                with PeakMemory(args.device) as mem:
+                    fn(x)
+                timing = time_fn(fn, x, repeats=args.repeats, warmup=1)
+                row[f"{name}_ms"] = timing["median_ms"]
+                row[f"{name}_p90_ms"] = timing["p90_ms"]
+                row[f"{name}_peak_mb"] = mem.peak_mb
+            row["speedup"] = row["per_step_ms"] / row["vectorized_ms"]
+            rows.append(row)
+            print(f"T={seq_len}: {row['per_step_ms']:.1f} -> {row['vectorized_ms']:.1f} ms "
+                  f"(x{row['speedup']:.2f}), max |diff| {max_abs_diff:.1e}")
+
+    print(f"\nConvLSTM {config.CONVLSTM_HIDDEN_DIMS}, batch {args.batch_size}, {width}x{height}, {args.device}")
+    print_table(rows, ["seq_len", "per_step_ms", "vectorized_ms", "speedup", "per_step_peak_mb",
+                       "vectorized_peak_mb", "max_abs_diff"])
+    save_results({"model": "ConvLSTM", "hidden_dims": config.CONVLSTM_HIDDEN_DIMS, "batch_size": args.batch_size,
+                  "image_size": [width, height], "device": args.device, "rows": rows}, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+# benchmarks/convlstm_variants.py
+# Full-resolution ConvLSTM vs. the reduced-resolution ConvLSTMLowRes variants:
+# parameters, inference / training peak memory, latency and (given checkpoints) test IoU.
+#
+#   python -m benchmarks.convlstm_variants --checkpoint ConvLSTM=checkpoints/A/best.pth.tar \
+#       --checkpoint ConvLSTMLowRes/4=checkpoints/B/best.pth.tar --test-limit 100
+import argparse
+import os
+
+import torch
+
+from config import Config
+from benchmarks.common import PeakMemory, count_parameters, print_table, save_results, test_set_scores, time_fn
+
+DEFAULT_VARIANTS = ["ConvLSTM", "ConvLSTMLowRes/4", "ConvLSTMLowRes/8"]
+
+
+def variant_config(config, variant):
+    """Config copy for a variant such as "ConvLSTMLowRes/8" (MODEL_NAME and CONVLSTM_DOWNSAMPLE set)."""
+    model_name, _, downsample = variant.partition("/")
+    variant_cfg = config.for_model(model_name)
+    if downsample:
+        variant_cfg.CONVLSTM_DOWNSAMPLE = int(downsample)
+    return variant_cfg
+
+
+def main():
+    config = Config()
+    parser = argparse.ArgumentParser(description="Compare ConvLSTM and reduced-resolution ConvLSTM variants.")
+    parser.add_argument("--variants", nargs="+", default=DEFAULT_VARIANTS)
+    parser.add_argument("--checkpoint", action="append", default=[], metavar="VARIANT=PATH",
+                        help="Trained weights for a variant; enables the IoU column for it.")
+    parser.add_argument("--test-limit", type=int, default=None, help="Score IoU on the first N test samples only.")
+    parser.add_argument("--batch-size", type=int, default=1)
+    parser.add_argument("--image-size", type=int, nargs=2, default=list(config.IMAGE_SIZE), metavar=("W", "H"))
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--device", default=config.DEVICE)
+    parser.add_argument("--output", default=os.path.join(config.BENCHMARK_DIR, "convlstm_variants.json"))
+    args = parser.parse_args()
+
+    from model.builders import get_model
+    from utils import load_checkpoint
+    checkpoints = dict(spec.split("=", 1) for spec in args.checkpoint)
+    width, height = args.image_size
+    config.DEVICE = args.device
+    rows = []
+    for variant in args.variants:
+        variant_cfg = variant_config(config, variant)
+        torch.manual_seed(0)
+        model = get_model(variant_cfg)
+        x = torch.rand(args.batch_size, variant_cfg.SEQUENCE_LENGTH, config.IN_CHANNELS, height, width, device=args.device)
+        row = {"variant": variant, "params_m": count_parameters(model) / 1e6}
+
+        model.train()
+        with PeakMemory(args.device) as mem:
+            model(x).mean().backward()
+        row["train_peak_mb"] = mem.peak_mb
+        model.zero_grad(set_to_none=True)
+
+        model.eval()
+        with torch.no_grad():
+            with PeakMemory(args.device) as mem:
+                model(x)
+            row["infer_peak_mb"] = mem.peak_mb
+            timing = time_fn(model, x, repeats=args.repeats, warmup=1)
+        row["latency_ms"] = timing["median_ms"]
+        row["p90_ms"] = timing["p90_ms"]
+
+        if variant in checkpoints:
+            checkpoint = load_checkpoint(checkpoints[variant], model, None, 0, args.device)
+            threshold = float(checkpoint.get("threshold", config.THRESHOLD)) if checkpoint else config.THRESHOLD
+            row.update(test_set_scores(model, variant_cfg, threshold=threshold, limit=args.test_limit))
+        rows.append(row)
+        print(f"{variant}: {row['latency_ms']:.1f} ms, inference peak {row['infer_peak_mb']:.0f} MB")
+
+    print(f"\nBatch {args.batch_size}, {width}x{height}, {args.device}")
+    print_table(rows, ["variant", "params_m", "latency_ms", "p90_ms", "infer_peak_mb", "train_peak_mb", "IoU", "Dice Coefficient"])
+    save_results({"batch_size": args.batch_size, "image_size": [width, height], "device": args.device,
+                  "test_limit": args.test_limit, "rows": rows}, args.output)
+
+
+if __name__ == "__main__":
+    main()
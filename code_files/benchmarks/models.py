@@ -0,0 +1,155 @@
+# benchmarks/models.py
+# Every registered model at the requested input / batch sizes: forward and
+# forward+backward latency percentiles, throughput, peak memory, parameters and
+# FLOPs. Results are JSON and can be checked against a stored baseline.
+#
+#   python -m benchmarks.models --image-sizes 1024x256 512x128 --batch-sizes 1 4 --save-baseline
+#   python -m benchmarks.models --image-sizes 1024x256 512x128 --batch-sizes 1 4 --check
+import argparse
+import os
+import sys
+
+import torch
+
+from config import Config
+from benchmarks.common import (PeakMemory, compare_to_baseline, count_flops, count_parameters, load_baseline,
+                               print_table, save_results, time_fn)
+
+REGRESSION_METRICS = ("fwd_p50_ms", "fwd_bwd_p50_ms", "infer_peak_mb", "train_peak_mb")
+ROW_KEYS = ("model", "image_size", "batch_size")
+
+
+def parse_size(text):
+    """Parses "1024x256" into (1024, 256), i.e. (W, H) like Config.IMAGE_SIZE."""
+    width, _, height = text.lower().partition("x")
+    return int(width), int(height)
+
+
+def model_config(config, model_name):
+    model_cfg = config.for_model(model_name)
+    model_cfg.PRETRAINED = False # no weight downloads; timings do not depend on the values
+    return model_cfg
+
+
+def example_batch(config, batch_size, width, height):
+    shape = (batch_size, config.IN_CHANNELS, height, width)
+    if config.SEQUENCE_LENGTH > 1:
+        shape = (batch_size, config.SEQUENCE_LENGTH) + shape[1:]
+    return torch.rand(*shape, device=config.DEVICE)
+
+
+def benchmark_model(model, x, repeats=5, warmup=1):
+    """
+    Forward (eval, no_grad) and forward+backward (train) timing and peak memory of one model on x.
+
+    Returns:
+        dict: gflops, fwd_* and fwd_bwd_* latency percentiles (ms), throughput (samples/s),
+              infer_peak_mb, train_peak_mb. A phase that fails (e.g. BatchNorm on a
+              single sample in train mode) is recorded as "<phase>_error".
+    """
+    batch_size = x.shape[0]
+    row = {}
+    model.eval()
+    with torch.no_grad():
+        row["gflops"] = count_flops(model, x) / 1e9
+        with PeakMemory(x.device) as mem:
+            model(x)
+        row["infer_peak_mb"] = mem.peak_mb
+        timing = time_fn(model, x, repeats=repeats, warmup=warmup)
+    row.update({f"fwd_{name.replace('median', 'p50')}": value for name, value in timing.items()})
+    row["throughput"] = batch_size * 1000.0 / timing["median_ms"]
+
+    def train_step():
+        model.zero_grad(set_to_none=True)
+        model(x).float().mean().backward()
+
+    model.train()
+    try:
+        with PeakMemory(x.device) as mem:
+            train_step()
+        row["train_peak_mb"] = mem.peak_mb
+        timing = time_fn(train_step, repeats=repeats, warmup=warmup)
+        row.update({f"fwd_bwd_{name.replace('median', 'p50')}": value for name, value in timing.items()})
+    except (RuntimeError, ValueError) as e:
+        row["fwd_bwd_error"] = str(e).splitlines()[0]
+        print(f"Warning: forward+backward failed: {row['fwd_bwd_error']}")
+    finally:
+        model.zero_grad(set_to_none=True)
+        model.eval()
+    return row
+
+
+def main():
+    config = Config()
+    parser = argparse.ArgumentParser(description="Latency / throughput / memory / FLOPs of every registered model.")
+    parser.add_argument("--models", nargs="+", default=None, help="Registered model names (default: all).")
+    parser.add_argument("--image-sizes", nargs="+", default=["x".join(map(str, config.IMAGE_SIZE))], metavar="WxH")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1])
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--warmup", type=int, default=1)
+    parser.add_argument("--device", default="cpu")
+    parser.add_argument("--threads", type=int, default=None, help="torch.set_num_threads (default: torch's choice).")
+    parser.add_argument("--baseline", default=os.path.join(config.BENCHMARK_DIR, "models_baseline.json"))
+    parser.add_argument("--save-baseline", action="store_true", help="Store this run as the baseline.")
+    parser.add_argument("--check", action="store_true", help="Exit with status 1 on a regression vs. the baseline.")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed relative latency / memory growth.")
+    parser.add_argument("--min-delta", type=float, default=10.0,
+                        help="Ignore growth below this many ms / MB (timer and RSS noise on small inputs).")
+    parser.add_argument("--output", default=os.path.join(config.BENCHMARK_DIR, "models.json"))
+    args = parser.parse_args()
+
+    from registry import MODELS
+    from model.builders import get_model
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    config.DEVICE = args.device
+    rows = []
+    for model_name in args.models or MODELS.names():
+        model_cfg = model_config(config, model_name)
+        torch.manual_seed(0)
+        model = get_model(model_cfg)
+        params_m = count_parameters(model) / 1e6
+        for image_size in args.image_sizes:
+            width, height = parse_size(image_size)
+            for batch_size in args.batch_sizes:
+                row = {"model": model_name, "image_size": f"{width}x{height}", "batch_size": batch_size,
+                       "params_m": params_m}
+                try:
+                    row.update(benchmark_model(model, example_batch(model_cfg, batch_size, width, height),
+                                               repeats=args.repeats, warmup=args.warmup))
+                except (RuntimeError, ValueError) as e:
+                    row["error"] = str(e).splitlines()[0]
+                    print(f"Warning: {model_name} at {width}x{height}, batch {batch_size} failed: {row['error']}")
+                rows.append(row)
+                if "fwd_p50_ms" in row:
+                    print(f"{model_name} {width}x{height} b{batch_size}: fwd {row['fwd_p50_ms']:.1f} ms, "
+                          f"fwd+bwd {row.get('fwd_bwd_p50_ms', float('nan')):.1f} ms")
+        del model
+
+    regressions = []
+    baseline_rows = None if args.save_baseline else load_baseline(args.baseline)
+    if baseline_rows is not None:
+        regressions = compare_to_baseline(rows, baseline_rows, ROW_KEYS, REGRESSION_METRICS, args.tolerance,
+                                          min_delta=args.min_delta)
+    elif args.check:
+        print(f"Warning: No baseline at {args.baseline}; run with --save-baseline first.")
+
+    print(f"\n{args.device}, {torch.get_num_threads()} threads, {args.repeats} repeats")
+    print_table(rows, ["model", "image_size", "batch_size", "params_m", "gflops", "fwd_p50_ms", "fwd_p90_ms",
+                       "fwd_p99_ms", "throughput", "fwd_bwd_p50_ms", "fwd_bwd_p90_ms", "infer_peak_mb", "train_peak_mb"])
+    if baseline_rows is not None:
+        print_table(rows, list(ROW_KEYS) + [f"{metric}_change" for metric in REGRESSION_METRICS])
+    save_results({"repeats": args.repeats, "device": args.device, "rows": rows},
+                 args.baseline if args.save_baseline else args.output)
+
+    if regressions:
+        print("\nRegressions:")
+        for regression in regressions:
+            print(f"  {regression}")
+        if args.check:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+# benchmarks/startup.py
+# Cold-start cost of the entry points: wall time of a fresh interpreter that
+# imports a script module (or builds one model through get_model), and which
+# heavy optional dependencies that pulled in. Compared against a stored
+# baseline so sweep start-up cannot silently regress.
+#
+#   python -m benchmarks.startup --save-baseline          # record benchmark_results/startup_baseline.json
+#   python -m benchmarks.startup --check                  # exit 1 on a regression vs. the baseline
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+from config import Config
+from benchmarks.common import compare_to_baseline, load_baseline, print_table, save_results
+
+CODE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_TARGETS = ["train", "test", "multi_eval", "predict",
+                   "build:SimpleUNetMini", "build:AttentionUNet", "build:HRNetBinary"]
+# Only the models / code paths that actually use these should load them
+HEAVY_MODULES = ["segmentation_models_pytorch", "timm", "sklearn", "matplotlib", "torch.utils.tensorboard"]
+
+_CHILD = """
+import json, sys, time
+started = time.perf_counter()
+target = {target!r}
+if target.startswith("build:"):
+    from model.builders import get_model
+    from config import Config
+    config = Config().for_model(target[len("build:"):])
+    config.DEVICE = "cpu"
+    get_model(config)
+else:
+    __import__(target)
+elapsed = time.perf_counter() - started
+print("STARTUP_RESULT " + json.dumps({{"import_s": elapsed,
+      "heavy_modules": [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+
+def measure(target, repeats=3):
+    """
+    Runs `target` in `repeats` fresh interpreters.
+
+    Returns:
+        dict: median total_s (interpreter start to exit), median import_s
+              (the import / build itself) and the heavy modules that were loaded.
+    """
+    totals, imports, heavy = [], [], []
+    code = _CHILD.format(target=target, heavy=HEAVY_MODULES)
+    for _ in range(repeats):
+        started = time.perf_counter()
+        proc = subprocess.run([sys.executable, "-c", code], cwd=CODE_DIR, capture_output=True, text=True)
+        totals.append(time.perf_counter() - started)
+        lines = [line for line in proc.stdout.splitlines() if line.startswith("STARTUP_RESULT ")]
+        if proc.returncode != 0 or not lines:
+            raise RuntimeError(f"Startup target '{target}' failed:\n{proc.stderr[-2000:]}")
+        result = json.loads(lines[-1][len("STARTUP_RESULT "):])
+        imports.append(result["import_s"])
+        heavy = result["heavy_modules"]
+    return {"target": target, "total_s": float(np.median(totals)), "import_s": float(np.median(imports)),
+            "heavy_modules": heavy}
+
+
+def new_heavy_modules(rows, baseline_rows):
+    """Targets that now load a heavy module their baseline run did not."""
+    baseline = {row["target"]: row for row in baseline_rows}
+    problems = []
+    for row in rows:
+        if row["target"] in baseline:
+            added = sorted(set(row["heavy_modules"]) - set(baseline[row["target"]]["heavy_modules"]))
+            if added:
+                problems.append(f"{row['target']}: now imports {', '.join(added)}")
+    return problems
+
+
+def main():
+    config = Config()
+    parser = argparse.ArgumentParser(description="Measure cold-start import / model-build time of the entry points.")
+    parser.add_argument("--targets", nargs="+", default=DEFAULT_TARGETS,
+                        help="Module names, or build:MODEL_NAME to also build that model via get_model.")
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--baseline", default=os.path.join(config.BENCHMARK_DIR, "startup_baseline.json"))
+    parser.add_argument("--save-baseline", action="store_true", help="Store this run as the baseline.")
+    parser.add_argument("--check", action="store_true", help="Exit with status 1 on a regression vs. the baseline.")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed relative import-time growth.")
+    parser.add_argument("--output", default=os.path.join(config.BENCHMARK_DIR, "startup.json"))
+    args = parser.parse_args()
+
+    rows = []
+    for target in args.targets:
+        rows.append(measure(target, repeats=args.repeats))
+        print(f"{target}: {rows[-1]['import_s']:.2f}s")
+
+    problems = []
+    baseline_rows = None if args.save_baseline else load_baseline(args.baseline)
+    if baseline_rows is not None:
+        problems = compare_to_baseline(rows, baseline_rows, ("target",), ("import_s",), args.tolerance)
+        problems += new_heavy_modules(rows, baseline_rows)
+    elif args.check:
+        print(f"Warning: No baseline at {args.baseline}; run with --save-baseline first.")
+
+    print_table([{**row, "heavy": ",".join(row["heavy_modules"]) or "-"} for row in rows],
+                ["target", "total_s", "import_s", "import_s_change", "heavy"])
+    save_results({"repeats": args.repeats, "rows": rows}, args.baseline if args.save_baseline else args.output)
+
+    if problems:
+        print("\nStartup regressions:")
+        for problem in problems:
+            print(f"  {problem}")
+        if args.check:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,16 @@
 # config.py
+import copy
 import os
 import torch
 
+SEQUENCE_MODELS = ("ConvLSTM", "ConvLSTMLowRes") # Models fed (B, T, C, H, W) windows
+
+
+def sequence_length_for(model_name):
+    """Frames per sample fed to model_name: 3-frame windows for the SEQUENCE_MODELS, single frames otherwise."""
+    return 3 if model_name in SEQUENCE_MODELS else 1
+
+
 class Config:
     # General
     IN_CHANNELS = 1
@@ -28,15 +37,21 @@ class Config:
     SCHEDULER_GAMMA = float(os.getenv("SCHEDULER_GAMMA", 0.5))# 0.1
 
     # Model
-    # Options: ResNet18CNN, AttentionUNet, DeepLabV3Plus, ConvLSTM , SimpleUNetMini
+    # Options: ResNet18CNN, AttentionUNet, DeepLabV3Plus, ConvLSTM, ConvLSTMLowRes, SimpleUNetMini
     MODEL_NAME = os.getenv("MODEL_NAME", "HRNetBinary")
-    SEQUENCE_LENGTH = 3 if MODEL_NAME == "ConvLSTM" else 1
+    SEQUENCE_MODELS = SEQUENCE_MODELS
+    SEQUENCE_LENGTH = sequence_length_for(MODEL_NAME)
     PRETRAINED = os.getenv("PRETRAINED", "False").lower() == "true"
     DEEPLAB_OUTPUT_STRIDE = int(os.getenv("DEEPLAB_OUTPUT_STRIDE", 16))
     CONVLSTM_HIDDEN_DIMS = [64, 64]
     CONVLSTM_KERNEL_SIZES = [(3, 3)]
     CONVLSTM_INITIAL_CNN_OUT_CHANNELS = 32
     CONVLSTM_BATCH_FIRST = True
+    CONVLSTM_DOWNSAMPLE = int(os.getenv("CONVLSTM_DOWNSAMPLE", 4)) # ConvLSTMLowRes: recurrent core at 1/4 or 1/8 resolution
+    # AttentionUNet family (defaults = the standard [64, 128, 256, 512, 1024] model)
+    ATTUNET_WIDTH_MULT = float(os.getenv("ATTUNET_WIDTH_MULT", 1.0)) # Scales the channels of every level
+    ATTUNET_DEPTH = int(os.getenv("ATTUNET_DEPTH", 4)) # Pooling levels; IMAGE_SIZE must be divisible by 2**depth
+    ATTUNET_SEPARABLE = os.getenv("ATTUNET_SEPARABLE", "False").lower() == "true" # Depthwise-separable ConvBlocks
 
     # Loss
     # Options: DiceFocalLoss, DiceLoss, AsymmetricFocalTverskyLoss, SoftIoULoss
@@ -60,8 +75,50 @@ class Config:
     # HOLDOUT_DATASETS = []
     # HOLDOUT_PULSES = []
 
+    # Decision threshold on sigmoid probabilities. test.py prefers the threshold
+    # stored in the checkpoint (picked on validation) when USE_CHECKPOINT_THRESHOLD.
+    THRESHOLD = float(os.getenv("THRESHOLD", 0.5))
+    USE_CHECKPOINT_THRESHOLD = os.getenv("USE_CHECKPOINT_THRESHOLD", "True").lower() == "true"
+    THRESHOLD_SWEEP_BINS = int(os.getenv("THRESHOLD_SWEEP_BINS", 256))
+    # Options: Dice Coefficient, IoU, Precision, Recall
+    THRESHOLD_CRITERION = os.getenv("THRESHOLD_CRITERION", "Dice Coefficient")
+    THRESHOLD_AVERAGE = os.getenv("THRESHOLD_AVERAGE", "micro") # micro or macro
+
+    # Physical scale and boundary metrics
+    PIXEL_AREA_MM2 = float(os.getenv("PIXEL_AREA_MM2", 0.0025))
+    BF_TOLERANCE_PX = float(os.getenv("BF_TOLERANCE_PX", 2.0))
+    BF_TOLERANCE_MM = float(os.environ["BF_TOLERANCE_MM"]) if "BF_TOLERANCE_MM" in os.environ else None # Overrides _PX
+
     APPLY_POSTPROCESSING = True
     MIN_COMPONENT_SIZE = 100
+    POSTPROCESS_NUM_WORKERS = int(os.getenv("POSTPROCESS_NUM_WORKERS", 4)) # Threads per batch for component filtering
+
+    TEST_BATCH_SIZE = int(os.getenv("TEST_BATCH_SIZE", 8))
+    # Persist test-set predictions keyed by checkpoint + test set, so test.py can re-run
+    # postprocessing / metrics / plots without the model. Options: off, probs (uint8), logits (float16)
+    PREDICTION_CACHE = os.getenv("PREDICTION_CACHE", "off")
+    PREDICTION_CACHE_DIR = os.getenv("PREDICTION_CACHE_DIR", "prediction_cache/")
+    # Label-derived features (area, bbox, boundary, distance transform, components) built once
+    # per label file and keyed by content hash (label_features.py); used by test metrics and reports
+    USE_LABEL_FEATURE_STORE = os.getenv("USE_LABEL_FEATURE_STORE", "True").lower() == "true"
+    LABEL_FEATURE_DIR = os.getenv("LABEL_FEATURE_DIR", "label_features/")
+
+    # Inference graph optimization after loading a checkpoint (optimize.py): BatchNorm folded
+    # into convs, Dropout stripped; kept only if logits stay within the tolerance of the original
+    OPTIMIZE_INFERENCE = os.getenv("OPTIMIZE_INFERENCE", "True").lower() == "true"
+    OPTIMIZE_INFERENCE_ATOL = float(os.getenv("OPTIMIZE_INFERENCE_ATOL", 1e-4)) # Max abs logit difference ...
+    OPTIMIZE_INFERENCE_RTOL = float(os.getenv("OPTIMIZE_INFERENCE_RTOL", 1e-5)) # ... plus this times the max abs logit
+
+    # Tiled inference at native resolution (tiling.py); frames are not resized to IMAGE_SIZE
+    TILED_INFERENCE = os.getenv("TILED_INFERENCE", "False").lower() == "true"
+    TILE_SIZE = IMAGE_SIZE # (W, H) of one tile, the resolution the model was trained at
+    TILE_OVERLAP = float(os.getenv("TILE_OVERLAP", 0.25))
+    TILE_BATCH_SIZE = int(os.getenv("TILE_BATCH_SIZE", 4)) # Tiles per forward pass; bounds peak memory
+
+    # Evaluation (metrics are computed on worker threads while the next batch runs)
+    EVAL_NUM_WORKERS = int(os.getenv("EVAL_NUM_WORKERS", 2)) # 0 = compute metrics inline
+    EVAL_MAX_PENDING = int(os.getenv("EVAL_MAX_PENDING", 4)) # Batches allowed to wait for metrics
+    VIS_NUM_WORKERS = int(os.getenv("VIS_NUM_WORKERS", 2)) # Background PNG writers for prediction panels
 
     USE_AUGMENTATION = True
 
@@ -71,10 +128,37 @@ class Config:
     FREEZE_BACKBONE = False
     FREEZE_UNTIL = 'encoder_layer2'
 
+    # Knowledge distillation (train.py): when a teacher checkpoint is set, MODEL_NAME is trained on
+    # (1 - DISTILL_ALPHA) * LOSS_FN + DISTILL_ALPHA * soft-target loss against the frozen teacher
+    DISTILL_TEACHER_CHECKPOINT = os.getenv("DISTILL_TEACHER_CHECKPOINT", "")
+    DISTILL_TEACHER_MODEL = os.getenv("DISTILL_TEACHER_MODEL", "AttentionUNet")
+    DISTILL_ALPHA = float(os.getenv("DISTILL_ALPHA", 0.5))
+    DISTILL_TEMPERATURE = float(os.getenv("DISTILL_TEMPERATURE", 2.0))
+    DISTILL_CACHE_DIR = os.getenv("DISTILL_CACHE_DIR", "distill_cache/") # Teacher logits per un-augmented train sample
+
     # Logging
     SAVE_MODEL = os.getenv("SAVE_MODEL", "True").lower() == "true"
     CHECKPOINT_DIR = "checkpoints/"
+    PREDICT_OUTPUT_DIR = "predictions/"
+    QUANT_CALIBRATION_BATCHES = int(os.getenv("QUANT_CALIBRATION_BATCHES", 16)) # Train batches seen by int8 observers
+    PRUNE_CRITERION = os.getenv("PRUNE_CRITERION", "bn") # Channel saliency for prune.py: "bn" (|BatchNorm gamma|) or "l1"
+    PRUNE_FINETUNE_EPOCHS = int(os.getenv("PRUNE_FINETUNE_EPOCHS", 2)) # Epochs of train_one_epoch after each pruning ratio
+
+    # Inference server (serve.py)
+    SERVE_HOST = os.getenv("SERVE_HOST", "127.0.0.1")
+    SERVE_PORT = int(os.getenv("SERVE_PORT", 8008))
+    SERVE_MAX_BATCH_SIZE = int(os.getenv("SERVE_MAX_BATCH_SIZE", 16)) # Frames coalesced into one forward pass
+    SERVE_MAX_WAIT_MS = float(os.getenv("SERVE_MAX_WAIT_MS", 10)) # Longest a frame waits for a batch to fill
     LOG_DIR = "logs/"
-    EXPERIMENT_NAME = os.getenv("EXPERIMENT_NAME", f"{MODEL_NAME}_{LOSS_FN}_Epochs{NUM_EPOCHS}_LR{LEARNING_RATE}")
+    BENCHMARK_DIR = "benchmark_results/" # JSON output of the benchmarks/ scripts
+    EXPERIMENT_NAME = os.getenv("EXPERIMENT_NAME", f"{MODEL_NAME}_{LOSS_FN}_Epochs{NUM_EPOCHS}_LR{LEARNING_RATE}"
+                                                  + (f"_KD{DISTILL_TEACHER_MODEL}" if DISTILL_TEACHER_CHECKPOINT else ""))
     VISUALIZE_EVERY = int(os.getenv("VISUALIZE_EVERY", 4))
-    CSV_LOG_FILE = "training_log.csv"
\ No newline at end of file
+    CSV_LOG_FILE = "training_log.csv"
+
+    def for_model(self, model_name):
+        """Copy of this config for another registered model, with the SEQUENCE_LENGTH that model is fed."""
+        config = copy.copy(self)
+        config.MODEL_NAME = model_name
+        config.SEQUENCE_LENGTH = sequence_length_for(model_name)
+        return config
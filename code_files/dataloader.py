@@ -159,6 +159,65 @@ class UltrasoundSegmentationDataset(Dataset):
             return images[0], label_transformed, filename
 
 
+def preprocess_frame(image, image_size=(1024, 256), in_channels=1):
+    """
+    Applies the evaluation transform to one PIL frame.
+    image_size=None keeps the native resolution (for tiled inference).
+
+    Returns:
+        (image tensor [C, H, W], native (W, H) of the frame)
+    """
+    image = image.convert('RGB')
+    native_size = image.size
+    if image_size is not None:
+        image = image.resize(image_size, Image.BILINEAR)
+    if in_channels == 1:
+        image = image.convert('L')
+    return transforms.ToTensor()(image), native_size
+
+
+class UnlabeledUltrasoundDataset(Dataset):
+    """
+    Dataset over ultrasound frames without labels, for inference on new acquisitions.
+
+    Frames are resized / converted exactly like the evaluation transform
+    (image_size=None keeps native resolution for tiled inference). For
+    sequence models, each sample is a window of consecutive frames (in sorted
+    filename order) and is attributed to the last frame, like
+    UltrasoundSegmentationDataset.
+
+    Returns:
+        (image tensor [C, H, W] or [T, C, H, W], filename, native (W, H) as a tensor)
+    """
+
+    def __init__(self, image_paths, image_size=(1024, 256), in_channels=1, sequence_length=1):
+        self.image_paths = sorted(image_paths, key=os.path.basename)
+        self.image_size = image_size
+        self.in_channels = in_channels
+        self.sequence_length = max(1, sequence_length)
+        self.samples = [
+            self.image_paths[i:i + self.sequence_length]
+            for i in range(len(self.image_paths) - self.sequence_length + 1)
+        ]
+
+    def _load(self, path):
+        return preprocess_frame(Image.open(path), self.image_size, self.in_channels)
+
+    def __len__(self):
+        return len(self.samples)
+
+    def __getitem__(self, idx):
+        paths = self.samples[idx]
+        images = [self._load(path) for path in paths]
+        native_size = torch.tensor(images[-1][1])
+        filename = os.path.basename(paths[-1])
+
+        if self.sequence_length > 1:
+            return torch.stack([image for image, _ in images], dim=0), filename, native_size
+        else:
+            return images[0][0], filename, native_size
+
+
 class JointTransform:
     """Applies transformations to both image and label."""
     def __init__(self, transforms):
@@ -0,0 +1,153 @@
+# distill.py
+# Knowledge distillation support for train.py: the frozen teacher, its logits
+# for each training batch and the teacher vs. student report. Without
+# augmentation a sample always looks the same, so its teacher logits are
+# computed once and cached on disk (float16, one file per sample, keyed by
+# teacher checkpoint hash + input settings + the sample's image files);
+# with augmentation they are computed in the same batch as the student's forward pass.
+import copy
+import hashlib
+import json
+import os
+
+import numpy as np
+import torch
+
+from prediction_cache import file_hash
+
+REPORT_METRICS = ["IoU", "Dice Coefficient", "Precision", "Recall", "BF Score"]
+
+
+def teacher_config(config):
+    """Copy of the config for DISTILL_TEACHER_MODEL; its weights come from the checkpoint."""
+    teacher_cfg = config.for_model(config.DISTILL_TEACHER_MODEL)
+    teacher_cfg.PRETRAINED = False
+    return teacher_cfg
+
+
+def load_teacher(config):
+    """
+    Frozen, eval-mode teacher from DISTILL_TEACHER_CHECKPOINT (with the inference optimization pass).
+
+    Returns:
+        (teacher model, teacher config)
+    """
+    from backends import load_model_for_inference
+
+    teacher_cfg = teacher_config(config)
+    if teacher_cfg.SEQUENCE_LENGTH != config.SEQUENCE_LENGTH:
+        raise ValueError(f"Teacher {teacher_cfg.MODEL_NAME} and student {config.MODEL_NAME} must take the same input "
+                         f"(sequence length {teacher_cfg.SEQUENCE_LENGTH} vs {config.SEQUENCE_LENGTH}).")
+    teacher, _ = load_model_for_inference(config.DISTILL_TEACHER_CHECKPOINT, teacher_cfg)
+    if teacher is None:
+        raise ValueError(f"Could not load teacher checkpoint {config.DISTILL_TEACHER_CHECKPOINT}")
+    for param in teacher.parameters():
+        param.requires_grad = False
+    return teacher, teacher_cfg
+
+
+def teacher_cache_dir(config):
+    """DISTILL_CACHE_DIR/<teacher checkpoint hash>_<hash of the training inputs' settings>."""
+    settings = {"teacher": config.DISTILL_TEACHER_MODEL, "image_dir": os.path.abspath(config.IMAGE_DIR),
+                "image_size": list(config.IMAGE_SIZE), "in_channels": config.IN_CHANNELS,
+                "sequence_length": config.SEQUENCE_LENGTH}
+    settings_hash = hashlib.sha256(json.dumps(settings, sort_keys=True).encode()).hexdigest()[:16]
+    return os.path.join(config.DISTILL_CACHE_DIR, f"{file_hash(config.DISTILL_TEACHER_CHECKPOINT)}_{settings_hash}")
+
+
+def sample_fingerprints(dataset):
+    """
+    {file name the loader returns for a sample: short hash of the names, sizes and mtimes
+    of its input frames}, so an edited or replaced image gets a new cache entry.
+    """
+    fingerprints = {}
+    for image_files, _ in dataset.samples:
+        digest = hashlib.sha256()
+        for name in image_files:
+            stat = os.stat(os.path.join(dataset.image_dir, name))
+            digest.update(f"{name}:{stat.st_size}:{stat.st_mtime_ns};".encode())
+        fingerprints[image_files[-1]] = digest.hexdigest()[:16]
+    return fingerprints
+
+
+class TeacherLogits:
+    """
+    Teacher logits for a training batch: teacher_logits(data, filenames) -> (B, 1, H, W).
+
+    With a cache_dir (and the training `dataset`, for the per-sample fingerprints),
+    batches whose samples are all cached are read from disk and the others are run
+    through the teacher and written; logits are rounded to float16 in both cases, so a
+    sample gives the same soft targets in every epoch. Only use the cache for
+    un-augmented data: the key is the sample's file name and image files, not the pixels
+    after the transforms.
+    """
+    def __init__(self, model, cache_dir=None, dataset=None):
+        self.model = model
+        self.cache_dir = cache_dir
+        self.hits = 0
+        self.misses = 0
+        self.fingerprints = {}
+        if cache_dir is not None:
+            if dataset is None:
+                raise ValueError("TeacherLogits needs the training dataset to key its cache")
+            self.fingerprints = sample_fingerprints(dataset)
+            os.makedirs(cache_dir, exist_ok=True)
+
+    def _forward(self, data):
+        with torch.no_grad():
+            return self.model(data).float()
+
+    def __call__(self, data, filenames):
+        if self.cache_dir is None:
+            return self._forward(data)
+        paths = [os.path.join(self.cache_dir, f"{name}_{self.fingerprints[name]}.npy") for name in filenames]
+        if all(os.path.isfile(path) for path in paths):
+            self.hits += len(paths)
+            return torch.from_numpy(np.stack([np.load(path) for path in paths])).to(data.device).float()
+
+        logits = self._forward(data).half()
+        for path, sample in zip(paths, logits.cpu().numpy()):
+            if not os.path.isfile(path):
+                tmp_path = path + ".tmp"
+                with open(tmp_path, "wb") as f: # np.save would append .npy to the name
+                    np.save(f, sample)
+                os.replace(tmp_path, path)
+        self.misses += len(paths)
+        return logits.float()
+
+
+def distillation_report(teacher, student, teacher_metrics, student_metrics, config, teacher_cfg, path):
+    """
+    Validation metrics, parameters and batch-1 latency of the teacher and the distilled
+    student side by side; both are timed after the inference optimization pass, as
+    deployed. Printed and written to `path` as JSON; returns the rows.
+    """
+    from backends import time_backend
+    from benchmarks.common import count_parameters, print_table
+    from export import example_input
+    from optimize import optimize_from_config
+
+    example = example_input(config).to(config.DEVICE)
+    student = optimize_from_config(copy.deepcopy(student).eval(), config) # the teacher already went through it
+    rows = []
+    for role, model_name, model, metrics in (("teacher", teacher_cfg.MODEL_NAME, teacher, teacher_metrics),
+                                             ("student", config.MODEL_NAME, student, student_metrics)):
+        with torch.no_grad():
+            latency = time_backend(model, example, repeats=10, warmup=1)["median_ms"]
+        rows.append({"role": role, "model": model_name, "params_m": count_parameters(model) / 1e6,
+                     "latency_ms": latency, **{key: float(metrics.get(key, float("nan"))) for key in REPORT_METRICS}})
+
+    print(f"\n--- Distillation: {config.MODEL_NAME} from {teacher_cfg.MODEL_NAME} (validation set) ---")
+    print_table(rows, ["role", "model", "params_m", "latency_ms"] + REPORT_METRICS)
+    report = {
+        "experiment_name": config.EXPERIMENT_NAME,
+        "teacher_checkpoint": os.path.abspath(config.DISTILL_TEACHER_CHECKPOINT),
+        "alpha": config.DISTILL_ALPHA,
+        "temperature": config.DISTILL_TEMPERATURE,
+        "augmentation": config.USE_AUGMENTATION,
+        "rows": rows,
+    }
+    with open(path, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Saved distillation report to {path}")
+    return rows
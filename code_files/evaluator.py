@@ -0,0 +1,76 @@
+# evaluator.py
+# Overlaps host-side metric computation with the next forward pass.
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+
+
+class PipelinedEvaluator:
+    """
+    Bounded worker pool for per-batch metric jobs.
+
+    The model thread submits a job for batch k and immediately moves on to the
+    forward pass for batch k+1 while a worker runs the scipy / sklearn metric code.
+    Results are handed back strictly in submission order. Once `max_pending`
+    jobs are in flight, `submit` blocks on the oldest one, so host memory held by
+    queued predictions stays bounded.
+
+    Args:
+        num_workers (int): Worker threads. 0 runs every job inline (no overlap).
+        max_pending (int): Maximum number of submitted but uncollected jobs.
+
+    Usage:
+        with PipelinedEvaluator(num_workers=2, max_pending=4) as evaluator:
+            for batch in loader:
+                preds = model(batch)
+                for result in evaluator.submit(score_fn, preds.cpu(), ...):
+                    consume(result)
+            for result in evaluator.drain():
+                consume(result)
+    """
+    def __init__(self, num_workers=2, max_pending=4):
+        self.num_workers = max(0, int(num_workers))
+        self.max_pending = max(1, int(max_pending))
+        self._executor = ThreadPoolExecutor(max_workers=self.num_workers) if self.num_workers > 0 else None
+        self._pending = deque()
+
+    def submit(self, fn, *args, **kwargs):
+        """Queues `fn(*args, **kwargs)` and returns the list of results now ready, in order."""
+        if self._executor is None:
+            future = Future()
+            try:
+                future.set_result(fn(*args, **kwargs))
+            except Exception as e:
+                future.set_exception(e)
+        else:
+            future = self._executor.submit(fn, *args, **kwargs)
+        self._pending.append(future)
+
+        ready = []
+        # Backpressure: wait on the oldest job while too many are in flight,
+        # then collect any further head-of-queue jobs that already finished.
+        while self._pending and (len(self._pending) > self.max_pending or self._pending[0].done()):
+            ready.append(self._pending.popleft().result())
+        return ready
+
+    def drain(self):
+        """Waits for every outstanding job and returns their results in order."""
+        results = []
+        while self._pending:
+            results.append(self._pending.popleft().result())
+        return results
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None:
+            for future in self._pending:
+                future.cancel()
+            self._pending.clear()
+        self.close()
+        return False
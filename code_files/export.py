@@ -0,0 +1,124 @@
+# export.py
+# Converts a checkpoint to ONNX and TorchScript (dynamic batch axis), checks
+# numerical parity against the eager model and writes a latency comparison report.
+import argparse
+import json
+import os
+import warnings
+
+import torch
+
+from config import Config
+from backends import (TorchBackend, TorchScriptBackend, OnnxRuntimeBackend,
+                      export_meta, export_paths, load_model_for_inference, time_backend)
+
+
+def example_input(config, batch_size=1):
+    """Random input with the shape the model sees at test time: (B, C, H, W) or (B, T, C, H, W)."""
+    width, height = config.IMAGE_SIZE
+    shape = (batch_size, config.IN_CHANNELS, height, width)
+    if config.SEQUENCE_LENGTH > 1:
+        shape = (batch_size, config.SEQUENCE_LENGTH) + shape[1:]
+    return torch.rand(shape)
+
+
+def export_onnx(model, example, path, opset=18):
+    """Exports with a dynamic batch axis on the input ("image") and output ("logits")."""
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        torch.onnx.export(
+            model, (example,), path,
+            input_names=["image"], output_names=["logits"],
+            dynamic_axes={"image": {0: "batch"}, "logits": {0: "batch"}},
+            opset_version=opset
+        )
+    print(f"Saved ONNX model to {path}")
+
+
+def export_torchscript(model, example, path):
+    """Traces the model. Shape-dependent Python branches are frozen at the example's H, W (batch stays free)."""
+    with torch.no_grad(), warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        traced = torch.jit.trace(model, example, check_trace=False)
+    torch.jit.save(traced, path)
+    print(f"Saved TorchScript model to {path}")
+
+
+def check_parity(reference, candidate, data, threshold, atol=1e-4):
+    """
+    Compares candidate(data) to reference(data).
+
+    Returns:
+        dict: max_abs_diff of logits, mask_agreement (fraction of equal pixels
+              after thresholding) and passed (max_abs_diff <= atol).
+    """
+    expected = reference(data).float()
+    actual = candidate(data).float()
+    max_abs_diff = float((expected - actual).abs().max())
+    logit_threshold = torch.logit(torch.tensor(threshold)).item()
+    mask_agreement = float(((expected > logit_threshold) == (actual > logit_threshold)).float().mean())
+    return {"max_abs_diff": max_abs_diff, "mask_agreement": mask_agreement, "passed": max_abs_diff <= atol}
+
+
+def main():
+    config = Config()
+    parser = argparse.ArgumentParser(description="Export a checkpoint to ONNX / TorchScript and compare backends.")
+    parser.add_argument("--checkpoint", default=os.path.join(config.CHECKPOINT_DIR, config.EXPERIMENT_NAME, "best.pth.tar"))
+    parser.add_argument("--formats", nargs="+", choices=["onnx", "torchscript"], default=["onnx", "torchscript"])
+    parser.add_argument("--opset", type=int, default=18)
+    parser.add_argument("--atol", type=float, default=1e-4, help="Max abs logit difference for the parity check.")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 4], help="Batch sizes for the latency report.")
+    parser.add_argument("--repeats", type=int, default=10)
+    args = parser.parse_args()
+
+    config.DEVICE = "cpu" # export and compare on the CPU
+    model, threshold = load_model_for_inference(args.checkpoint, config)
+    if model is None:
+        print(f"ERROR: Could not load checkpoint {args.checkpoint}. Cannot export.")
+        return
+    paths = export_paths(args.checkpoint)
+
+    # --- Export ---
+    example = example_input(config, batch_size=1)
+    backends = {"torch": TorchBackend(model)}
+    if "onnx" in args.formats:
+        export_onnx(model, example, paths["onnx"], opset=args.opset)
+        backends["onnx"] = OnnxRuntimeBackend(paths["onnx"])
+    if "torchscript" in args.formats:
+        export_torchscript(model, example, paths["torchscript"])
+        backends["torchscript"] = TorchScriptBackend(paths["torchscript"])
+
+    meta = export_meta(config, args.checkpoint, threshold, input_name="image", output_name="logits",
+                       dynamic_axes=["batch"], opset=args.opset)
+    with open(paths["meta"], "w") as f:
+        json.dump(meta, f, indent=2)
+
+    # --- Parity (batch of 2 also checks that the batch axis is really dynamic) ---
+    parity_input = example_input(config, batch_size=2)
+    parity = {}
+    for name, backend in backends.items():
+        if name == "torch":
+            continue
+        parity[name] = check_parity(backends["torch"], backend, parity_input, threshold, atol=args.atol)
+        status = "OK" if parity[name]["passed"] else "FAILED"
+        print(f"Parity {name} vs torch: max |diff| = {parity[name]['max_abs_diff']:.2e}, "
+              f"mask agreement = {parity[name]['mask_agreement']:.6f} [{status}]")
+
+    # --- Latency ---
+    latency = {name: {} for name in backends}
+    print(f"\n{'backend':<12} {'batch':>5} {'median ms':>10} {'p90 ms':>10} {'ms/frame':>10}")
+    for batch_size in args.batch_sizes:
+        data = example_input(config, batch_size=batch_size)
+        for name, backend in backends.items():
+            stats = time_backend(backend, data, repeats=args.repeats)
+            latency[name][batch_size] = stats
+            print(f"{name:<12} {batch_size:>5} {stats['median_ms']:>10.2f} {stats['p90_ms']:>10.2f} {stats['per_frame_ms']:>10.2f}")
+
+    report = {"meta": meta, "parity": parity, "latency": latency, "torch_num_threads": torch.get_num_threads()}
+    with open(paths["report"], "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nSaved export report to {paths['report']}")
+
+
+if __name__ == "__main__":
+    main()
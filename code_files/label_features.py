@@ -0,0 +1,125 @@
+# label_features.py
+# Ground-truth feature store: label-derived quantities computed once per label
+# file and reused by every evaluation and report, keyed by file content hash.
+import hashlib
+import os
+
+import cv2
+import numpy as np
+
+from config import Config
+from metric import boundary_distance, boundary_maps
+
+FEATURE_VERSION = 1 # bump when mask_features changes, so stale entries are rebuilt
+SCALAR_KEYS = ("area", "bbox", "num_components")
+
+
+def read_label_mask(data):
+    """Encoded label image bytes -> (H, W) uint8 {0, 1}, binarized like the test loader (> 127)."""
+    mask = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_GRAYSCALE)
+    if mask is None:
+        raise ValueError("could not decode label image")
+    return (mask > 127).astype(np.uint8)
+
+
+def mask_features(mask):
+    """
+    Features of one (H, W) binary mask.
+
+    Returns:
+        dict: "area" (pixels), "bbox" [x, y, w, h] of the foreground ([-1] * 4 if empty),
+              "num_components" (8-connected), "boundary" (H, W) bool (as metric.boundary_maps)
+              and "distance" (H, W) float32 distance to the nearest boundary pixel.
+    """
+    boundary = boundary_maps(mask[None])[0]
+    num_labels, _ = cv2.connectedComponents(mask, connectivity=8)
+    points = cv2.findNonZero(mask)
+    return {
+        "area": int(mask.sum()),
+        "bbox": np.array(cv2.boundingRect(points) if points is not None else (-1, -1, -1, -1), dtype=np.int32),
+        "num_components": num_labels - 1,
+        "boundary": boundary,
+        "distance": boundary_distance(boundary),
+    }
+
+
+def sample_label_files(dataset):
+    """Label file of each sample's target, in dataset order, or None if the dataset does not expose it."""
+    samples = getattr(dataset, "samples", None)
+    if samples is None:
+        return None
+    return [label_files[0] for _, label_files in samples]
+
+
+class LabelFeatureStore:
+    """
+    On-disk features of the label files in `label_dir`.
+
+    Each label file is hashed on first use; its features live in
+    <store_dir>/<content hash>.npz and are computed only if that file does not
+    exist yet, so renamed or copied labels reuse the entry and edited labels get
+    a new one. Arrays are read lazily from the npz, so scalar lookups (areas for
+    reports) never decompress the boundary or distance maps.
+    """
+    def __init__(self, label_dir, store_dir=None):
+        self.label_dir = label_dir
+        self.store_dir = store_dir or Config.LABEL_FEATURE_DIR
+        os.makedirs(self.store_dir, exist_ok=True)
+        self._keys = {}
+        self._scalars = {}
+        self.num_built = 0
+
+    def key(self, label_file):
+        """Content hash of the label file (memoized per store)."""
+        if label_file not in self._keys:
+            with open(os.path.join(self.label_dir, label_file), "rb") as f:
+                data = f.read()
+            digest = hashlib.sha256(data).hexdigest()[:16]
+            self._keys[label_file] = digest
+            self._build(digest, data)
+        return self._keys[label_file]
+
+    def _path(self, key):
+        return os.path.join(self.store_dir, f"{key}_v{FEATURE_VERSION}.npz")
+
+    def _build(self, key, data):
+        path = self._path(key)
+        if os.path.isfile(path):
+            return
+        features = mask_features(read_label_mask(data))
+        features["boundary"] = np.packbits(features["boundary"], axis=-1)
+        features["shape"] = np.array(features["distance"].shape, dtype=np.int32)
+        tmp_path = path[:-len(".npz")] + f".tmp{os.getpid()}.npz"
+        np.savez_compressed(tmp_path, **features)
+        os.replace(tmp_path, path) # concurrent evaluations never see a partial file
+        self.num_built += 1
+
+    def scalars(self, label_file):
+        """{"area", "bbox", "num_components"} of one label file."""
+        key = self.key(label_file)
+        if key not in self._scalars:
+            with np.load(self._path(key)) as stored:
+                self._scalars[key] = {"area": int(stored["area"]), "bbox": stored["bbox"].tolist(),
+                                      "num_components": int(stored["num_components"])}
+        return self._scalars[key]
+
+    def maps(self, label_file):
+        """(boundary (H, W) bool, distance (H, W) float32) of one label file."""
+        with np.load(self._path(self.key(label_file))) as stored:
+            height, width = stored["shape"]
+            boundary = np.unpackbits(stored["boundary"], axis=-1, count=int(width)).astype(bool)
+            return boundary, stored["distance"]
+
+    def batch_maps(self, label_files, shape):
+        """
+        Stacked (B, H, W) boundary and distance maps, or (None, None) if a label's
+        native size differs from `shape` (targets were resized by the loader).
+        """
+        boundaries, distances = [], []
+        for label_file in label_files:
+            boundary, distance = self.maps(label_file)
+            if boundary.shape != tuple(shape):
+                return None, None
+            boundaries.append(boundary)
+            distances.append(distance)
+        return np.stack(boundaries), np.stack(distances)
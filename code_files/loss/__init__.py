@@ -1,7 +1,15 @@
 # loss/__init__.py
-from .dice_focal import DiceFocalLoss
-from .dice import DiceLoss
-from .asymmetric_tversky import AsymmetricFocalTverskyLoss
-from .soft_iou  import SoftIoULoss
+# Loss classes are imported on first access, like the model package. The names
+# and modules come from the LOSSES registry (loss/builders.py).
 
-# Import other losses here
\ No newline at end of file
+
+def __getattr__(name):
+    if name.startswith("__") and name != "__all__": # module dunders (__wrapped__, ...) are not registry names
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    from registry import LOSSES
+
+    if name == "__all__":
+        return LOSSES.names()
+    if name in LOSSES:
+        return LOSSES.resolve(name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
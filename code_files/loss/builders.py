@@ -0,0 +1,43 @@
+# loss/builders.py
+# Builders of the LOSSES registry: each receives the (lazily imported) loss class
+# and the config. registry.py imports this module the first time LOSSES is used.
+from registry import LOSSES
+
+
+@LOSSES.register("DiceFocalLoss", "loss.dice_focal:DiceFocalLoss")
+def build_dice_focal(cls, config):
+    dice_w = getattr(config, 'LOSS_DICE_WEIGHT', 0.5)
+    focal_w = getattr(config, 'LOSS_FOCAL_WEIGHT', 0.5)
+    gamma = getattr(config, 'LOSS_GAMMA', 2.0) # Gamma specific to focal part
+    smooth = getattr(config, 'LOSS_SMOOTH', 1e-5)
+    print(f"DiceFocalLoss Params - DiceW: {dice_w}, FocalW: {focal_w}, Gamma: {gamma}, Smooth: {smooth}")
+    return cls(dice_weight=dice_w, focal_weight=focal_w, gamma=gamma, smooth=smooth)
+
+@LOSSES.register("DiceLoss", "loss.dice:DiceLoss")
+def build_dice(cls, config):
+    smooth = getattr(config, 'LOSS_SMOOTH', 1e-5)
+    print(f"DiceLoss Params - Smooth: {smooth}")
+    return cls(smooth=smooth)
+
+@LOSSES.register("AsymmetricFocalTverskyLoss", "loss.asymmetric_tversky:AsymmetricFocalTverskyLoss")
+def build_asymmetric_focal_tversky(cls, config):
+    alpha = getattr(config, 'LOSS_ALPHA', 0.3)
+    beta = getattr(config, 'LOSS_BETA', 0.7)
+    gamma_tversky = getattr(config, 'LOSS_GAMMA', 0.75) # Gamma specific to Tversky focal
+    smooth = getattr(config, 'LOSS_SMOOTH', 1e-5)
+    print(f"AsymmetricFocalTverskyLoss Params - Alpha: {alpha}, Beta: {beta}, Gamma: {gamma_tversky}, Smooth: {smooth}")
+    return cls(alpha=alpha, beta=beta, gamma=gamma_tversky, smooth=smooth)
+
+@LOSSES.register("SoftIoULoss", "loss.soft_iou:SoftIoULoss")
+def build_soft_iou(cls, config):
+    smooth = getattr(config, 'LOSS_SMOOTH', 1e-5) # Use the common smooth parameter
+    print(f"SoftIoULoss Params - Smooth: {smooth}")
+    return cls(smooth=smooth)
+
+
+def get_loss_fn(config):
+    """Initializes the loss function based on the configuration (see the builders above)."""
+    print(f"--- Initializing Loss Function: {config.LOSS_FN} ---")
+    criterion = LOSSES.build(config.LOSS_FN, config)
+    print("--- Loss Function Initialized ---")
+    return criterion
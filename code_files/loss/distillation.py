@@ -0,0 +1,37 @@
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+
+class DistillationLoss(nn.Module):
+    """
+    Knowledge distillation: the task loss plus a soft-target loss against a teacher's logits.
+
+    The soft-target term is the per-pixel binary cross-entropy between the student's and
+    the teacher's sigmoid probabilities, both softened by `temperature` and scaled by
+    temperature**2 so its gradients stay on the scale of the task loss (Hinton et al.).
+    Called without teacher logits (validation), it returns the task loss alone.
+    """
+    def __init__(self, task_loss, alpha=0.5, temperature=2.0):
+        super().__init__()
+        if not 0 <= alpha <= 1:
+            raise ValueError(f"Distillation alpha must be in [0, 1], got {alpha}")
+        self.task_loss = task_loss
+        self.alpha = alpha
+        self.temperature = temperature
+
+    def forward(self, inputs, targets, teacher_logits=None):
+        """
+        Args:
+            inputs (torch.Tensor): Student logits (B, 1, H, W).
+            targets (torch.Tensor): Ground truth labels (0 or 1).
+            teacher_logits (torch.Tensor, optional): Teacher logits with the shape of inputs.
+
+        Returns:
+            torch.Tensor: (1 - alpha) * task loss + alpha * soft-target loss.
+        """
+        task_loss = self.task_loss(inputs, targets)
+        if teacher_logits is None:
+            return task_loss
+        soft_targets = torch.sigmoid(teacher_logits.float() / self.temperature)
+        soft_loss = F.binary_cross_entropy_with_logits(inputs.float() / self.temperature, soft_targets)
+        return (1 - self.alpha) * task_loss + self.alpha * soft_loss * self.temperature ** 2
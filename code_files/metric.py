@@ -1,9 +1,9 @@
 # metric.py
 import torch
 import numpy as np
-from sklearn.metrics import roc_auc_score
 from scipy.spatial.distance import directed_hausdorff, cdist
 from scipy.ndimage import binary_erosion
+import cv2
 import warnings
 from config import Config
 
@@ -25,28 +25,207 @@ def get_boundary_coords(mask):
     coords = np.argwhere(boundary_mask)
     return coords
 
-# --- Main Metric Calculation Function ---
-def calculate_all_metrics(predictions, targets, threshold=0.5):
+EPSILON = 1e-7
+
+# --- Batched Boundary Maps ---
+_CROSS_KERNEL = cv2.getStructuringElement(cv2.MORPH_CROSS, (3, 3))
+
+def _disk_kernel(radius):
+    r = int(np.ceil(radius))
+    yy, xx = np.mgrid[-r:r + 1, -r:r + 1]
+    return ((xx ** 2 + yy ** 2) <= radius ** 2).astype(np.uint8)
+
+def _stacked_morphology(masks, op, kernel):
+    """
+    Applies a cv2 morphology op to a (B, H, W) mask stack in a single call.
+
+    Samples are stacked vertically with zero separator rows at least as tall as
+    the kernel radius, so nothing bleeds between neighbours and every image
+    border behaves like scipy's `border_value=0`.
+    """
+    batch_size, height, width = masks.shape
+    pad = kernel.shape[0] // 2
+    stacked = np.pad(masks.astype(np.uint8), ((0, 0), (pad, pad), (0, 0)))
+    out = op(stacked.reshape(batch_size * (height + 2 * pad), width), kernel,
+             borderType=cv2.BORDER_CONSTANT, borderValue=0)
+    return out.reshape(batch_size, height + 2 * pad, width)[:, pad:pad + height].astype(bool)
+
+def boundary_maps(masks):
+    """(B, H, W) binary masks -> (B, H, W) inner boundaries (same as get_boundary_coords)."""
+    masks = masks.astype(bool)
+    return masks & ~_stacked_morphology(masks, cv2.erode, _CROSS_KERNEL)
+
+def boundary_distance(boundary):
+    """(H, W) boundary map -> float32 Euclidean distance of every pixel to the nearest boundary pixel."""
+    return cv2.distanceTransform((~boundary.astype(bool)).astype(np.uint8), cv2.DIST_L2, cv2.DIST_MASK_PRECISE)
+
+def bf_tolerance_px(config=Config):
+    """BF matching tolerance in pixels; BF_TOLERANCE_MM (if set) overrides BF_TOLERANCE_PX."""
+    tolerance_mm = getattr(config, "BF_TOLERANCE_MM", None)
+    if tolerance_mm is not None:
+        pixel_spacing_mm = np.sqrt(getattr(config, "PIXEL_AREA_MM2", 0.0025))
+        return float(tolerance_mm) / pixel_spacing_mm
+    return float(getattr(config, "BF_TOLERANCE_PX", 2.0))
+
+def boundary_f1_scores(pred_boundary, target_boundary, tolerance_px):
+    """
+    Tolerance-based boundary F1 (BF score) for a batch of boundary maps.
+
+    A predicted boundary pixel is a hit if a ground-truth boundary pixel lies
+    within `tolerance_px` (Euclidean), and vice versa for recall. Matching uses
+    one disk dilation of each boundary stack, so the whole batch costs a few
+    full-image passes.
+
+    Returns:
+        np.ndarray: (B,) BF scores. 1.0 when both boundaries are empty, 0.0 when only one is.
+    """
+    kernel = _disk_kernel(tolerance_px)
+    pred_dilated = _stacked_morphology(pred_boundary, cv2.dilate, kernel)
+    target_dilated = _stacked_morphology(target_boundary, cv2.dilate, kernel)
+
+    batch_size = pred_boundary.shape[0]
+    pred_count = pred_boundary.reshape(batch_size, -1).sum(axis=1)
+    target_count = target_boundary.reshape(batch_size, -1).sum(axis=1)
+    pred_hits = (pred_boundary & target_dilated).reshape(batch_size, -1).sum(axis=1)
+    target_hits = (target_boundary & pred_dilated).reshape(batch_size, -1).sum(axis=1)
+
+    precision = pred_hits / np.maximum(pred_count, 1)
+    recall = target_hits / np.maximum(target_count, 1)
+    bf = (2 * precision * recall) / (precision + recall + EPSILON)
+
+    bf[(pred_count == 0) & (target_count == 0)] = 1.0
+    bf[(pred_count == 0) ^ (target_count == 0)] = 0.0
+    return bf
+
+# --- Per-Sample Statistics ---
+
+# Order of the keys returned by `calculate_all_metrics` (and written to the CSVs)
+METRIC_KEYS = [
+    "Accuracy", "Dice Coefficient", "IoU", "Weighted IoU", "Boundary F1 Score",
+    "AUROC", "AuC", "BF Score", "Mean Hausdorff", "Max Hausdorff",
+    "False Positive Rate", "False Negative Rate",
+    "Accuracy (Paper)", "IoU (Paper)", "BF Score (Paper)",
+    "Precision", "Recall", "Specificity"
+]
+# Pooled over all pixels of all samples; reported next to the per-sample means as "<key> (micro)"
+MICRO_METRIC_KEYS = ["Accuracy", "Dice Coefficient", "IoU", "Precision", "Recall"]
+
+def _confusion_counts(preds_binary_np, targets_np):
+    """Returns per-sample [TP, TN, FP, FN] counts with shape (B, 4)."""
+    batch_size = preds_binary_np.shape[0]
+    preds_flat = preds_binary_np.reshape(batch_size, -1).astype(bool)
+    targets_flat = targets_np.reshape(batch_size, -1).astype(bool)
+
+    TP = np.count_nonzero(preds_flat & targets_flat, axis=1)
+    FP = np.count_nonzero(preds_flat & ~targets_flat, axis=1)
+    FN = np.count_nonzero(~preds_flat & targets_flat, axis=1)
+    TN = preds_flat.shape[1] - TP - FP - FN
+
+    return np.stack([TP, TN, FP, FN], axis=1).astype(np.int64)
+
+def _auroc(target_flat, prob_flat):
+    from sklearn.metrics import roc_auc_score # imported on first use; sklearn dominates `import metric`
+    try:
+        if len(np.unique(target_flat)) > 1:
+            return roc_auc_score(target_flat, prob_flat)
+        return 0.5
+    except ValueError as e:
+        warnings.warn(f"AUROC calculation failed: {e}. Setting AUROC to 0.5.")
+        return 0.5
+
+def _hausdorff(pred_boundary, target_boundary, index=0, target_distance=None):
+    """
+    Returns (mean, max) symmetric boundary distance for one sample, NaN if undefined.
+
+    With `target_distance` (boundary_distance of the target, e.g. from the label
+    feature store) both directions are read off distance transforms instead of
+    pairwise distances; results agree to float32 precision.
+    """
+    if target_distance is not None:
+        if not pred_boundary.any() or not target_boundary.any():
+            return np.nan, np.nan
+        pred_to_target = target_distance[pred_boundary].astype(np.float64)
+        target_to_pred = boundary_distance(pred_boundary)[target_boundary].astype(np.float64)
+        return ((pred_to_target.mean() + target_to_pred.mean()) / 2.0,
+                max(pred_to_target.max(), target_to_pred.max()))
+
+    pred_coords = np.argwhere(pred_boundary)
+    target_coords = np.argwhere(target_boundary)
+
+    if pred_coords.shape[0] == 0 or target_coords.shape[0] == 0:
+        return np.nan, np.nan
+
+    try:
+        h_pred_to_target, _, _ = directed_hausdorff(pred_coords, target_coords)
+        h_target_to_pred, _, _ = directed_hausdorff(target_coords, pred_coords)
+        max_hd = max(h_pred_to_target, h_target_to_pred)
+
+        mean_dist_pred = cdist(pred_coords, target_coords).min(axis=1).mean()
+        mean_dist_target = cdist(target_coords, pred_coords).min(axis=1).mean()
+        mean_hd = (mean_dist_pred + mean_dist_target) / 2.0
+    except Exception as e:
+        warnings.warn(f"Hausdorff calculation failed for sample {index}: {e}")
+        return np.nan, np.nan
+
+    return mean_hd, max_hd
+
+def compute_sample_stats(predictions, targets, threshold=0.5, bf_tolerance=None, target_boundary=None,
+                         target_distance=None):
+    """
+    Computes the per-sample statistics every reported metric is derived from.
+
+    Args:
+        predictions (torch.Tensor): Raw logits. Shape (B, 1, H, W).
+        targets (torch.Tensor): Ground truth labels (0 or 1). Shape (B, 1, H, W).
+        threshold (float): Probability threshold for the binary prediction.
+        bf_tolerance (float): BF score tolerance in pixels. Defaults to `bf_tolerance_px()`.
+        target_boundary (np.ndarray, optional): `boundary_maps` of the targets (B, H, W), when
+            several predictions are scored against the same ground truth.
+        target_distance (np.ndarray, optional): `boundary_distance` of each target (B, H, W);
+            Hausdorff distances are then computed from distance transforms.
+
+    Returns:
+        dict: "counts" (B, 4) int64 [TP, TN, FP, FN], and float arrays of shape (B,)
+              for "auroc", "bf_score", "mean_hausdorff" and "max_hausdorff"
+              (NaN where undefined).
+    """
     if predictions.ndim != 4 or targets.ndim != 4:
         raise ValueError("Inputs must be 4D tensors (B, C, H, W)")
     if predictions.shape[1] != 1 or targets.shape[1] != 1:
         raise ValueError("Inputs must be single-channel (B, 1, H, W)")
 
-    preds_prob = torch.sigmoid(predictions)
-    preds_prob_np = preds_prob.detach().cpu().numpy()
+    preds_prob_np = torch.sigmoid(predictions).detach().cpu().numpy()
     targets_np = targets.detach().cpu().numpy().astype(np.uint8)
-
     preds_binary_np = (preds_prob_np > threshold).astype(np.uint8)
 
-    targets_flat = targets_np.flatten()
-    preds_binary_flat = preds_binary_np.flatten()
+    # Boundaries are extracted once for the whole batch and shared by BF and Hausdorff
+    pred_boundary = boundary_maps(preds_binary_np[:, 0])
+    if target_boundary is None:
+        target_boundary = boundary_maps(targets_np[:, 0])
+    if bf_tolerance is None:
+        bf_tolerance = bf_tolerance_px()
 
-    TP = np.sum((preds_binary_flat == 1) & (targets_flat == 1))
-    TN = np.sum((preds_binary_flat == 0) & (targets_flat == 0))
-    FP = np.sum((preds_binary_flat == 1) & (targets_flat == 0))
-    FN = np.sum((preds_binary_flat == 0) & (targets_flat == 1))
+    batch_size = preds_binary_np.shape[0]
+    auroc = np.empty(batch_size, dtype=np.float64)
+    mean_hd = np.empty(batch_size, dtype=np.float64)
+    max_hd = np.empty(batch_size, dtype=np.float64)
 
-    epsilon = 1e-7
+    for i in range(batch_size):
+        auroc[i] = _auroc(targets_np[i].ravel(), preds_prob_np[i].ravel())
+        mean_hd[i], max_hd[i] = _hausdorff(pred_boundary[i], target_boundary[i], index=i,
+                                           target_distance=None if target_distance is None else target_distance[i])
+
+    return {
+        "counts": _confusion_counts(preds_binary_np, targets_np),
+        "auroc": auroc,
+        "bf_score": boundary_f1_scores(pred_boundary, target_boundary, bf_tolerance),
+        "mean_hausdorff": mean_hd,
+        "max_hausdorff": max_hd,
+    }
+
+def metrics_from_counts(TP, TN, FP, FN):
+    """Confusion-matrix metrics. Works on scalars or on per-sample arrays."""
+    epsilon = EPSILON
 
     accuracy = (TP + TN) / (TP + TN + FP + FN + epsilon)
     precision = TP / (TP + FP + epsilon)
@@ -57,90 +236,388 @@ def calculate_all_metrics(predictions, targets, threshold=0.5):
     false_positive_rate = FP / (FP + TN + epsilon)
     false_negative_rate = FN / (FN + TP + epsilon)
 
-    boundary_f1_score = (2 * precision * recall) / (precision + recall + epsilon)
-
     auc_term1 = TP / (2 * (TP + FN) + epsilon)
     auc_term2 = TN / (2 * (FP + TN) + epsilon)
     auc_specific = auc_term1 + auc_term2
 
-    try:
-        targets_roc_flat = targets_np.flatten()
-        preds_prob_roc_flat = preds_prob_np.flatten()
-        if len(np.unique(targets_roc_flat)) > 1:
-            auroc = roc_auc_score(targets_roc_flat, preds_prob_roc_flat)
-        else:
-            auroc = 0.5
-    except ValueError as e:
-        warnings.warn(f"AUROC calculation failed: {e}. Setting AUROC to 0.5.")
-        auroc = 0.5
-
     # --- Weighted IoU ---
     weighted_iou_weight = getattr(Config, "WEIGHTED_IOU_WEIGHT", 2.0)
     weighted_iou = (weighted_iou_weight * TP) / (weighted_iou_weight * TP + FP + FN + epsilon)
 
-    # --- Hausdorff Distances ---
-    batch_size = preds_binary_np.shape[0]
-    hausdorff_means = []
-    hausdorff_maxs = []
+    return {
+        "Accuracy": accuracy,
+        "Dice Coefficient": dice_coefficient,
+        "IoU": iou,
+        "Weighted IoU": weighted_iou,
+        "AuC": auc_specific,
+        "False Positive Rate": false_positive_rate,
+        "False Negative Rate": false_negative_rate,
+        # Paper metrics
+        "Accuracy (Paper)": recall,
+        "IoU (Paper)": iou,
+        "Precision": precision,
+        "Recall": recall,
+        "Specificity": specificity
+    }
 
-    for i in range(batch_size):
-        pred_slice = preds_binary_np[i, 0]
-        target_slice = targets_np[i, 0]
 
-        pred_coords = get_boundary_coords(pred_slice)
-        target_coords = get_boundary_coords(target_slice)
+# --- Epoch-Level Accumulation ---
+class MetricAccumulator:
+    """
+    Streams exact epoch-level metrics in O(1) memory.
 
-        current_mean_hd = np.nan
-        current_max_hd = np.nan
+    Every metric under its usual name is the mean of the per-sample values (as with
+    batch_size=1), so it does not depend on how samples were batched. The global
+    TP/TN/FP/FN counts are kept too, and the pooled (micro) Accuracy, Dice, IoU,
+    Precision and Recall are added as "<key> (micro)". Accumulators built in separate
+    workers or processes can be combined with `merge`, or shipped around as plain
+    dicts via `state_dict`.
+    """
+    def __init__(self):
+        self.reset()
 
-        if pred_coords is not None and target_coords is not None and pred_coords.shape[0] > 0 and target_coords.shape[0] > 0:
-            try:
-                h_pred_to_target, _, _ = directed_hausdorff(pred_coords, target_coords)
-                h_target_to_pred, _, _ = directed_hausdorff(target_coords, pred_coords)
+    def reset(self):
+        self.confusion = np.zeros(4, dtype=np.int64) # TP, TN, FP, FN
+        self.num_samples = 0
+        self.count_metric_sums = {} # per-sample confusion-matrix metrics, summed
+        self.auroc_sum = 0.0
+        self.bf_sum = 0.0
+        self.hausdorff_count = 0
+        self.mean_hausdorff_sum = 0.0
+        self.max_hausdorff_sum = 0.0
 
-                current_max_hd = max(h_pred_to_target, h_target_to_pred)
+    def update(self, predictions, targets, threshold=0.5):
+        """Adds a batch of logits/targets. Returns the per-sample stats for reuse."""
+        stats = compute_sample_stats(predictions, targets, threshold=threshold)
+        self.update_from_stats(stats)
+        return stats
 
-                dist_pred_to_target = cdist(pred_coords, target_coords).min(axis=1)
-                mean_dist_pred = dist_pred_to_target.mean()
-                dist_target_to_pred = cdist(target_coords, pred_coords).min(axis=1)
-                mean_dist_target = dist_target_to_pred.mean()
-                current_mean_hd = (mean_dist_pred + mean_dist_target) / 2.0
+    def update_from_stats(self, stats):
+        """Adds stats produced by `compute_sample_stats`."""
+        self.confusion += stats["counts"].sum(axis=0)
+        self.num_samples += len(stats["counts"])
+        for key, values in metrics_from_counts(*stats["counts"].T).items():
+            self.count_metric_sums[key] = self.count_metric_sums.get(key, 0.0) + float(np.sum(values))
+        self.auroc_sum += float(np.sum(stats["auroc"]))
+        self.bf_sum += float(np.sum(stats["bf_score"]))
 
-            except Exception as e:
-                warnings.warn(f"Hausdorff calculation failed for sample {i}: {e}")
-                current_max_hd = np.nan
-                current_mean_hd = np.nan
+        valid_hd = ~np.isnan(stats["mean_hausdorff"]) & ~np.isnan(stats["max_hausdorff"])
+        self.hausdorff_count += int(valid_hd.sum())
+        self.mean_hausdorff_sum += float(stats["mean_hausdorff"][valid_hd].sum())
+        self.max_hausdorff_sum += float(stats["max_hausdorff"][valid_hd].sum())
+        return self
 
-        hausdorff_maxs.append(current_max_hd)
-        hausdorff_means.append(current_mean_hd)
+    def merge(self, other):
+        """Folds another accumulator (e.g. from a different worker) into this one."""
+        self.confusion += other.confusion
+        self.num_samples += other.num_samples
+        for key, value in other.count_metric_sums.items():
+            self.count_metric_sums[key] = self.count_metric_sums.get(key, 0.0) + value
+        self.auroc_sum += other.auroc_sum
+        self.bf_sum += other.bf_sum
+        self.hausdorff_count += other.hausdorff_count
+        self.mean_hausdorff_sum += other.mean_hausdorff_sum
+        self.max_hausdorff_sum += other.max_hausdorff_sum
+        return self
 
-    mean_hausdorff_batch = np.nanmean(hausdorff_means) if not np.all(np.isnan(hausdorff_means)) else -1.0
-    max_hausdorff_batch = np.nanmean(hausdorff_maxs) if not np.all(np.isnan(hausdorff_maxs)) else -1.0
+    def state_dict(self):
+        return {
+            "confusion": self.confusion.tolist(),
+            "num_samples": self.num_samples,
+            "count_metric_sums": dict(self.count_metric_sums),
+            "auroc_sum": self.auroc_sum,
+            "bf_sum": self.bf_sum,
+            "hausdorff_count": self.hausdorff_count,
+            "mean_hausdorff_sum": self.mean_hausdorff_sum,
+            "max_hausdorff_sum": self.max_hausdorff_sum,
+        }
 
-    # Paper metrics
-    paper_accuracy = recall
-    paper_iou = iou
-    paper_bf_score = boundary_f1_score
+    def load_state_dict(self, state):
+        self.confusion = np.asarray(state["confusion"], dtype=np.int64)
+        self.num_samples = int(state["num_samples"])
+        self.count_metric_sums = {key: float(value) for key, value in state["count_metric_sums"].items()}
+        self.auroc_sum = float(state["auroc_sum"])
+        self.bf_sum = float(state["bf_sum"])
+        self.hausdorff_count = int(state["hausdorff_count"])
+        self.mean_hausdorff_sum = float(state["mean_hausdorff_sum"])
+        self.max_hausdorff_sum = float(state["max_hausdorff_sum"])
+        return self
 
-    results = {
-        "Accuracy": accuracy,
-        "Dice Coefficient": dice_coefficient,
-        "IoU": iou,
-        "Weighted IoU": weighted_iou,
-        "Boundary F1 Score": boundary_f1_score,
-        "AUROC": auroc,
-        "AuC": auc_specific,
-        "BF Score": boundary_f1_score,
-        "Mean Hausdorff": mean_hausdorff_batch,
-        "Max Hausdorff": max_hausdorff_batch,
-        "False Positive Rate": false_positive_rate,
-        "False Negative Rate": false_negative_rate,
-        "Accuracy (Paper)": paper_accuracy,
-        "IoU (Paper)": paper_iou,
-        "BF Score (Paper)": paper_bf_score,
-        "Precision": precision,
-        "Recall": recall,
-        "Specificity": specificity
+    @classmethod
+    def from_state_dict(cls, state):
+        return cls().load_state_dict(state)
+
+    def compute(self):
+        """Returns the metrics dict: METRIC_KEYS (per-sample means), then the "<key> (micro)" values."""
+        TP, TN, FP, FN = (int(v) for v in self.confusion)
+        micro = metrics_from_counts(TP, TN, FP, FN)
+        if self.num_samples > 0:
+            results = {key: total / self.num_samples for key, total in self.count_metric_sums.items()}
+        else:
+            results = dict(micro)
+
+        results["AUROC"] = self.auroc_sum / self.num_samples if self.num_samples > 0 else 0.5
+        bf_score = self.bf_sum / self.num_samples if self.num_samples > 0 else 0.0
+        results["Boundary F1 Score"] = bf_score
+        results["BF Score"] = bf_score
+        results["BF Score (Paper)"] = bf_score
+        if self.hausdorff_count > 0:
+            results["Mean Hausdorff"] = self.mean_hausdorff_sum / self.hausdorff_count
+            results["Max Hausdorff"] = self.max_hausdorff_sum / self.hausdorff_count
+        else:
+            results["Mean Hausdorff"] = -1.0
+            results["Max Hausdorff"] = -1.0
+
+        metrics = {key: float(results[key]) for key in METRIC_KEYS}
+        metrics.update({f"{key} (micro)": float(micro[key]) for key in MICRO_METRIC_KEYS})
+        return metrics
+
+
+def metrics_from_stats(stats):
+    """Metrics dict (METRIC_KEYS) for the samples in `stats`; one record per sample when B=1."""
+    metrics = MetricAccumulator().update_from_stats(stats).compute()
+    return {key: metrics[key] for key in METRIC_KEYS}
+
+# --- Main Metric Calculation Function ---
+def calculate_all_metrics(predictions, targets, threshold=0.5, target_boundary=None, target_distance=None):
+    """
+    Metrics for a batch of logits (B, 1, H, W): every METRIC_KEYS value is the mean over the
+    B samples, including AUROC (per-sample AUROC, not one AUROC over the pooled pixels of the
+    batch), plus the pooled "<key> (micro)" values. For B=1 both agree.
+    """
+    stats = compute_sample_stats(predictions, targets, threshold=threshold,
+                                 target_boundary=target_boundary, target_distance=target_distance)
+    return MetricAccumulator().update_from_stats(stats).compute()
+
+
+# --- Threshold Sweep ---
+SWEEP_KEYS = ["Dice Coefficient", "IoU", "Precision", "Recall"]
+
+def _sweep_curves(pos_hist, neg_hist):
+    """
+    Dice/IoU/Precision/Recall at every bin edge from label-split histograms.
+
+    Reverse cumulative sums turn the histograms into TP/FP counts for the rule
+    `prob >= k / num_bins` at every k at once. Works on (..., num_bins) arrays.
+    """
+    epsilon = EPSILON
+    TP = np.cumsum(pos_hist[..., ::-1], axis=-1)[..., ::-1]
+    FP = np.cumsum(neg_hist[..., ::-1], axis=-1)[..., ::-1]
+    FN = pos_hist.sum(axis=-1, keepdims=True) - TP
+
+    return {
+        "Dice Coefficient": (2 * TP) / (2 * TP + FP + FN + epsilon),
+        "IoU": TP / (TP + FP + FN + epsilon),
+        "Precision": TP / (TP + FP + epsilon),
+        "Recall": TP / (TP + FN + epsilon),
     }
 
-    return results
+class ThresholdSweep:
+    """
+    Single-pass metric curves over many thresholds.
+
+    Each sample's probabilities are binned once into histograms split by the
+    ground-truth label. From those, Dice/IoU/Precision/Recall follow for all
+    `num_bins` thresholds without re-running inference. Micro curves come from
+    the pooled histograms, macro curves from running sums of per-sample curves,
+    so memory stays O(num_bins) regardless of the number of samples.
+
+    Threshold k is `k / num_bins` and a pixel counts as positive when
+    `prob >= threshold`.
+    """
+    def __init__(self, num_bins=256):
+        self.num_bins = int(num_bins)
+        self.thresholds = np.arange(self.num_bins) / self.num_bins
+        self.reset()
+
+    def reset(self):
+        self.pos_hist = np.zeros(self.num_bins, dtype=np.int64)
+        self.neg_hist = np.zeros(self.num_bins, dtype=np.int64)
+        self.num_samples = 0
+        self.macro_sums = {key: np.zeros(self.num_bins, dtype=np.float64) for key in SWEEP_KEYS}
+
+    def histograms(self, predictions, targets):
+        """
+        Per-sample histograms on the predictions' device.
+
+        Args:
+            predictions (torch.Tensor): Raw logits. Shape (B, 1, H, W).
+            targets (torch.Tensor): Ground truth labels (0 or 1). Shape (B, 1, H, W).
+
+        Returns:
+            np.ndarray: (B, 2, num_bins) int64 counts; index 0 = background, 1 = foreground.
+        """
+        batch_size = predictions.shape[0]
+        probs = torch.sigmoid(predictions.detach()).reshape(batch_size, -1)
+        bins = (probs * self.num_bins).long().clamp_(0, self.num_bins - 1)
+        labels = (targets.detach().reshape(batch_size, -1) > 0.5).long()
+        offsets = torch.arange(batch_size, device=bins.device).unsqueeze(1) * (2 * self.num_bins)
+
+        flat_index = (bins + labels * self.num_bins + offsets).reshape(-1)
+        hist = torch.bincount(flat_index, minlength=2 * self.num_bins * batch_size)
+        return hist.view(batch_size, 2, self.num_bins).cpu().numpy().astype(np.int64)
+
+    def update(self, predictions, targets):
+        self.update_from_histograms(self.histograms(predictions, targets))
+        return self
+
+    def update_from_histograms(self, hist):
+        neg_hist, pos_hist = hist[:, 0], hist[:, 1]
+        self.neg_hist += neg_hist.sum(axis=0)
+        self.pos_hist += pos_hist.sum(axis=0)
+        self.num_samples += hist.shape[0]
+
+        per_sample = _sweep_curves(pos_hist, neg_hist)
+        for key in SWEEP_KEYS:
+            self.macro_sums[key] += per_sample[key].sum(axis=0)
+        return self
+
+    def merge(self, other):
+        if other.num_bins != self.num_bins:
+            raise ValueError(f"Cannot merge sweeps with {other.num_bins} and {self.num_bins} bins.")
+        self.pos_hist += other.pos_hist
+        self.neg_hist += other.neg_hist
+        self.num_samples += other.num_samples
+        for key in SWEEP_KEYS:
+            self.macro_sums[key] += other.macro_sums[key]
+        return self
+
+    def state_dict(self):
+        return {
+            "num_bins": self.num_bins,
+            "pos_hist": self.pos_hist.tolist(),
+            "neg_hist": self.neg_hist.tolist(),
+            "num_samples": self.num_samples,
+            "macro_sums": {key: value.tolist() for key, value in self.macro_sums.items()},
+        }
+
+    @classmethod
+    def from_state_dict(cls, state):
+        sweep = cls(num_bins=state["num_bins"])
+        sweep.pos_hist = np.asarray(state["pos_hist"], dtype=np.int64)
+        sweep.neg_hist = np.asarray(state["neg_hist"], dtype=np.int64)
+        sweep.num_samples = int(state["num_samples"])
+        sweep.macro_sums = {key: np.asarray(value, dtype=np.float64) for key, value in state["macro_sums"].items()}
+        return sweep
+
+    def curves(self, average="micro"):
+        """Returns {"Threshold": ..., "Dice Coefficient": ..., "IoU": ..., "Precision": ..., "Recall": ...}."""
+        if average == "micro":
+            curves = _sweep_curves(self.pos_hist, self.neg_hist)
+        elif average == "macro":
+            count = max(self.num_samples, 1)
+            curves = {key: self.macro_sums[key] / count for key in SWEEP_KEYS}
+        else:
+            raise ValueError(f"Unsupported average: '{average}' (use 'micro' or 'macro')")
+        return {"Threshold": self.thresholds, **curves}
+
+    def best_threshold(self, criterion="Dice Coefficient", average="micro"):
+        """Returns (threshold, score) maximising `criterion`."""
+        if criterion not in SWEEP_KEYS:
+            raise ValueError(f"Unsupported threshold criterion: '{criterion}'. Options: {SWEEP_KEYS}")
+        scores = self.curves(average)[criterion]
+        best = int(np.argmax(scores))
+        return float(self.thresholds[best]), float(scores[best])
+
+
+# --- Streaming Grouped Aggregation ---
+class RunningStats:
+    """Welford running count / mean / M2 for one scalar. NaNs are skipped like pandas."""
+    __slots__ = ("count", "mean", "m2")
+
+    def __init__(self, count=0, mean=0.0, m2=0.0):
+        self.count = count
+        self.mean = mean
+        self.m2 = m2
+
+    def update(self, value):
+        if value is None or np.isnan(value):
+            return self
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+        return self
+
+    def merge(self, other):
+        """Chan et al. parallel combination of two running stats."""
+        if other.count == 0:
+            return self
+        total = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / total
+        self.m2 += other.m2 + delta ** 2 * self.count * other.count / total
+        self.count = total
+        return self
+
+    def std(self):
+        """Sample standard deviation (ddof=1, as pandas); NaN below two values."""
+        return np.sqrt(self.m2 / (self.count - 1)) if self.count > 1 else np.nan
+
+
+class GroupedMetricAggregator:
+    """
+    Streaming per-group metric statistics for test-time reports.
+
+    Samples are keyed by (pulses, experiment_id, dataset_idx). Each group keeps a
+    RunningStats per metric, so summaries by any key field (e.g. per pulse count)
+    are produced by merging groups instead of re-reading per-sample CSVs.
+    """
+    KEY_FIELDS = ("pulses", "experiment_id", "dataset_idx")
+
+    def __init__(self):
+        self.groups = {}
+
+    def update(self, key, values):
+        """Adds one sample. `key` is a (pulses, experiment_id, dataset_idx) tuple."""
+        group = self.groups.setdefault(tuple(key), {})
+        for name, value in values.items():
+            if isinstance(value, (bool, np.bool_)) or not isinstance(value, (int, float, np.number)):
+                continue
+            group.setdefault(name, RunningStats()).update(float(value))
+        return self
+
+    def merge(self, other):
+        for key, other_group in other.groups.items():
+            group = self.groups.setdefault(key, {})
+            for name, stats in other_group.items():
+                group.setdefault(name, RunningStats()).merge(stats)
+        return self
+
+    def summary(self, metric, by="pulses"):
+        """
+        Collapses groups onto one key field.
+
+        Returns:
+            dict: {by: sorted key values, "count": ..., "mean": ..., "std": ...} as arrays.
+        """
+        field_idx = self.KEY_FIELDS.index(by)
+        combined = {}
+        for key, group in self.groups.items():
+            if metric in group and key[field_idx] is not None:
+                combined.setdefault(key[field_idx], RunningStats()).merge(group[metric])
+
+        keys = sorted(combined)
+        return {
+            by: np.array(keys),
+            "count": np.array([combined[k].count for k in keys]),
+            "mean": np.array([combined[k].mean for k in keys], dtype=np.float64),
+            "std": np.array([combined[k].std() for k in keys], dtype=np.float64),
+        }
+
+    def state_dict(self):
+        return {
+            "groups": [
+                {"key": list(key), "stats": {name: [s.count, s.mean, s.m2] for name, s in group.items()}}
+                for key, group in self.groups.items()
+            ]
+        }
+
+    @classmethod
+    def from_state_dict(cls, state):
+        aggregator = cls()
+        for entry in state["groups"]:
+            aggregator.groups[tuple(entry["key"])] = {
+                name: RunningStats(*values) for name, values in entry["stats"].items()
+            }
+        return aggregator
@@ -1,9 +1,16 @@
 # model/__init__.py
-from .resnet18 import ResNet18CNN
-from .attention_unet import AttentionUNet
-from .deeplabv3plus import DeepLabV3Plus
-from .convlstm import ConvLSTM
-from .unet_mini import SimpleUNetMini
-from .hrnet_binary import HRNetBinary
+# Model classes are imported on first access (`from model import AttentionUNet`),
+# so importing the package does not load every model's dependencies. The names
+# and modules come from the MODELS registry (model/builders.py).
 
-# Add other models as you create them
\ No newline at end of file
+
+def __getattr__(name):
+    if name.startswith("__") and name != "__all__": # module dunders (__wrapped__, ...) are not registry names
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    from registry import MODELS
+
+    if name == "__all__":
+        return MODELS.names()
+    if name in MODELS:
+        return MODELS.resolve(name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -5,15 +5,32 @@ import torch.nn.functional as F
 
 # --- Building Blocks ---
 
+class SeparableConv2d(nn.Module):
+    """Depthwise KxK conv (one filter per input channel) -> pointwise 1x1 conv. Drop-in for nn.Conv2d in ConvBlock."""
+    def __init__(self, in_channels, out_channels, kernel_size=3, padding=1, bias=False):
+        super().__init__()
+        self.depthwise = nn.Conv2d(in_channels, in_channels, kernel_size=kernel_size, padding=padding,
+                                   groups=in_channels, bias=False)
+        self.pointwise = nn.Conv2d(in_channels, out_channels, kernel_size=1, bias=bias)
+
+    def forward(self, x):
+        return self.pointwise(self.depthwise(x))
+
 class ConvBlock(nn.Module):
-    """Standard Double Convolution Block: Conv3x3 -> BN -> ReLU -> Conv3x3 -> BN -> ReLU"""
-    def __init__(self, in_channels, out_channels):
+    """
+    Standard Double Convolution Block: Conv3x3 -> BN -> ReLU -> Conv3x3 -> BN -> ReLU
+
+    With separable=True each dense 3x3 conv becomes a depthwise 3x3 followed by a
+    pointwise 1x1 (MobileNet style), roughly 1/8 of the multiply-adds at 64+ channels.
+    """
+    def __init__(self, in_channels, out_channels, separable=False):
         super().__init__()
+        conv = SeparableConv2d if separable else nn.Conv2d
         self.block = nn.Sequential(
-            nn.Conv2d(in_channels, out_channels, kernel_size=3, padding=1, bias=False), # Bias False with BN
+            conv(in_channels, out_channels, kernel_size=3, padding=1, bias=False), # Bias False with BN
             nn.BatchNorm2d(out_channels),
             nn.ReLU(inplace=True),
-            nn.Conv2d(out_channels, out_channels, kernel_size=3, padding=1, bias=False),
+            conv(out_channels, out_channels, kernel_size=3, padding=1, bias=False),
             nn.BatchNorm2d(out_channels),
             nn.ReLU(inplace=True)
         )
@@ -57,9 +74,9 @@ class AttentionGate(nn.Module):
         g1 = self.W_g(g)
         x1 = self.W_x(x)
 
-        # Upsample g1 to match the spatial dimensions of x1 if necessary
-        if g1.shape[-2:] != x1.shape[-2:]:
-             g1 = F.interpolate(g1, size=x1.size()[2:], mode='bilinear', align_corners=False)
+        # Upsample g1 to match the spatial dimensions of x1 (a no-op when they already match).
+        # Unconditional so the graph has no shape-dependent control flow (FX tracing / quantization).
+        g1 = F.interpolate(g1, size=x1.size()[2:], mode='bilinear', align_corners=False)
 
         psi = self.relu(g1 + x1)
         psi = self.psi(psi) # Attention coefficients (alpha)
@@ -72,13 +89,13 @@ class UpConvBlock(nn.Module):
     Takes channels from below (in_ch) and skip connection (skip_ch).
     Outputs skip_ch channels.
     """
-    def __init__(self, in_ch, skip_ch):
+    def __init__(self, in_ch, skip_ch, separable=False):
         super().__init__()
         # Upsample layer reduces channels by half (common practice)
         self.up = nn.ConvTranspose2d(in_ch, in_ch // 2, kernel_size=2, stride=2)
         # Conv block takes concatenated channels (skip_ch from skip + in_ch // 2 from upsampled)
         # The output channels of this block should match the skip connection channels
-        self.conv = ConvBlock(skip_ch + in_ch // 2, skip_ch)
+        self.conv = ConvBlock(skip_ch + in_ch // 2, skip_ch, separable=separable)
 
     def forward(self, x1, x2):
         """
@@ -101,77 +118,83 @@ class UpConvBlock(nn.Module):
 
 
 # --- Attention U-Net Model ---
+BASE_FEATURES = 64
+
+def scaled_features(width_mult=1.0, depth=4, base=BASE_FEATURES):
+    """
+    Channels per level: base * width_mult doubled at each of the `depth` poolings,
+    rounded to a multiple of 8. The defaults give [64, 128, 256, 512, 1024].
+    """
+    return [max(8, int(round(base * width_mult * 2 ** level / 8)) * 8) for level in range(depth + 1)]
+
 class AttentionUNet(nn.Module):
-    def __init__(self, in_channels=1, num_classes=1, features=[64, 128, 256, 512, 1024]):
+    def __init__(self, in_channels=1, num_classes=1, features=None, width_mult=1.0, depth=4, separable=False):
         """
-        Standard Attention U-Net Architecture.
+        Attention U-Net Architecture, scalable in width and depth.
 
         Args:
             in_channels (int): Number of input channels (e.g., 1 for grayscale, 3 for RGB).
             num_classes (int): Number of output classes (e.g., 1 for binary segmentation).
-            features (list): List of feature channels at each level of the U-Net.
+            features (list, optional): Feature channels at each level (encoders, then bottleneck).
+                                       Overrides width_mult and depth.
+            width_mult (float): Scales the channels of every level (0.25, 0.5, 1.0, ...).
+            depth (int): Number of pooling levels; the input H and W should be divisible by 2**depth.
+            separable (bool): Use depthwise-separable convolutions in the encoder / decoder ConvBlocks.
+
+        The defaults build the standard model ([64, 128, 256, 512, 1024], dense convs);
+        its state_dict keys (enc1..enc4, bottleneck, att4..att1, up4..up1) do not change.
         """
         super().__init__()
+        features = list(features) if features is not None else scaled_features(width_mult, depth)
+        if len(features) < 2:
+            raise ValueError(f"AttentionUNet needs at least one pooling level, got features={features}")
+        self.depth = len(features) - 1
+        self.features = features
         self.pool = nn.MaxPool2d(kernel_size=2, stride=2)
 
         # --- Encoder ---
-        self.enc1 = ConvBlock(in_channels, features[0]) # Out: 64
-        self.enc2 = ConvBlock(features[0], features[1]) # Out: 128
-        self.enc3 = ConvBlock(features[1], features[2]) # Out: 256
-        self.enc4 = ConvBlock(features[2], features[3]) # Out: 512
+        # enc1..encN, Out: features[0]..features[N-1] (64, 128, 256, 512 by default)
+        for level in range(1, self.depth + 1):
+            in_ch = in_channels if level == 1 else features[level - 2]
+            setattr(self, f"enc{level}", ConvBlock(in_ch, features[level - 1], separable=separable))
 
         # --- Bottleneck ---
-        self.bottleneck = ConvBlock(features[3], features[4]) # Out: 1024
+        self.bottleneck = ConvBlock(features[-2], features[-1], separable=separable) # Out: 1024
 
         # --- Decoder ---
-        # Attention Gates (F_g from below, F_l from skip connection)
-        self.att4 = AttentionGate(F_g=features[4], F_l=features[3], F_int=features[3] // 2)
-        self.att3 = AttentionGate(F_g=features[3], F_l=features[2], F_int=features[2] // 2)
-        self.att2 = AttentionGate(F_g=features[2], F_l=features[1], F_int=features[1] // 2)
-        self.att1 = AttentionGate(F_g=features[1], F_l=features[0], F_int=features[0] // 2)
-
-        # Upsampling blocks (in_ch from below, skip_ch from corresponding encoder layer)
-        self.up4 = UpConvBlock(in_ch=features[4], skip_ch=features[3]) # Out: features[3] (512)
-        self.up3 = UpConvBlock(in_ch=features[3], skip_ch=features[2]) # Out: features[2] (256)
-        self.up2 = UpConvBlock(in_ch=features[2], skip_ch=features[1]) # Out: features[1] (128)
-        self.up1 = UpConvBlock(in_ch=features[1], skip_ch=features[0]) # Out: features[0] (64)
+        # Attention Gates (F_g from below, F_l from skip connection) and
+        # upsampling blocks (in_ch from below, skip_ch from corresponding encoder layer).
+        # Created deepest first, as in the original fixed-depth model.
+        for level in range(self.depth, 0, -1):
+            setattr(self, f"att{level}", AttentionGate(F_g=features[level], F_l=features[level - 1],
+                                                       F_int=max(1, features[level - 1] // 2)))
+        for level in range(self.depth, 0, -1):
+            setattr(self, f"up{level}", UpConvBlock(in_ch=features[level], skip_ch=features[level - 1],
+                                                    separable=separable)) # Out: features[level - 1]
 
         # --- Output Layer ---
         self.out_conv = nn.Conv2d(features[0], num_classes, kernel_size=1)
 
     def forward(self, x):
         # --- Encoder Path ---
-        e1 = self.enc1(x)                # Ch: 64,  Size: H, W
-        p1 = self.pool(e1)               # Size: H/2, W/2
-        e2 = self.enc2(p1)               # Ch: 128, Size: H/2, W/2
-        p2 = self.pool(e2)               # Size: H/4, W/4
-        e3 = self.enc3(p2)               # Ch: 256, Size: H/4, W/4
-        p3 = self.pool(e3)               # Size: H/8, W/8
-        e4 = self.enc4(p3)               # Ch: 512, Size: H/8, W/8
-        p4 = self.pool(e4)               # Size: H/16, W/16
+        skips = []
+        for level in range(1, self.depth + 1):
+            x = getattr(self, f"enc{level}")(x) # Ch: features[level - 1], Size: H / 2**(level-1)
+            skips.append(x)
+            x = self.pool(x)
 
         # --- Bottleneck ---
-        b = self.bottleneck(p4)          # Ch: 1024, Size: H/16, W/16
+        d = self.bottleneck(x)           # Ch: features[-1], Size: H / 2**depth
 
         # --- Decoder Path ---
-        # Level 4
-        a4 = self.att4(g=b, x=e4)         # Apply attention to e4 using b as gating signal
-        d4 = self.up4(x1=b, x2=a4)        # Upsample b, concat with attended e4. Out Ch: 512, Size: H/8, W/8
-
-        # Level 3
-        a3 = self.att3(g=d4, x=e3)        # Apply attention to e3 using d4 as gating signal
-        d3 = self.up3(x1=d4, x2=a3)       # Upsample d4, concat with attended e3. Out Ch: 256, Size: H/4, W/4
-
-        # Level 2
-        a2 = self.att2(g=d3, x=e2)        # Apply attention to e2 using d3 as gating signal
-        d2 = self.up2(x1=d3, x2=a2)       # Upsample d3, concat with attended e2. Out Ch: 128, Size: H/2, W/2
-
-        # Level 1
-        a1 = self.att1(g=d2, x=e1)        # Apply attention to e1 using d2 as gating signal
-        d1 = self.up1(x1=d2, x2=a1)       # Upsample d2, concat with attended e1. Out Ch: 64, Size: H, W
+        # At each level: attention on the encoder output using the deeper feature map as
+        # gating signal, then upsample the deeper map and concat with the attended skip.
+        for level in range(self.depth, 0, -1):
+            a = getattr(self, f"att{level}")(g=d, x=skips[level - 1])
+            d = getattr(self, f"up{level}")(x1=d, x2=a)
 
         # --- Output ---
-        logits = self.out_conv(d1)       # Out Ch: num_classes, Size: H, W
+        logits = self.out_conv(d)        # Out Ch: num_classes, Size: H, W
 
         # Return logits; sigmoid is handled by the loss function (DiceFocalLoss)
-        return logits
\ No newline at end of file
+        return logits
@@ -0,0 +1,113 @@
+# model/builders.py
+# Builders of the MODELS registry: each receives the (lazily imported) model class
+# and the config. registry.py imports this module the first time MODELS is used.
+from registry import MODELS
+
+
+@MODELS.register("ResNet18CNN", "model.resnet18:ResNet18CNN")
+def build_resnet18(cls, config):
+    model = cls(
+        in_channels=config.IN_CHANNELS,
+        num_classes=config.NUM_CLASSES,
+        pretrained=config.PRETRAINED,
+        dropout_prob=config.DROPOUT_PROB  # <== Pass this
+    )
+    print(f"ResNet18CNN - Pretrained: {config.PRETRAINED}, Dropout: {config.DROPOUT_PROB}")
+
+    if config.FREEZE_BACKBONE:
+        from utils import freeze_resnet_layers
+        freeze_resnet_layers(model, freeze_until=config.FREEZE_UNTIL)
+        print(f"Freezing ResNet layers up to: {config.FREEZE_UNTIL}")
+    return model
+
+@MODELS.register("DeepLabV3Plus", "model.deeplabv3plus:DeepLabV3Plus")
+def build_deeplabv3plus(cls, config):
+    model = cls(
+        in_channels=config.IN_CHANNELS,
+        num_classes=config.NUM_CLASSES,
+        output_stride=config.DEEPLAB_OUTPUT_STRIDE, # Read from config
+        pretrained=config.PRETRAINED              # Read from config
+    )
+    print(f"DeepLabV3+ - Output Stride: {config.DEEPLAB_OUTPUT_STRIDE}, Pretrained: {config.PRETRAINED}")
+    return model
+
+@MODELS.register("AttentionUNet", "model.attention_unet:AttentionUNet")
+def build_attention_unet(cls, config):
+    model = cls(
+        in_channels=config.IN_CHANNELS,
+        num_classes=config.NUM_CLASSES,
+        width_mult=config.ATTUNET_WIDTH_MULT,
+        depth=config.ATTUNET_DEPTH,
+        separable=config.ATTUNET_SEPARABLE
+    )
+    print(f"AttentionUNet - Features: {model.features}, Separable: {config.ATTUNET_SEPARABLE}")
+    return model
+
+def _convlstm_kernel_sizes(config):
+    # Ensure dataloader.py provides sequential data (B, T, C, H, W)
+    # Ensure config.SEQUENCE_LENGTH > 1
+    if config.SEQUENCE_LENGTH <= 1:
+         raise ValueError(f"SEQUENCE_LENGTH must be > 1 in config.py to use {config.MODEL_NAME}.")
+
+    num_lstm_layers = len(config.CONVLSTM_HIDDEN_DIMS)
+    if len(config.CONVLSTM_KERNEL_SIZES) == 1:
+        kernel_sizes = config.CONVLSTM_KERNEL_SIZES * num_lstm_layers
+        print(f"ConvLSTM - Using kernel size {config.CONVLSTM_KERNEL_SIZES[0]} for all {num_lstm_layers} layers.")
+    elif len(config.CONVLSTM_KERNEL_SIZES) == num_lstm_layers:
+        kernel_sizes = config.CONVLSTM_KERNEL_SIZES
+        print(f"ConvLSTM - Using specific kernel sizes: {kernel_sizes}")
+    else:
+        raise ValueError("Config error: CONVLSTM_KERNEL_SIZES must have length 1 or match length of CONVLSTM_HIDDEN_DIMS")
+    return kernel_sizes
+
+@MODELS.register("ConvLSTM", "model.convlstm:ConvLSTM")
+def build_convlstm(cls, config):
+    model = cls( # This is ConvLSTMSeq aliased
+        in_channels=config.IN_CHANNELS,
+        hidden_dims=config.CONVLSTM_HIDDEN_DIMS,
+        kernel_sizes=_convlstm_kernel_sizes(config),
+        num_classes=config.NUM_CLASSES,
+        initial_cnn_out_channels=config.CONVLSTM_INITIAL_CNN_OUT_CHANNELS,
+        batch_first=config.CONVLSTM_BATCH_FIRST
+    )
+    print(f"ConvLSTM - Hidden Dims: {config.CONVLSTM_HIDDEN_DIMS}, Initial CNN Out: {config.CONVLSTM_INITIAL_CNN_OUT_CHANNELS}, Batch First: {config.CONVLSTM_BATCH_FIRST}")
+    return model
+
+@MODELS.register("ConvLSTMLowRes", "model.convlstm:ConvLSTMLowRes")
+def build_convlstm_lowres(cls, config):
+    model = cls(
+        in_channels=config.IN_CHANNELS,
+        hidden_dims=config.CONVLSTM_HIDDEN_DIMS,
+        kernel_sizes=_convlstm_kernel_sizes(config),
+        num_classes=config.NUM_CLASSES,
+        downsample=config.CONVLSTM_DOWNSAMPLE,
+        batch_first=config.CONVLSTM_BATCH_FIRST
+    )
+    print(f"ConvLSTMLowRes - Hidden Dims: {config.CONVLSTM_HIDDEN_DIMS}, Downsample: {config.CONVLSTM_DOWNSAMPLE}, Batch First: {config.CONVLSTM_BATCH_FIRST}")
+    return model
+
+@MODELS.register("SimpleUNetMini", "model.unet_mini:SimpleUNetMini")
+def build_simple_unet_mini(cls, config):
+    return cls(in_channels=config.IN_CHANNELS, num_classes=config.NUM_CLASSES)
+
+@MODELS.register("HRNetBinary", "model.hrnet_binary:HRNetBinary")
+def build_hrnet_binary(cls, config):
+    model = cls(in_channels=config.IN_CHANNELS, num_classes=config.NUM_CLASSES)
+    print(f"HRNetBinary - In Channels: {config.IN_CHANNELS}, Num Classes: {config.NUM_CLASSES}")
+    return model
+
+
+def get_model(config):
+    """Initializes the model based on the configuration (see the builders above)."""
+    print(f"--- Initializing Model: {config.MODEL_NAME} ---")
+    print(f"Input Channels: {config.IN_CHANNELS}, Num Classes: {config.NUM_CLASSES}")
+
+    model = MODELS.build(config.MODEL_NAME, config)
+
+    print("--- Model Initialized ---")
+    # initialize_weights(model)  # <--- Add this line
+    if not config.PRETRAINED:
+        from utils import initialize_weights
+        initialize_weights(model)
+
+    return model.to(config.DEVICE)
@@ -51,29 +51,38 @@ class ConvLSTMCell(nn.Module):
         """
         h_cur, c_cur = cur_state
         combined = torch.cat([input_tensor, h_cur], dim=1)  # Concatenate along channel axis
+        return self.update(self.conv_gates(combined), c_cur)
 
-        combined_conv = self.conv_gates(combined)
-
-        # Split the convolutional output into the four gate components
-        # cc_i: input gate, cc_f: forget gate, cc_o: output gate, cc_g: cell gate (candidate)
-        cc_i, cc_f, cc_o, cc_g = torch.split(combined_conv, self.hidden_dim, dim=1)
-
-        # Apply activations
-        i = torch.sigmoid(cc_i)
-        f = torch.sigmoid(cc_f)
-        o = torch.sigmoid(cc_o)
-        g = torch.tanh(cc_g)
-
-        # Calculate next cell state
-        c_next = f * c_cur + i * g
+    def input_gates(self, input_tensor):
+        """
+        Gates for a zero hidden state: only the input half of `conv_gates` (the
+        hidden half contributes exactly zero), so the first step skips it.
+        """
+        return F.conv2d(input_tensor, self.conv_gates.weight[:, :self.input_dim], self.conv_gates.bias,
+                        padding=self.padding)
 
-        # Optional: Apply Layer Normalization to cell state
-        # if hasattr(self, 'layer_norm'):
-        #     c_next = self.layer_norm(c_next)
+    def update(self, gates, c_cur, out=None):
+        """
+        Gate nonlinearities and state update from the pre-activation gates (B, 4*C_hid, H, W).
 
-        # Calculate next hidden state
-        h_next = o * torch.tanh(c_next)
+        The i, f, o gates are contiguous, so a single sigmoid covers all three.
+        With `out=(h_buf, c_buf)` (inference only, no autograd) the new state is
+        written in place; c_buf may be c_cur and h_buf may be a channel slice of
+        the next step's concatenated input.
 
+        Returns:
+            tuple: (h_next, c_next).
+        """
+        sig = torch.sigmoid(gates[:, :3 * self.hidden_dim])
+        i, f, o = torch.split(sig, self.hidden_dim, dim=1)
+        g = torch.tanh(gates[:, 3 * self.hidden_dim:])
+        if out is None:
+            c_next = torch.addcmul(f * c_cur, i, g)
+            return o * torch.tanh(c_next), c_next
+
+        h_next, c_next = out
+        torch.mul(f, c_cur, out=c_next).addcmul_(i, g)
+        torch.mul(o, torch.tanh(c_next), out=h_next)
         return h_next, c_next
 
     def init_hidden(self, batch_size, image_size, device):
@@ -161,6 +170,13 @@ class ConvLSTMSeq(nn.Module):
         """
         Forward pass through the ConvLSTM sequence model.
 
+        The per-frame encoder runs once on all frames as (B*T, C, H, W). Each cell
+        update uses one sigmoid for the i/f/o gates, and the first step from a
+        zero state skips the hidden half of the gate convolution. Without
+        autograd every layer keeps a preallocated [input | h] buffer that the
+        update writes h into, so no state tensors or concatenations are
+        allocated per step.
+
         Args:
             x (torch.Tensor): Input tensor. Shape (B, T, C_in, H, W) if batch_first=True,
                               otherwise (T, B, C_in, H, W).
@@ -170,46 +186,97 @@ class ConvLSTMSeq(nn.Module):
         Returns:
             torch.Tensor: Output segmentation logits. Shape (B, C_out, H, W).
         """
-        if self.batch_first:
-            # Convert to (T, B, C, H, W) for easier iteration
+        if not self.batch_first:
             x = x.permute(1, 0, 2, 3, 4)
+        batch_size, seq_len, channels, height, width = x.size()
 
-        # Get input dimensions
-        seq_len, batch_size, _, height, width = x.size()
-        device = x.device
-        image_size = (height, width)
+        # Per-frame encoder for all timesteps in one batch
+        features, skips = self.encode(x.reshape(batch_size * seq_len, channels, height, width))
+        features = features.view(batch_size, seq_len, *features.shape[1:])
+        skips = [skip.view(batch_size, seq_len, *skip.shape[1:])[:, -1] for skip in skips] # last frame only
 
-        # Initialize hidden state if not provided
-        if hidden_state is None:
-            hidden_state = self._init_hidden(batch_size, image_size, device)
+        h = self._run_cells(features, hidden_state)
 
-        # --- Temporal Processing ---
-        last_state_list = [] # Store the last state of each layer
+        # --- Output Generation ---
+        return self.decode(h, skips) # (B, num_classes, H, W)
 
-        for t in range(seq_len):
-            # Input for the current time step
-            step_input_raw = x[t, :, :, :, :] # (B, C_in, H, W)
+    def encode(self, frames):
+        """(N, C_in, H, W) frames -> (recurrent input features, list of skip features)."""
+        return self.initial_cnn(frames), []
 
-            # Apply initial CNN
-            step_input = self.initial_cnn(step_input_raw) # (B, initial_cnn_out, H, W)
+    def decode(self, h, skips):
+        """Final hidden state of the last layer (+ last-frame skips) -> logits."""
+        return self.output_conv(h)
 
-            # Pass through ConvLSTM layers
-            for layer_idx in range(self.num_layers):
-                h, c = hidden_state[layer_idx]
-                h, c = self.cell_list[layer_idx](input_tensor=step_input, cur_state=[h, c])
-                hidden_state[layer_idx] = (h, c) # Update state for next time step
+    def _run_cells(self, features, hidden_state=None):
+        """
+        Runs the ConvLSTM layers over (B, T, C, h, w) features and returns the
+        last layer's final hidden state. `hidden_state` (if given) is updated to
+        the final per-layer states.
+        """
+        batch_size, seq_len, _, height, width = features.size()
+        in_place = not torch.is_grad_enabled()
+
+        if in_place:
+            combined, cell_states = [], []
+            for layer_idx, cell in enumerate(self.cell_list):
+                buffer = features.new_empty(batch_size, cell.input_dim + cell.hidden_dim, height, width)
+                c = features.new_zeros(batch_size, cell.hidden_dim, height, width)
+                if hidden_state is not None:
+                    buffer[:, cell.input_dim:].copy_(hidden_state[layer_idx][0])
+                    c.copy_(hidden_state[layer_idx][1])
+                combined.append(buffer)
+                cell_states.append(c)
+        state = hidden_state
+
+        # --- Temporal Processing ---
+        for t in range(seq_len):
+            step_input = features[:, t]
+            new_state = []
+            for layer_idx, cell in enumerate(self.cell_list):
+                if in_place:
+                    c = cell_states[layer_idx]
+                    if state is None:
+                        gates = cell.input_gates(step_input)
+                    else:
+                        combined[layer_idx][:, :cell.input_dim].copy_(step_input)
+                        gates = cell.conv_gates(combined[layer_idx])
+                    h, c = cell.update(gates, c, out=(combined[layer_idx][:, cell.input_dim:], c))
+                elif state is None:
+                    h, c = cell.update(cell.input_gates(step_input), 0.0)
+                else:
+                    h, c = cell(step_input, state[layer_idx])
+                new_state.append((h, c))
                 step_input = h # Output of current layer is input to next layer
+            state = new_state
 
-            # We only need the hidden state of the *last* layer from the *last* time step
-            if t == seq_len - 1:
-                 last_layer_h = hidden_state[-1][0] # Get hidden state 'h' of last layer
+        if hidden_state is not None:
+            hidden_state[:] = state # Final states, as the per-step loop used to leave them
+        return step_input
 
+    def step(self, frame, state=None):
+        """
+        Streaming inference: advances the recurrence by one frame.
 
-        # --- Output Generation ---
-        # Apply output convolution to the final hidden state of the last layer
-        logits = self.output_conv(last_layer_h) # (B, num_classes, H, W)
+        Args:
+            frame (torch.Tensor): One time step, shape (B, C_in, H, W).
+            state (list, optional): Per-layer (h, c) tuples returned by the previous call.
+                                    None starts a new series from zero state.
+
+        Returns:
+            tuple: Logits for this frame (B, num_classes, H, W) and the updated state.
+        """
+        step_input, skips = self.encode(frame)
+        if state is None:
+            state = self._init_hidden(frame.size(0), step_input.shape[-2:], frame.device)
 
-        return logits
+        new_state = []
+        for layer_idx in range(self.num_layers):
+            h, c = self.cell_list[layer_idx](input_tensor=step_input, cur_state=state[layer_idx])
+            new_state.append((h, c))
+            step_input = h
+
+        return self.decode(step_input, skips), new_state
 
     def _init_hidden(self, batch_size, image_size, device):
         """Initializes hidden states for all layers."""
@@ -219,5 +286,82 @@ class ConvLSTMSeq(nn.Module):
         return init_states
 
 
+
+class ConvLSTMLowRes(ConvLSTMSeq):
+    """
+    ConvLSTMSeq with the recurrent core at reduced resolution.
+
+    Every frame goes through a strided encoder down to 1/`downsample` of the
+    input size, the ConvLSTM layers run there (the 64-channel cells are by far
+    the most expensive part at full 1024x256 resolution), and a decoder
+    upsamples the final hidden state back with skip connections taken from the
+    encoder features of the *last* frame.
+
+    Args:
+        in_channels (int): Number of channels in each input time step.
+        hidden_dims (list[int]): Hidden dimensions of the ConvLSTM layers.
+        kernel_sizes (list[tuple]): Kernel sizes of the ConvLSTM layers.
+        num_classes (int): Number of output segmentation classes.
+        downsample (int): Resolution reduction of the recurrent core, 4 or 8.
+        encoder_channels (list[int], optional): Channels of the full-resolution stem and
+            of each stride-2 stage. Defaults to [16, 32, 64] (x4) or [16, 32, 64, 64] (x8).
+        batch_first (bool): If True, input tensor shape is (B, T, C, H, W). Default: True.
+    """
+    def __init__(self, in_channels=1, hidden_dims=[64, 64], kernel_sizes=[(3, 3), (3, 3)],
+                 num_classes=1, downsample=4, encoder_channels=None, batch_first=True):
+        num_stages = {4: 2, 8: 3}.get(downsample)
+        if num_stages is None:
+            raise ValueError(f"downsample must be 4 or 8, got {downsample}")
+        if encoder_channels is None:
+            encoder_channels = [16, 32, 64, 64][:num_stages + 1]
+        if len(encoder_channels) != num_stages + 1:
+            raise ValueError(f"encoder_channels needs {num_stages + 1} entries for downsample={downsample}")
+        super().__init__(in_channels=in_channels, hidden_dims=hidden_dims, kernel_sizes=kernel_sizes,
+                         num_classes=num_classes, initial_cnn_out_channels=encoder_channels[-1],
+                         batch_first=batch_first)
+        self.downsample = downsample
+        del self.initial_cnn # replaced by the multi-scale encoder below
+
+        # --- Encoder: full-resolution stem + stride-2 stages ---
+        self.stem = _conv_bn_relu(in_channels, encoder_channels[0])
+        self.down_blocks = nn.ModuleList([
+            nn.Sequential(_conv_bn_relu(encoder_channels[i], encoder_channels[i + 1], stride=2),
+                          _conv_bn_relu(encoder_channels[i + 1], encoder_channels[i + 1]))
+            for i in range(num_stages)
+        ])
+
+        # --- Decoder: upsample, concatenate the last frame's skip, conv ---
+        up_blocks = []
+        channels = self.hidden_dims[-1]
+        for skip_channels in reversed(encoder_channels[:-1]):
+            up_blocks.append(_conv_bn_relu(channels + skip_channels, skip_channels))
+            channels = skip_channels
+        self.up_blocks = nn.ModuleList(up_blocks)
+        self.output_conv = nn.Conv2d(channels, num_classes, kernel_size=1)
+
+    def encode(self, frames):
+        x = self.stem(frames)
+        skips = []
+        for block in self.down_blocks:
+            skips.append(x)
+            x = block(x)
+        return x, skips
+
+    def decode(self, h, skips):
+        x = h
+        for block, skip in zip(self.up_blocks, reversed(skips)):
+            x = F.interpolate(x, size=skip.shape[-2:], mode="bilinear", align_corners=False)
+            x = block(torch.cat([x, skip], dim=1))
+        return self.output_conv(x)
+
+
+def _conv_bn_relu(in_channels, out_channels, stride=1):
+    return nn.Sequential(
+        nn.Conv2d(in_channels, out_channels, kernel_size=3, stride=stride, padding=1, bias=False),
+        nn.BatchNorm2d(out_channels),
+        nn.ReLU(inplace=True)
+    )
+
+
 # --- Alias for consistency with train.py ---
 ConvLSTM = ConvLSTMSeq
\ No newline at end of file
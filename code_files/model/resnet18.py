@@ -119,9 +119,9 @@ class ResNet18CNN(nn.Module):
         d2_upsampled = F.interpolate(d2, scale_factor=2, mode='bilinear', align_corners=False)
         diffY = x0.size()[2] - d2_upsampled.size()[2]
         diffX = x0.size()[3] - d2_upsampled.size()[3]
-        if diffY > 0 or diffX > 0:
-            d2_upsampled = F.pad(d2_upsampled, [diffX // 2, diffX - diffX // 2,
-                                                diffY // 2, diffY - diffY // 2])
+        # Zero padding is a no-op, so pad unconditionally (no shape-dependent control flow for FX tracing)
+        d2_upsampled = F.pad(d2_upsampled, [diffX // 2, diffX - diffX // 2,
+                                            diffY // 2, diffY - diffY // 2])
 
         d1 = torch.cat([x0, d2_upsampled], dim=1)
         d1 = self.up1_conv(d1)
@@ -0,0 +1,182 @@
+# multi_eval.py
+# Evaluates N checkpoints (experiments or epochs) in a single pass over the test set:
+# each batch is decoded once, its ground-truth boundaries are extracted once,
+# and then it goes through every model. Writes per-model results and a leaderboard.
+import argparse
+import os
+import re
+from glob import glob
+
+import numpy as np
+import pandas as pd
+import torch
+
+from config import Config
+from backends import load_model_for_inference
+from evaluator import PipelinedEvaluator
+from metric import boundary_maps
+from test import (TestRun, collect_results, get_test_loader, ground_truth_maps, iter_test_batches,
+                  label_feature_store, save_metrics_to_csv)
+from tiling import TiledInference
+from loss.builders import get_loss_fn
+
+LEADERBOARD_METRICS = ["Dice Coefficient", "IoU", "BF Score", "Mean Hausdorff", "Max Hausdorff",
+                       "Precision", "Recall", "Accuracy", "ablation_area", "Test_Loss"]
+LOWER_IS_BETTER = ("Mean Hausdorff", "Max Hausdorff", "Test_Loss")
+
+
+def _natural_key(path):
+    return [int(part) if part.isdigit() else part for part in re.split(r"(\d+)", path)]
+
+
+def parse_checkpoint_specs(specs, default_model_name):
+    """
+    Expands "[MODEL_NAME:]path_or_glob" entries into (model_name, checkpoint_path, label) tuples.
+
+    A glob such as checkpoints/EXP/epoch_*.pth.tar yields one entry per epoch.
+    The label is "<checkpoint dir>/<file stem>", e.g. "SimpleUNetMini_DiceLoss_Epochs6_LR0.0003/best".
+    """
+    entries = []
+    for spec in specs:
+        model_name, path = default_model_name, spec
+        prefix, sep, rest = spec.partition(":")
+        if sep and not os.path.exists(spec) and os.sep not in prefix:
+            model_name, path = prefix, rest
+        paths = sorted(glob(path), key=_natural_key) if any(c in path for c in "*?[") else [path]
+        if not paths:
+            print(f"Warning: No checkpoints match {path}")
+        for checkpoint_path in paths:
+            stem = os.path.basename(checkpoint_path).split(".")[0]
+            label = f"{os.path.basename(os.path.dirname(os.path.abspath(checkpoint_path)))}/{stem}"
+            entries.append((model_name, checkpoint_path, label))
+    return entries
+
+
+def model_config(base_config, model_name, run_name, label):
+    """Per-model copy of the config; results go to test_results/<run_name>/<label>."""
+    config = base_config.for_model(model_name)
+    config.EXPERIMENT_NAME = os.path.join(run_name, label)
+    return config
+
+
+def evaluate_many(models, test_loader, criterion, config):
+    """
+    Streams every test batch through all models.
+
+    Data loading, the host-to-device copy and the ground-truth boundary maps
+    (from the label feature store when enabled) are paid once per batch; the
+    metric jobs of all models share one worker pool.
+
+    Args:
+        models (list): (label, model, TestRun) tuples; each TestRun holds that model's config.
+        config: Base config (device, evaluator settings, SEQUENCE_LENGTH of the loader).
+
+    Returns:
+        dict: label -> average metrics (as returned by test.evaluate).
+    """
+    for _, model, _ in models:
+        model.eval()
+
+    label_store, label_files = label_feature_store(config, test_loader.dataset)
+    evaluator = PipelinedEvaluator(num_workers=config.EVAL_NUM_WORKERS, max_pending=config.EVAL_MAX_PENDING * len(models))
+    try:
+        with torch.no_grad(), evaluator:
+            for data, target, filenames, first_idx in iter_test_batches(test_loader, config, desc=f"Testing {len(models)} models"):
+                target_boundary, target_distance = ground_truth_maps(label_store, label_files, first_idx, target)
+                if target_boundary is None:
+                    target_boundary = boundary_maps(target.cpu().numpy()[:, 0].astype(np.uint8))
+                for _, model, run in models:
+                    pred_logits = model(data)
+                    run.add_batch(evaluator, pred_logits, data, target, filenames, first_idx,
+                                  target_boundary=target_boundary, target_distance=target_distance)
+            collect_results(evaluator.drain())
+    except BaseException as e:
+        for _, _, run in models:
+            run.abort(type(e), e, e.__traceback__)
+        raise
+
+    return {label: run.finish() for label, _, run in models}
+
+
+def save_leaderboard(results, entries, path, sort_by="Dice Coefficient"):
+    """One row per checkpoint, best first by `sort_by`. Returns the DataFrame."""
+    rows = []
+    for model_name, checkpoint_path, label, threshold in entries:
+        metrics = results.get(label, {})
+        rows.append({
+            "Model_Label": label,
+            "Model": model_name,
+            "Checkpoint": checkpoint_path,
+            "Threshold": threshold,
+            **{key: metrics.get(key, np.nan) for key in LEADERBOARD_METRICS},
+        })
+    leaderboard = pd.DataFrame(rows)
+    if sort_by in leaderboard:
+        leaderboard = leaderboard.sort_values(sort_by, ascending=sort_by in LOWER_IS_BETTER, na_position="last")
+    leaderboard.insert(0, "Rank", range(1, len(leaderboard) + 1))
+    leaderboard.to_csv(path, index=False)
+    print(f"Saved leaderboard to {path}")
+    return leaderboard
+
+
+def main():
+    config = Config()
+    parser = argparse.ArgumentParser(description="Evaluate several checkpoints in one pass over the test set.")
+    parser.add_argument("checkpoints", nargs="+",
+                        help="[MODEL_NAME:]checkpoint path or glob (e.g. 'AttentionUNet:checkpoints/EXP/epoch_*.pth.tar'). "
+                             "MODEL_NAME defaults to config.MODEL_NAME.")
+    parser.add_argument("--name", default="multi_eval", help="Results go to test_results/<name>/.")
+    parser.add_argument("--sort-by", default="Dice Coefficient", choices=LEADERBOARD_METRICS)
+    parser.add_argument("--visualize", action="store_true", help="Also write per-sample prediction panels for every model.")
+    args = parser.parse_args()
+
+    specs = parse_checkpoint_specs(args.checkpoints, config.MODEL_NAME)
+    if not specs:
+        print("ERROR: No checkpoints to evaluate.")
+        return
+    sequence_lengths = {model_config(config, model_name, args.name, label).SEQUENCE_LENGTH for model_name, _, label in specs}
+    if len(sequence_lengths) > 1:
+        print("ERROR: Sequence (ConvLSTM) and single-frame models see different test samples; evaluate them separately.")
+        return
+    config.SEQUENCE_LENGTH = sequence_lengths.pop()
+
+    test_loader = get_test_loader(config)
+    if len(test_loader) == 0:
+        print("ERROR: Test loader has 0 batches. Cannot evaluate.")
+        return
+    criterion = get_loss_fn(config)
+
+    models, entries = [], []
+    for model_name, checkpoint_path, label in specs:
+        if any(label == existing for _, _, existing, _ in entries):
+            print(f"Warning: Duplicate checkpoint {checkpoint_path} ({label}); skipping.")
+            continue
+        model_cfg = model_config(config, model_name, args.name, label)
+        model, threshold = load_model_for_inference(checkpoint_path, model_cfg)
+        if model is None:
+            print(f"Warning: Could not load {checkpoint_path}; skipping.")
+            continue
+        model_cfg.THRESHOLD = threshold
+        if config.TILED_INFERENCE:
+            model = TiledInference.from_config(model, model_cfg)
+        models.append((label, model, TestRun(model_cfg, criterion, save_visualizations=args.visualize)))
+        entries.append((model_name, checkpoint_path, label, threshold))
+    if not models:
+        print("ERROR: None of the checkpoints could be loaded.")
+        return
+
+    print(f"\n--- Evaluating {len(models)} checkpoints in one pass ---")
+    results = evaluate_many(models, test_loader, criterion, config)
+    for label, _, run in models:
+        if results[label]:
+            save_metrics_to_csv(results[label], run.config)
+
+    leaderboard_path = os.path.join("test_results", args.name, "leaderboard.csv")
+    leaderboard = save_leaderboard(results, entries, leaderboard_path, sort_by=args.sort_by)
+    print("\n--- Leaderboard ---")
+    with pd.option_context("display.max_columns", None, "display.width", 200):
+        print(leaderboard[["Rank", "Model_Label", "Threshold"] + LEADERBOARD_METRICS[:5]].to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
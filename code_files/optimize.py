@@ -0,0 +1,166 @@
+# optimize.py
+# Eval-mode graph simplification applied after the checkpoint is loaded:
+# BatchNorm folded into the preceding conv and Dropout removed, so each
+# Conv -> BN -> ReLU runs as Conv -> ReLU. Module types and methods (e.g. ConvLSTM.step) are kept,
+# so the result is a drop-in replacement; outputs are checked against the
+# unoptimized model and the original is kept if they differ.
+import copy
+import weakref
+from collections import Counter, defaultdict
+
+import torch
+import torch.nn as nn
+from torch.nn.utils.fusion import fuse_conv_bn_weights
+
+CONV_TYPES = (nn.Conv1d, nn.Conv2d, nn.Conv3d, nn.ConvTranspose1d, nn.ConvTranspose2d, nn.ConvTranspose3d)
+BN_TYPES = (nn.BatchNorm1d, nn.BatchNorm2d, nn.BatchNorm3d)
+DROPOUT_TYPES = (nn.Dropout, nn.Dropout1d, nn.Dropout2d, nn.Dropout3d, nn.AlphaDropout, nn.FeatureAlphaDropout)
+
+
+def find_conv_bn_pairs(model, example):
+    """
+    Runs model(example) and returns ({bn name: conv name}, output) for every BatchNorm
+    whose input is always the output of the same conv, and whose conv only ever
+    feeds that BatchNorm. Pairs are found from the actual data flow, so this works
+    for Sequentials, torchvision / smp blocks (conv1 -> bn1) and modules called
+    several times per forward (ConvLSTM time steps) alike.
+    """
+    produced = {} # id(conv output) -> (conv name, weakref to the output, its version counter)
+    conv_calls, bn_calls, paired_calls = Counter(), Counter(), Counter()
+    sources = defaultdict(set)
+    hooks = []
+
+    def conv_hook(name):
+        def hook(module, inputs, output):
+            conv_calls[name] += 1
+            produced[id(output)] = (name, weakref.ref(output), output._version)
+        return hook
+
+    def bn_hook(name):
+        def hook(module, inputs):
+            bn_calls[name] += 1
+            entry = produced.get(id(inputs[0]))
+            # Same tensor and not modified in place since the conv (e.g. conv -> ReLU(inplace) -> BN)
+            if entry is not None and entry[1]() is inputs[0] and entry[2] == inputs[0]._version:
+                sources[name].add(entry[0])
+                paired_calls[entry[0]] += 1
+            else:
+                sources[name].add(None)
+        return hook
+
+    for name, module in model.named_modules():
+        if isinstance(module, CONV_TYPES):
+            hooks.append(module.register_forward_hook(conv_hook(name)))
+        elif isinstance(module, BN_TYPES) and module.track_running_stats:
+            hooks.append(module.register_forward_pre_hook(bn_hook(name)))
+    try:
+        with torch.no_grad():
+            output = model(example)
+    finally:
+        for hook in hooks:
+            hook.remove()
+
+    pairs = {}
+    for bn_name, convs in sources.items():
+        conv_name = next(iter(convs))
+        if len(convs) == 1 and conv_name is not None and \
+                paired_calls[conv_name] == conv_calls[conv_name] == bn_calls[bn_name]:
+            pairs[bn_name] = conv_name
+    if len(set(pairs.values())) != len(pairs): # a conv feeding two BatchNorms cannot be folded into both
+        counts = Counter(pairs.values())
+        pairs = {bn: conv for bn, conv in pairs.items() if counts[conv] == 1}
+    return pairs, output
+
+
+def _parent(model, name):
+    parent_name, _, child_name = name.rpartition(".")
+    return (model.get_submodule(parent_name) if parent_name else model), child_name
+
+
+def fold_batchnorm(model, pairs):
+    """Folds each BatchNorm of `pairs` ({bn name: conv name}) into its conv and replaces it with nn.Identity."""
+    for bn_name, conv_name in pairs.items():
+        conv, bn = model.get_submodule(conv_name), model.get_submodule(bn_name)
+        weight, bias = fuse_conv_bn_weights(conv.weight, conv.bias, bn.running_mean, bn.running_var, bn.eps,
+                                            bn.weight, bn.bias, transpose=isinstance(conv, nn.modules.conv._ConvTransposeNd))
+        conv.weight, conv.bias = weight, bias
+        parent, child_name = _parent(model, bn_name)
+        setattr(parent, child_name, nn.Identity())
+    return len(pairs)
+
+
+def strip_dropout(model):
+    """Replaces every Dropout module (a no-op in eval mode) with nn.Identity."""
+    names = [name for name, module in model.named_modules() if isinstance(module, DROPOUT_TYPES)]
+    for name in names:
+        parent, child_name = _parent(model, name)
+        setattr(parent, child_name, nn.Identity())
+    return len(names)
+
+
+def remove_identities(model):
+    """Drops the nn.Identity placeholders left by folding / stripping from Sequentials. Returns how many."""
+    removed = 0
+    for module in list(model.modules()):
+        if not isinstance(module, nn.Sequential):
+            continue
+        for key in [key for key, child in module._modules.items() if isinstance(child, nn.Identity)]:
+            if len(module._modules) > 1:
+                del module._modules[key]
+                removed += 1
+    return removed
+
+
+def _flatten(output):
+    if isinstance(output, (tuple, list)):
+        return [tensor for item in output for tensor in _flatten(item)]
+    return [output.float()]
+
+
+def optimize_for_inference(model, example, atol=1e-4, rtol=1e-5):
+    """
+    Returns an eval-mode copy of `model` with BatchNorm folded into convs, Dropout
+    stripped and Identity placeholders removed, after checking that its output on
+    `example` is close to the original's: max |diff| <= atol + rtol * max |logit|
+    (folding only reorders float32 arithmetic, so the error scales with the logits).
+    If it is not, a warning is printed and the original model is returned.
+
+    Returns:
+        (model, report dict with folded_bn, dropout_removed, identities_removed,
+         max_abs_diff, tolerance, applied)
+    """
+    model.eval()
+    pairs, expected = find_conv_bn_pairs(model, example)
+
+    optimized = copy.deepcopy(model)
+    report = {"folded_bn": fold_batchnorm(optimized, pairs), "dropout_removed": strip_dropout(optimized)}
+    report["identities_removed"] = remove_identities(optimized)
+    optimized.eval()
+
+    try:
+        with torch.no_grad():
+            expected, actual = _flatten(expected), _flatten(optimized(example))
+        report["max_abs_diff"] = max(float((e - a).abs().max()) for e, a in zip(expected, actual))
+        report["tolerance"] = atol + rtol * max(float(e.abs().max()) for e in expected)
+    except (RuntimeError, IndexError, TypeError) as e: # e.g. a Sequential indexed by position in forward
+        print(f"Warning: Optimized model failed ({e}); using the unoptimized model.")
+        report.update(max_abs_diff=float("nan"), tolerance=float("nan"), applied=False)
+        return model, report
+    report["applied"] = report["max_abs_diff"] <= report["tolerance"]
+    if not report["applied"]:
+        print(f"Warning: Optimized model differs from the original (max |diff| = {report['max_abs_diff']:.2e} > {report['tolerance']:.2e}); "
+              f"using the unoptimized model.")
+        return model, report
+    print(f"Inference optimization: folded {report['folded_bn']} BatchNorms, removed {report['dropout_removed']} Dropouts "
+          f"(max |diff| = {report['max_abs_diff']:.2e})")
+    return optimized, report
+
+
+def optimize_from_config(model, config):
+    """optimize_for_inference on a random batch of the model's input shape, if config.OPTIMIZE_INFERENCE."""
+    if not config.OPTIMIZE_INFERENCE:
+        return model
+    from export import example_input
+    model, _ = optimize_for_inference(model, example_input(config).to(config.DEVICE),
+                                      atol=config.OPTIMIZE_INFERENCE_ATOL, rtol=config.OPTIMIZE_INFERENCE_RTOL)
+    return model
@@ -0,0 +1,207 @@
+# predict.py
+# Runs a trained checkpoint on unlabeled ultrasound frames (new acquisitions).
+# Writes a mask per frame, a per-frame ablation area CSV and a per-pulse summary,
+# all updated incrementally while the frames stream through the model.
+import argparse
+import csv
+import os
+import re
+from glob import glob
+
+import cv2
+import numpy as np
+import torch
+from torch.utils.data import DataLoader
+from tqdm import tqdm
+
+from config import Config
+from dataloader import UnlabeledUltrasoundDataset
+from evaluator import PipelinedEvaluator
+from metric import GroupedMetricAggregator
+from tiling import TiledInference
+from backends import BACKENDS, load_inference_backend
+from utils import postprocess_batch
+
+FILENAME_PATTERN = r't3US(\d+)_(\d+)_(\d+)'
+FRAME_FIELDS = ["filename", "pulses", "experiment_id", "dataset_idx", "ablation_area",
+                "num_components", "largest_component_area"]
+
+
+def resolve_image_files(inputs):
+    """Expands directories and glob patterns into a sorted, de-duplicated list of .jpg paths."""
+    paths = set()
+    for entry in inputs:
+        if os.path.isdir(entry):
+            paths.update(os.path.join(entry, f) for f in os.listdir(entry) if f.lower().endswith('.jpg'))
+        else:
+            paths.update(p for p in glob(entry) if p.lower().endswith('.jpg'))
+    return sorted(paths, key=os.path.basename)
+
+
+def get_predict_loader(image_files, config, batch_size=None, num_workers=None):
+    """
+    Creates a batched, multi-worker DataLoader over unlabeled frames.
+    With config.TILED_INFERENCE frames stay at native resolution (a batch must share one frame size).
+    """
+    dataset = UnlabeledUltrasoundDataset(
+        image_files,
+        image_size=None if config.TILED_INFERENCE else config.IMAGE_SIZE,
+        in_channels=config.IN_CHANNELS,
+        sequence_length=config.SEQUENCE_LENGTH
+    )
+    return DataLoader(
+        dataset,
+        batch_size=batch_size or config.TEST_BATCH_SIZE,
+        shuffle=False,
+        num_workers=getattr(config, 'NUM_WORKERS', 2) if num_workers is None else num_workers
+    )
+
+
+def postprocess_predictions(pred_logits, filenames, native_sizes, config, threshold, mask_dir=None, keep_masks=False):
+    """
+    Turns a batch of logits into per-frame records (worker-thread job).
+
+    Masks are thresholded, optionally cleaned with postprocess_batch, resized back
+    to each frame's native resolution and, if mask_dir is given, written as
+    `<frame>_mask.png` (0 / 255). Ablation area is measured on the native-resolution mask.
+    With keep_masks=True each record also carries the (H, W) uint8 mask under "mask".
+    """
+    pred_binary = (torch.sigmoid(pred_logits) > threshold).float()
+    component_stats = None
+    if config.APPLY_POSTPROCESSING:
+        pred_binary, component_stats = postprocess_batch(pred_binary, min_size=config.MIN_COMPONENT_SIZE,
+                                                         num_workers=config.POSTPROCESS_NUM_WORKERS)
+    masks = pred_binary[:, 0].numpy().astype(np.uint8)
+
+    records = []
+    for i, filename in enumerate(filenames):
+        native_w, native_h = (int(v) for v in native_sizes[i])
+        mask = masks[i]
+        if mask.shape != (native_h, native_w):
+            mask = cv2.resize(mask, (native_w, native_h), interpolation=cv2.INTER_NEAREST)
+        if mask_dir is not None:
+            base_filename, _ = os.path.splitext(filename)
+            cv2.imwrite(os.path.join(mask_dir, f"{base_filename}_mask.png"), mask * 255)
+
+        match = re.match(FILENAME_PATTERN, filename)
+        scale = (native_w * native_h) / float(masks[i].size) # native pixels per model pixel
+        records.append({
+            "filename": filename,
+            "pulses": int(match.group(1)) * 20 if match else None,
+            "experiment_id": match.group(2) if match else None,
+            "dataset_idx": int(match.group(3)) if match else None,
+            "ablation_area": float(mask.sum()) * config.PIXEL_AREA_MM2,
+            "num_components": component_stats[i]["num_components"] if component_stats else None,
+            "largest_component_area": component_stats[i]["largest_area"] * scale * config.PIXEL_AREA_MM2 if component_stats else None,
+        })
+        if keep_masks:
+            records[-1]["mask"] = mask
+    return records
+
+
+def save_pulse_summary(grouped, summary_path):
+    """Rewrites the per-pulse ablation area summary (small; replaced atomically)."""
+    summary = grouped.summary("ablation_area", by="pulses")
+    tmp_path = summary_path + ".tmp"
+    with open(tmp_path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["pulses", "num_frames", "ablation_area_mean", "ablation_area_std"])
+        for pulses, count, mean, std in zip(summary["pulses"], summary["count"], summary["mean"], summary["std"]):
+            writer.writerow([int(pulses), int(count), f"{mean:.6f}", f"{std:.6f}"])
+    os.replace(tmp_path, summary_path)
+
+
+def predict(model, loader, config, output_dir, threshold, save_masks=True):
+    """
+    Streams the loader through the model and writes results as they arrive.
+
+    Post-processing and mask encoding run on config.EVAL_NUM_WORKERS threads while
+    the next batch is inferred; at most config.EVAL_MAX_PENDING batches are in
+    flight, so memory stays bounded by the batch size, not the input size.
+
+    Returns:
+        int: Number of frames written.
+    """
+    mask_dir = os.path.join(output_dir, "masks") if save_masks else None
+    if mask_dir:
+        os.makedirs(mask_dir, exist_ok=True)
+    frames_path = os.path.join(output_dir, "ablation_area_per_frame.csv")
+    summary_path = os.path.join(output_dir, "ablation_area_per_pulse.csv")
+    grouped = GroupedMetricAggregator()
+    num_frames = 0
+
+    with open(frames_path, "w", newline="") as frames_file:
+        frames_writer = csv.DictWriter(frames_file, fieldnames=FRAME_FIELDS)
+        frames_writer.writeheader()
+
+        def collect(batch_results):
+            nonlocal num_frames
+            for records in batch_results:
+                for record in records:
+                    frames_writer.writerow(record)
+                    grouped.update((record["pulses"], record["experiment_id"], record["dataset_idx"]), record)
+                    num_frames += 1
+            if batch_results:
+                frames_file.flush()
+                save_pulse_summary(grouped, summary_path)
+
+        evaluator = PipelinedEvaluator(num_workers=config.EVAL_NUM_WORKERS, max_pending=config.EVAL_MAX_PENDING)
+        with torch.no_grad(), evaluator:
+            for data, filenames, native_sizes in tqdm(loader, desc="Predicting"):
+                pred_logits = model(data.to(config.DEVICE))
+                collect(evaluator.submit(postprocess_predictions, pred_logits.cpu(), list(filenames),
+                                         native_sizes, config, threshold, mask_dir))
+            collect(evaluator.drain())
+
+    save_pulse_summary(grouped, summary_path)
+    print(f"Wrote {num_frames} frame predictions to {frames_path}")
+    print(f"Per-pulse summary: {summary_path}")
+    if mask_dir:
+        print(f"Masks: {mask_dir}")
+    return num_frames
+
+
+def main():
+    config = Config()
+    parser = argparse.ArgumentParser(description="Segment unlabeled ultrasound frames with a trained checkpoint.")
+    parser.add_argument("inputs", nargs="+", help="Directories and/or glob patterns of .jpg frames.")
+    parser.add_argument("--checkpoint", default=os.path.join(config.CHECKPOINT_DIR, config.EXPERIMENT_NAME, "best.pth.tar"),
+                        help="Checkpoint for config.MODEL_NAME (default: best.pth.tar of the current experiment).")
+    parser.add_argument("--output-dir", default=os.path.join(config.PREDICT_OUTPUT_DIR, config.EXPERIMENT_NAME))
+    parser.add_argument("--batch-size", type=int, default=config.TEST_BATCH_SIZE)
+    parser.add_argument("--num-workers", type=int, default=getattr(config, 'NUM_WORKERS', 2))
+    parser.add_argument("--backend", choices=BACKENDS, default="torch",
+                        help="torchscript / onnx use the files written by export.py next to the checkpoint.")
+    parser.add_argument("--threshold", type=float, default=None, help="Override the checkpoint / config threshold.")
+    parser.add_argument("--no-masks", action="store_true", help="Only write the ablation area CSVs.")
+    parser.add_argument("--tiled", action=argparse.BooleanOptionalAction, default=config.TILED_INFERENCE,
+                        help="Sliding-window inference at native resolution (Config.TILE_SIZE / TILE_OVERLAP / TILE_BATCH_SIZE); "
+                             "defaults to Config.TILED_INFERENCE, --no-tiled turns it off.")
+    args = parser.parse_args()
+
+    image_files = resolve_image_files(args.inputs)
+    if not image_files:
+        print(f"ERROR: No .jpg frames found for {args.inputs}")
+        return
+    print(f"Found {len(image_files)} frames.")
+
+    model, threshold = load_inference_backend(args.backend, args.checkpoint, config)
+    if model is None:
+        print(f"ERROR: Could not load checkpoint {args.checkpoint}. Cannot run prediction.")
+        return
+    if args.threshold is not None:
+        threshold = args.threshold
+    print(f"Using decision threshold: {threshold:.4f}")
+
+    config.TILED_INFERENCE = args.tiled
+    if config.TILED_INFERENCE:
+        print(f"Tiled inference at native resolution: tile {config.TILE_SIZE}, overlap {config.TILE_OVERLAP}")
+        model = TiledInference.from_config(model, config)
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    loader = get_predict_loader(image_files, config, batch_size=args.batch_size, num_workers=args.num_workers)
+    predict(model, loader, config, args.output_dir, threshold, save_masks=not args.no_masks)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+# prediction_cache.py
+# Per-sample test-set predictions persisted next to the results, keyed by
+# checkpoint hash + test-set fingerprint, so thresholds, postprocessing, metrics
+# and plots can be re-run without running the model again.
+import hashlib
+import json
+import os
+
+import numpy as np
+import torch
+
+CACHE_MODES = ("probs", "logits")
+INDEX_FILE = "index.json"
+PROB_SCALE = 255.0
+_LOGIT_EPS = 1.0 / (2 * PROB_SCALE) # half a quantization step keeps 0 and 255 finite
+
+
+def file_hash(path, chunk_size=1 << 20):
+    """Short sha256 of a file's contents."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()[:16]
+
+
+def test_set_fingerprint(dataset, config):
+    """
+    Hash of the test samples (image / label names, sizes and mtimes, in loader order)
+    and of every setting that changes what the model sees.
+    """
+    digest = hashlib.sha256()
+    settings = {"image_size": list(config.IMAGE_SIZE), "in_channels": config.IN_CHANNELS,
+                "sequence_length": config.SEQUENCE_LENGTH, "tiled": config.TILED_INFERENCE}
+    if config.TILED_INFERENCE:
+        settings.update(tile_size=list(config.TILE_SIZE), tile_overlap=config.TILE_OVERLAP)
+    digest.update(json.dumps(settings, sort_keys=True).encode())
+    for image_files, label_files in dataset.samples:
+        for folder, names in ((dataset.image_dir, image_files), (dataset.label_dir, label_files)):
+            for name in names:
+                stat = os.stat(os.path.join(folder, name))
+                digest.update(f"{name}:{stat.st_size}:{stat.st_mtime_ns};".encode())
+    return digest.hexdigest()[:16]
+
+
+def cache_dir(config, checkpoint_path, dataset):
+    """PREDICTION_CACHE_DIR/<checkpoint hash>_<test-set fingerprint>_<mode>."""
+    key = f"{file_hash(checkpoint_path)}_{test_set_fingerprint(dataset, config)}_{config.PREDICTION_CACHE}"
+    return os.path.join(config.PREDICTION_CACHE_DIR, key)
+
+
+class PredictionCacheWriter:
+    """
+    Appends per-sample predictions and targets to memory-mappable .npy files.
+
+    "probs" stores sigmoid probabilities quantized to uint8 (4x smaller than
+    float32, thresholds resolved to 1/255); "logits" stores float16 logits.
+    Targets are bit-packed along the width. The cache only counts as complete
+    once `close` has written the index, so an interrupted run is never replayed.
+    """
+    def __init__(self, path, num_samples, mode="probs", meta=None):
+        if mode not in CACHE_MODES:
+            raise ValueError(f"Unknown prediction cache mode '{mode}'. Choose from {CACHE_MODES}.")
+        self.path = path
+        self.num_samples = num_samples
+        self.mode = mode
+        self.meta = meta or {}
+        self.filenames = []
+        self._predictions = None
+        self._targets = None
+        os.makedirs(path, exist_ok=True)
+        index_path = os.path.join(path, INDEX_FILE)
+        if os.path.isfile(index_path):
+            os.remove(index_path) # overwritten below; invalid until closed
+
+    def _allocate(self, height, width):
+        dtype = np.uint8 if self.mode == "probs" else np.float16
+        self._predictions = np.lib.format.open_memmap(os.path.join(self.path, "predictions.npy"), mode="w+",
+                                                      dtype=dtype, shape=(self.num_samples, height, width))
+        self._targets = np.lib.format.open_memmap(os.path.join(self.path, "targets.npy"), mode="w+",
+                                                  dtype=np.uint8, shape=(self.num_samples, height, (width + 7) // 8))
+
+    def append(self, pred_logits, target, filenames):
+        """pred_logits / target: (B, 1, H, W) tensors for the next len(filenames) samples."""
+        pred_logits = pred_logits.detach().float().cpu()
+        if self._predictions is None:
+            self._allocate(*pred_logits.shape[-2:])
+        start, stop = len(self.filenames), len(self.filenames) + len(filenames)
+        if self.mode == "probs":
+            values = torch.round(torch.sigmoid(pred_logits[:, 0]) * PROB_SCALE).to(torch.uint8).numpy()
+        else:
+            values = pred_logits[:, 0].numpy().astype(np.float16)
+        self._predictions[start:stop] = values
+        self._targets[start:stop] = np.packbits(target.detach().cpu().numpy()[:, 0] > 0.5, axis=-1)
+        self.filenames.extend(filenames)
+
+    def close(self):
+        if self._predictions is None:
+            return
+        self._predictions.flush()
+        self._targets.flush()
+        index = {"mode": self.mode, "num_samples": len(self.filenames),
+                 "shape": list(self._predictions.shape[1:]), "filenames": self.filenames, **self.meta}
+        tmp_path = os.path.join(self.path, INDEX_FILE + ".tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(index, f)
+        os.replace(tmp_path, os.path.join(self.path, INDEX_FILE))
+        print(f"Saved {len(self.filenames)} cached predictions to {self.path}")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        return False
+
+
+class PredictionCache:
+    """
+    Read side of a completed cache. Arrays are memory-mapped, so replaying only
+    touches the pages of the batch being scored.
+    """
+    def __init__(self, path):
+        with open(os.path.join(path, INDEX_FILE)) as f:
+            self.index = json.load(f)
+        self.path = path
+        self.mode = self.index["mode"]
+        self.filenames = self.index["filenames"]
+        num_samples = len(self.filenames)
+        self.predictions = np.load(os.path.join(path, "predictions.npy"), mmap_mode="r")[:num_samples]
+        self.targets = np.load(os.path.join(path, "targets.npy"), mmap_mode="r")[:num_samples]
+
+    @staticmethod
+    def exists(path):
+        return os.path.isfile(os.path.join(path, INDEX_FILE))
+
+    def __len__(self):
+        return len(self.filenames)
+
+    def logits(self, start, stop):
+        """(B, 1, H, W) float32 logits; quantized probabilities are mapped back through the logit."""
+        values = torch.from_numpy(np.asarray(self.predictions[start:stop], dtype=np.float32))
+        if self.mode == "probs":
+            values = torch.logit(values / PROB_SCALE, eps=_LOGIT_EPS)
+        return values.unsqueeze(1)
+
+    def target(self, start, stop):
+        width = self.predictions.shape[-1]
+        bits = np.unpackbits(np.asarray(self.targets[start:stop]), axis=-1, count=width)
+        return torch.from_numpy(bits.astype(np.float32)).unsqueeze(1)
+
+    def batches(self, batch_size):
+        """Yields (pred_logits, target, filenames, first_idx) in the original loader order."""
+        for start in range(0, len(self), batch_size):
+            stop = min(start + batch_size, len(self))
+            yield self.logits(start, stop), self.target(start, stop), self.filenames[start:stop], start
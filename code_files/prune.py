@@ -0,0 +1,345 @@
+# prune.py
+# Structured channel pruning of a trained AttentionUNet / ResNet18CNN / DeepLabV3Plus:
+# channels are ranked by saliency, removed from the convs that produce them and
+# from every conv that reads them (attention gates, skip concatenations,
+# ASPP), and the smaller dense model is fine-tuned with train_one_epoch.
+# Writes one checkpoint per pruning ratio and a latency vs. IoU report.
+#
+#   python prune.py --ratios 0.25 0.5 0.75 --finetune-epochs 2
+import argparse
+import copy
+import os
+
+import torch
+import torch.nn as nn
+from torch.utils.data import DataLoader, Subset
+
+from config import Config
+
+PRUNABLE_MODELS = ("AttentionUNet", "ResNet18CNN", "DeepLabV3Plus")
+CRITERIA = ("bn", "l1")
+
+
+class ChannelGroup:
+    """
+    Output channels that are removed together.
+
+    Args:
+        name (str): Key of the group in the pruning plan stored with the checkpoint.
+        producers (list): (conv name, BatchNorm name or None) whose output channels are
+                          the group; several producers share indices (e.g. summed branches).
+        consumers (list): (conv name, offset) of every conv reading the group; offset is
+                          where the group starts in that conv's input (skip concatenations).
+    """
+    def __init__(self, name, producers, consumers):
+        self.name = name
+        self.producers = producers
+        self.consumers = consumers
+
+    def channels(self, model):
+        return model.get_submodule(self.producers[0][0]).out_channels
+
+
+def _conv_block_groups(prefix, consumers, first=0, second=3):
+    """The middle and output channels of a conv -> BN -> ReLU -> conv -> BN Sequential."""
+    return [ChannelGroup(f"{prefix}.{first}", [(f"{prefix}.{first}", f"{prefix}.{first + 1}")], [(f"{prefix}.{second}", 0)]),
+            ChannelGroup(f"{prefix}.{second}", [(f"{prefix}.{second}", f"{prefix}.{second + 1}")], consumers)]
+
+
+def _residual_block_groups(model, prefix):
+    """
+    Inner channels of the torchvision BasicBlocks / Bottlenecks under `prefix`. The block
+    output is added to the shortcut, so it is left alone.
+    """
+    from torchvision.models.resnet import BasicBlock, Bottleneck
+
+    groups = []
+    for name, module in model.get_submodule(prefix).named_modules():
+        name = f"{prefix}.{name}"
+        if isinstance(module, BasicBlock):
+            groups.append(ChannelGroup(f"{name}.conv1", [(f"{name}.conv1", f"{name}.bn1")], [(f"{name}.conv2", 0)]))
+        elif isinstance(module, Bottleneck):
+            groups.append(ChannelGroup(f"{name}.conv1", [(f"{name}.conv1", f"{name}.bn1")], [(f"{name}.conv2", 0)]))
+            groups.append(ChannelGroup(f"{name}.conv2", [(f"{name}.conv2", f"{name}.bn2")], [(f"{name}.conv3", 0)]))
+    return groups
+
+
+def attention_unet_groups(model):
+    """Every ConvBlock, the attention gates' intermediate channels and the upsampling convs."""
+    from model.attention_unet import SeparableConv2d
+
+    if any(isinstance(module, SeparableConv2d) for module in model.modules()):
+        raise ValueError("Pruning supports the dense AttentionUNet only (ATTUNET_SEPARABLE=False).")
+    depth = model.depth
+    groups = []
+    for level in range(1, depth + 1):
+        following = f"enc{level + 1}" if level < depth else "bottleneck"
+        # Encoder output: next encoder, the attention gate's skip input and the decoder concat (first part)
+        groups += _conv_block_groups(f"enc{level}.block", [(f"{following}.block.0", 0), (f"att{level}.W_x.0", 0),
+                                                           (f"up{level}.conv.block.0", 0)])
+        # g and x projections are summed, so they keep the same channels
+        groups.append(ChannelGroup(f"att{level}.F_int", [(f"att{level}.W_g.0", f"att{level}.W_g.1"),
+                                                        (f"att{level}.W_x.0", f"att{level}.W_x.1")],
+                                   [(f"att{level}.psi.0", 0)]))
+        # Upsampled deeper map: second part of the decoder concat, after the skip channels
+        groups.append(ChannelGroup(f"up{level}.up", [(f"up{level}.up", None)],
+                                   [(f"up{level}.conv.block.0", model.features[level - 1])]))
+        following = [(f"att{level - 1}.W_g.0", 0), (f"up{level - 1}.up", 0)] if level > 1 else [("out_conv", 0)]
+        groups += _conv_block_groups(f"up{level}.conv.block", following)
+    groups += _conv_block_groups("bottleneck.block", [(f"att{depth}.W_g.0", 0), (f"up{depth}.up", 0)])
+    return groups
+
+
+def resnet18cnn_groups(model):
+    """Inner channels of the encoder's residual blocks and every decoder conv."""
+    groups = []
+    for stage in range(1, 5):
+        groups += _residual_block_groups(model, f"encoder_layer{stage}")
+    following = {"up4": [("up3.up", 0)], "up3": [("up2.up", 0)],
+                 # concat [x0, upsampled d2] in front of up1_conv
+                 "up2": [("up1_conv.block.0", model.encoder_conv1.out_channels)]}
+    for name in ("up4", "up3", "up2"):
+        block = model.get_submodule(name)
+        skip_ch = block.conv.block[0].in_channels - block.up.out_channels
+        groups.append(ChannelGroup(f"{name}.up", [(f"{name}.up", None)], [(f"{name}.conv.block.0", skip_ch)]))
+        groups += _conv_block_groups(f"{name}.conv.block", following[name])
+    groups += _conv_block_groups("up1_conv.block", [("out_conv", 0)])
+    return groups
+
+
+def deeplabv3plus_groups(model):
+    """Inner channels of the backbone bottlenecks, the ASPP branches and projection, and the decoder."""
+    groups = []
+    for stage in range(1, 5):
+        groups += _residual_block_groups(model, f"backbone_layer{stage}")
+    # ASPP branches are concatenated into the projection; the pooling branch starts with the pool
+    offset = 0
+    for index, branch in enumerate(model.aspp.convs):
+        conv = 0 if isinstance(branch[0], nn.Conv2d) else 1
+        groups.append(ChannelGroup(f"aspp.convs.{index}", [(f"aspp.convs.{index}.{conv}", f"aspp.convs.{index}.{conv + 1}")],
+                                   [("aspp.project.0", offset)]))
+        offset += branch[conv].out_channels
+    # Decoder concat: (upsampled ASPP output, low-level features)
+    groups.append(ChannelGroup("aspp.project", [("aspp.project.0", "aspp.project.1")], [("decoder_conv_fuse.0", 0)]))
+    groups.append(ChannelGroup("decoder_conv_low", [("decoder_conv_low.0", "decoder_conv_low.1")],
+                               [("decoder_conv_fuse.0", model.aspp.project[0].out_channels)]))
+    groups += _conv_block_groups("decoder_conv_fuse", [("classifier", 0)], first=0, second=4)
+    return groups
+
+
+GROUP_BUILDERS = {"AttentionUNet": attention_unet_groups, "ResNet18CNN": resnet18cnn_groups,
+                  "DeepLabV3Plus": deeplabv3plus_groups}
+
+
+def prunable_groups(model):
+    """The ChannelGroups of a supported model (looked up by class name)."""
+    name = type(model).__name__
+    if name not in GROUP_BUILDERS:
+        raise ValueError(f"Pruning supports {PRUNABLE_MODELS}, not {name}.")
+    return GROUP_BUILDERS[name](model)
+
+
+def channel_saliency(model, group, criterion="bn"):
+    """
+    Importance of each channel of `group`, summed over its producers:
+    "bn" is |BatchNorm gamma| (network slimming), "l1" the mean |weight| of the filter.
+    Producers without a BatchNorm (ConvTranspose upsampling) always use "l1".
+    """
+    if criterion not in CRITERIA:
+        raise ValueError(f"Unknown pruning criterion '{criterion}'. Available: {CRITERIA}")
+    score = 0
+    for conv_name, bn_name in group.producers:
+        if criterion == "bn" and bn_name is not None:
+            score = score + model.get_submodule(bn_name).weight.detach().abs()
+        else:
+            conv = model.get_submodule(conv_name)
+            dims = (0, 2, 3) if isinstance(conv, nn.ConvTranspose2d) else (1, 2, 3) # (in, out, k, k) vs (out, in, k, k)
+            score = score + conv.weight.detach().abs().mean(dim=dims)
+    return score.float().cpu()
+
+
+def select_channels(model, groups, ratio, criterion="bn"):
+    """Pruning plan {group name: sorted kept indices} that removes `ratio` of every group's channels."""
+    if not 0 <= ratio < 1:
+        raise ValueError(f"Pruning ratio must be in [0, 1), got {ratio}")
+    keep = {}
+    for group in groups:
+        channels = group.channels(model)
+        num_keep = min(channels, max(1, int(round(channels * (1 - ratio)))))
+        indices = torch.topk(channel_saliency(model, group, criterion), num_keep).indices
+        keep[group.name] = sorted(indices.tolist())
+    return keep
+
+
+def _slice(tensor, dim, mask):
+    return tensor.detach().index_select(dim, mask.nonzero().flatten().to(tensor.device)).clone()
+
+
+def _prune_module(module, out_mask=None, in_mask=None):
+    """Keeps the output / input channels selected by the boolean masks of a conv or BatchNorm."""
+    if isinstance(module, nn.BatchNorm2d):
+        module.weight = nn.Parameter(_slice(module.weight, 0, out_mask), requires_grad=module.weight.requires_grad)
+        module.bias = nn.Parameter(_slice(module.bias, 0, out_mask), requires_grad=module.bias.requires_grad)
+        module.running_mean = _slice(module.running_mean, 0, out_mask)
+        module.running_var = _slice(module.running_var, 0, out_mask)
+        module.num_features = int(out_mask.sum())
+        return
+    if not isinstance(module, (nn.Conv2d, nn.ConvTranspose2d)) or module.groups != 1:
+        raise ValueError(f"Cannot prune channels of {module}")
+    out_dim, in_dim = (1, 0) if isinstance(module, nn.ConvTranspose2d) else (0, 1)
+    weight = module.weight
+    if out_mask is not None:
+        weight = _slice(weight, out_dim, out_mask)
+        if module.bias is not None:
+            module.bias = nn.Parameter(_slice(module.bias, 0, out_mask), requires_grad=module.bias.requires_grad)
+        module.out_channels = int(out_mask.sum())
+    if in_mask is not None:
+        weight = _slice(weight, in_dim, in_mask)
+        module.in_channels = int(in_mask.sum())
+    module.weight = nn.Parameter(weight.clone(), requires_grad=module.weight.requires_grad)
+
+
+def apply_pruning(model, groups, keep):
+    """
+    Removes every channel not in the plan `keep` ({group name: kept indices}) in place.
+    All masks are built on the original shapes first, so consumers fed by several
+    groups (concatenations) use the original offsets. Returns the model.
+    """
+    out_masks, in_masks = {}, {}
+
+    def mask_for(masks, name, size):
+        if name not in masks:
+            masks[name] = torch.ones(size, dtype=torch.bool)
+        return masks[name]
+
+    for group in groups:
+        if group.name not in keep:
+            continue
+        channels = group.channels(model)
+        mask = torch.zeros(channels, dtype=torch.bool)
+        mask[list(keep[group.name])] = True
+        for conv_name, bn_name in group.producers:
+            mask_for(out_masks, conv_name, channels)[:] = mask
+            if bn_name is not None:
+                mask_for(out_masks, bn_name, channels)[:] = mask
+        for conv_name, offset in group.consumers:
+            conv = model.get_submodule(conv_name)
+            mask_for(in_masks, conv_name, conv.in_channels)[offset:offset + channels] = mask
+
+    for name in set(out_masks) | set(in_masks):
+        _prune_module(model.get_submodule(name), out_mask=out_masks.get(name), in_mask=in_masks.get(name))
+    return model
+
+
+def prune_model(model, ratio, criterion="bn"):
+    """Prunes `ratio` of the channels of every group in place. Returns (model, plan for the checkpoint)."""
+    groups = prunable_groups(model)
+    keep = select_channels(model, groups, ratio, criterion)
+    apply_pruning(model, groups, keep)
+    return model, {"ratio": ratio, "criterion": criterion, "keep": keep}
+
+
+def restore_pruning(model, plan):
+    """Gives a freshly built model the shapes of a pruned checkpoint (its "pruning" entry) before loading weights."""
+    return apply_pruning(model, prunable_groups(model), plan["keep"])
+
+
+def finetune_loader(config, num_samples=None):
+    from dataloader import create_ultrasound_dataloaders
+
+    train_loader, _ = create_ultrasound_dataloaders(
+        image_dir=config.IMAGE_DIR,
+        label_dir=config.LABEL_DIR,
+        batch_size=config.BATCH_SIZE,
+        image_size=config.IMAGE_SIZE,
+        sequence_length=config.SEQUENCE_LENGTH,
+        use_augmentation=config.USE_AUGMENTATION
+    )
+    if num_samples:
+        train_loader = DataLoader(Subset(train_loader.dataset, range(min(num_samples, len(train_loader.dataset)))),
+                                  batch_size=train_loader.batch_size, shuffle=True, num_workers=train_loader.num_workers)
+    return train_loader
+
+
+def measure(model, config, example, threshold, repeats, test_limit):
+    """Parameters, GFLOPs, batch-1 latency and test IoU / Dice of an eval-mode model."""
+    from backends import time_backend
+    from benchmarks.common import count_flops, count_parameters, test_set_scores
+
+    model.eval()
+    with torch.no_grad():
+        row = {"params_m": count_parameters(model) / 1e6, "gflops": count_flops(model, example) / 1e9}
+        row["latency_ms"] = time_backend(model, example, repeats=repeats, warmup=1)["median_ms"]
+    scores = test_set_scores(model, config, threshold=threshold, limit=test_limit)
+    row.update({"IoU": scores["IoU"], "Dice": scores["Dice Coefficient"], "num_test_samples": scores["num_samples"]})
+    return row
+
+
+def main():
+    config = Config()
+    parser = argparse.ArgumentParser(description="Structured channel pruning + fine-tuning of a trained checkpoint.")
+    parser.add_argument("--checkpoint", default=os.path.join(config.CHECKPOINT_DIR, config.EXPERIMENT_NAME, "best.pth.tar"))
+    parser.add_argument("--ratios", type=float, nargs="+", default=[0.25, 0.5, 0.75],
+                        help="Fraction of the channels removed from every prunable layer.")
+    parser.add_argument("--criterion", default=config.PRUNE_CRITERION, choices=CRITERIA)
+    parser.add_argument("--finetune-epochs", type=int, default=config.PRUNE_FINETUNE_EPOCHS)
+    parser.add_argument("--finetune-samples", type=int, default=None, help="Fine-tune on the first N train samples only.")
+    parser.add_argument("--lr", type=float, default=config.LEARNING_RATE)
+    parser.add_argument("--test-limit", type=int, default=None, help="Evaluate on the first N test samples only.")
+    parser.add_argument("--repeats", type=int, default=10, help="Timed forward passes for the latency report.")
+    parser.add_argument("--output-dir", default=None, help="Default: the checkpoint's directory + /pruned.")
+    args = parser.parse_args()
+
+    if config.MODEL_NAME not in PRUNABLE_MODELS:
+        print(f"ERROR: Pruning supports {PRUNABLE_MODELS}, not {config.MODEL_NAME}.")
+        return
+
+    from benchmarks.common import print_table, save_results
+    from export import example_input
+    from loss.builders import get_loss_fn
+    from model.builders import get_model
+    from train import train_one_epoch
+    from utils import load_checkpoint, save_checkpoint
+    from torch.utils.tensorboard.writer import SummaryWriter
+
+    # Weights as trained (no BatchNorm folding: gamma is the saliency and fine-tuning needs the BNs)
+    model = get_model(config)
+    checkpoint = load_checkpoint(args.checkpoint, model, None, 0, config.DEVICE)
+    if checkpoint is None:
+        print(f"ERROR: Could not load checkpoint {args.checkpoint}. Cannot prune.")
+        return
+    threshold = config.THRESHOLD
+    if config.USE_CHECKPOINT_THRESHOLD and "threshold" in checkpoint:
+        threshold = float(checkpoint["threshold"])
+    output_dir = args.output_dir or os.path.join(os.path.dirname(args.checkpoint), "pruned")
+    example = example_input(config).to(config.DEVICE)
+    criterion = get_loss_fn(config)
+    train_loader = finetune_loader(config, args.finetune_samples) if args.finetune_epochs > 0 else None
+
+    rows = [{"ratio": 0.0, **measure(model, config, example, threshold, args.repeats, args.test_limit)}]
+    print(f"Unpruned: {rows[0]['params_m']:.2f}M params, {rows[0]['latency_ms']:.1f} ms, IoU {rows[0]['IoU']:.4f}")
+    for ratio in args.ratios:
+        pruned, plan = prune_model(copy.deepcopy(model), ratio, args.criterion)
+        row = {"ratio": ratio}
+        if args.finetune_epochs > 0:
+            row["IoU_before_finetune"] = measure(pruned, config, example, threshold, 1, args.test_limit)["IoU"]
+        optimizer = torch.optim.Adam(pruned.parameters(), lr=args.lr, weight_decay=config.WEIGHT_DECAY)
+        writer = SummaryWriter(log_dir=os.path.join(config.LOG_DIR, config.EXPERIMENT_NAME, f"pruned_{ratio:g}"))
+        for epoch in range(args.finetune_epochs):
+            train_one_epoch(pruned, optimizer, criterion, train_loader, epoch, config, writer)
+        writer.close()
+        row.update(measure(pruned, config, example, threshold, args.repeats, args.test_limit))
+        row["checkpoint"] = os.path.join(output_dir, f"pruned_{ratio:g}.pth.tar")
+        save_checkpoint(pruned, optimizer, row["checkpoint"], threshold=threshold, pruning=plan)
+        rows.append(row)
+        print(f"Ratio {ratio:g}: {row['params_m']:.2f}M params, {row['latency_ms']:.1f} ms, IoU {row['IoU']:.4f}")
+
+    print(f"\n--- Pruning {config.MODEL_NAME} ({args.criterion}, {args.finetune_epochs} fine-tune epochs) ---")
+    print_table(rows, ["ratio", "params_m", "gflops", "latency_ms", "IoU_before_finetune", "IoU", "Dice"])
+    save_results({"model_name": config.MODEL_NAME, "checkpoint": os.path.abspath(args.checkpoint),
+                  "criterion": args.criterion, "finetune_epochs": args.finetune_epochs, "threshold": threshold,
+                  "rows": rows}, os.path.join(output_dir, "prune_report.json"))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+# quantize.py
+# Post-training static int8 quantization (FX graph mode) with an accuracy / latency / size report vs. fp32.
+import argparse
+import copy
+import io
+import json
+import os
+import warnings
+
+import torch
+from torch.utils.data import DataLoader, Subset
+
+from config import Config
+from backends import TorchBackend, export_meta, export_paths, load_model_for_inference, time_backend
+from dataloader import create_ultrasound_dataloaders
+from export import example_input
+from test import evaluate, get_test_loader
+from loss.builders import get_loss_fn
+
+QUANTIZABLE_MODELS = ("SimpleUNetMini", "ResNet18CNN", "AttentionUNet")
+REPORT_METRICS = ["IoU", "Dice Coefficient", "Mean Hausdorff", "Max Hausdorff", "Accuracy", "BF Score", "ablation_area"]
+
+
+def calibration_batches(config, num_batches):
+    """Yields up to num_batches un-augmented image batches from the train loader."""
+    train_loader, _ = create_ultrasound_dataloaders(
+        image_dir=config.IMAGE_DIR,
+        label_dir=config.LABEL_DIR,
+        batch_size=config.BATCH_SIZE,
+        image_size=config.IMAGE_SIZE,
+        sequence_length=config.SEQUENCE_LENGTH,
+        use_augmentation=False
+    )
+    for batch_idx, (data, _, _) in enumerate(train_loader):
+        if batch_idx >= num_batches:
+            break
+        yield data
+
+
+def quantize_model(model, calibration_data, example, engine="x86"):
+    """
+    Static int8 quantization of an fp32 model (left untouched).
+
+    prepare_fx fuses Conv-BN(-ReLU) patterns and inserts observers, the observers
+    see the calibration batches, and convert_fx swaps in quantized kernels.
+    """
+    from torch.ao.quantization import get_default_qconfig_mapping
+    from torch.ao.quantization.quantize_fx import convert_fx, prepare_fx
+
+    torch.backends.quantized.engine = engine
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        prepared = prepare_fx(copy.deepcopy(model).eval(), get_default_qconfig_mapping(engine), (example,))
+        num_batches = 0
+        with torch.no_grad():
+            for data in calibration_data:
+                prepared(data)
+                num_batches += 1
+        quantized = convert_fx(prepared)
+    print(f"Calibrated on {num_batches} train batches.")
+    return quantized
+
+
+def serialized_size_mb(module, example):
+    """Size of the TorchScript-serialized module in MB."""
+    buffer = io.BytesIO()
+    with torch.no_grad(), warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        torch.jit.save(torch.jit.trace(module, example, check_trace=False), buffer)
+    return buffer.getbuffer().nbytes / 1e6
+
+
+def main():
+    config = Config()
+    parser = argparse.ArgumentParser(description="Static int8 quantization of a trained checkpoint.")
+    parser.add_argument("--checkpoint", default=os.path.join(config.CHECKPOINT_DIR, config.EXPERIMENT_NAME, "best.pth.tar"))
+    parser.add_argument("--calibration-batches", type=int, default=config.QUANT_CALIBRATION_BATCHES)
+    parser.add_argument("--engine", default="x86", choices=["x86", "fbgemm", "qnnpack", "onednn"])
+    parser.add_argument("--test-limit", type=int, default=None, help="Evaluate on the first N test samples only.")
+    parser.add_argument("--repeats", type=int, default=10, help="Timed forward passes for the latency report.")
+    args = parser.parse_args()
+
+    if config.MODEL_NAME not in QUANTIZABLE_MODELS:
+        print(f"ERROR: Quantization supports {QUANTIZABLE_MODELS}, not {config.MODEL_NAME}.")
+        return
+
+    config.DEVICE = "cpu" # quantized kernels are CPU-only
+    model, threshold = load_model_for_inference(args.checkpoint, config)
+    if model is None:
+        print(f"ERROR: Could not load checkpoint {args.checkpoint}. Cannot quantize.")
+        return
+    config.THRESHOLD = threshold
+    paths = export_paths(args.checkpoint)
+
+    # --- Quantize ---
+    example = example_input(config, batch_size=1)
+    quantized = quantize_model(model, calibration_batches(config, args.calibration_batches), example, engine=args.engine)
+    with torch.no_grad(), warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        torch.jit.save(torch.jit.trace(quantized, example, check_trace=False), paths["int8"])
+    print(f"Saved int8 TorchScript model to {paths['int8']}")
+    if not os.path.isfile(paths["meta"]):
+        with open(paths["meta"], "w") as f:
+            json.dump(export_meta(config, args.checkpoint, threshold), f, indent=2)
+
+    # --- Latency and size ---
+    latency = {precision: time_backend(TorchBackend(candidate), example, repeats=args.repeats) # both under no_grad
+               for precision, candidate in (("fp32", model), ("int8", quantized))}
+    size_mb = {"fp32": serialized_size_mb(model, example), "int8": os.path.getsize(paths["int8"]) / 1e6}
+
+    # --- Accuracy with the test.evaluate metrics ---
+    test_loader = get_test_loader(config)
+    if args.test_limit:
+        test_loader = DataLoader(Subset(test_loader.dataset, range(min(args.test_limit, len(test_loader.dataset)))),
+                                 batch_size=test_loader.batch_size, shuffle=False, num_workers=test_loader.num_workers)
+    criterion = get_loss_fn(config)
+    experiment_name = config.EXPERIMENT_NAME
+    metrics = {}
+    with torch.no_grad():
+        for precision, candidate in (("fp32", model), ("int8", quantized)):
+            config.EXPERIMENT_NAME = f"{experiment_name}_quant_{precision}" # keep test_results of the experiment intact
+            metrics[precision] = evaluate(candidate, test_loader, criterion, config)
+    config.EXPERIMENT_NAME = experiment_name
+
+    # --- Report ---
+    deltas = {key: metrics["int8"].get(key, float("nan")) - metrics["fp32"].get(key, float("nan"))
+              for key in REPORT_METRICS}
+    print(f"\n--- int8 vs fp32 ({config.MODEL_NAME}, {len(test_loader.dataset)} test samples) ---")
+    print(f"{'':<18} {'fp32':>10} {'int8':>10} {'delta':>10}")
+    print(f"{'Latency (ms)':<18} {latency['fp32']['median_ms']:>10.2f} {latency['int8']['median_ms']:>10.2f} "
+          f"{latency['int8']['median_ms'] - latency['fp32']['median_ms']:>+10.2f}")
+    print(f"{'Size (MB)':<18} {size_mb['fp32']:>10.2f} {size_mb['int8']:>10.2f} {size_mb['int8'] - size_mb['fp32']:>+10.2f}")
+    for key in REPORT_METRICS:
+        print(f"{key:<18} {metrics['fp32'].get(key, float('nan')):>10.4f} {metrics['int8'].get(key, float('nan')):>10.4f} {deltas[key]:>+10.4f}")
+
+    report = {
+        "model_name": config.MODEL_NAME,
+        "checkpoint": os.path.abspath(args.checkpoint),
+        "engine": args.engine,
+        "calibration_batches": args.calibration_batches,
+        "num_test_samples": len(test_loader.dataset),
+        "latency": latency,
+        "size_mb": size_mb,
+        "metrics": metrics,
+        "deltas": deltas,
+    }
+    with open(paths["int8_report"], "w") as f:
+        json.dump(report, f, indent=2, default=float)
+    print(f"\nSaved quantization report to {paths['int8_report']}")
+
+
+if __name__ == "__main__":
+    main()
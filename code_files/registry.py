@@ -0,0 +1,73 @@
+# registry.py
+# Name -> builder registries for models and losses. Entries name the class as a
+# "module:attribute" string and the module is only imported when that entry is
+# built, so picking one model never pays for the others' dependencies
+# (segmentation_models_pytorch, torchvision ResNet50, ...). The builders live in
+# model/builders.py and loss/builders.py, imported on first use of the registry.
+import importlib
+
+
+def import_target(target):
+    """Returns the attribute named by "package.module:Attribute", importing the module on first use."""
+    module_name, _, attribute = target.partition(":")
+    return getattr(importlib.import_module(module_name), attribute)
+
+
+class Registry:
+    """
+    Maps names (config.MODEL_NAME / config.LOSS_FN) to builders.
+
+    Register a builder for a lazily imported class with the decorator (in `builders_module`):
+
+        @MODELS.register("AttentionUNet", "model.attention_unet:AttentionUNet")
+        def build_attention_unet(cls, config):
+            return cls(in_channels=config.IN_CHANNELS, ...)
+
+    `build(name, config)` imports the class and calls builder(cls, config).
+    """
+    def __init__(self, kind, builders_module):
+        self.kind = kind
+        self.builders_module = builders_module
+        self._entries = {}
+        self._loaded = False
+
+    def _load(self):
+        """Imports the builders module once, which registers its entries."""
+        if not self._loaded:
+            self._loaded = True
+            importlib.import_module(self.builders_module)
+
+    def register(self, name, target):
+        def decorator(builder):
+            if name in self._entries:
+                raise ValueError(f"{self.kind} '{name}' is already registered")
+            self._entries[name] = (target, builder)
+            return builder
+        return decorator
+
+    def names(self):
+        self._load()
+        return list(self._entries)
+
+    def __contains__(self, name):
+        self._load()
+        return name in self._entries
+
+    def target(self, name):
+        """The "module:attribute" string of a registered name."""
+        if name not in self:
+            raise ValueError(f"Invalid or unsupported {self.kind} name in config: '{name}'. "
+                             f"Registered: {', '.join(self.names())}")
+        return self._entries[name][0]
+
+    def resolve(self, name):
+        """The registered class (imports its module)."""
+        return import_target(self.target(name))
+
+    def build(self, name, config):
+        cls = self.resolve(name)
+        return self._entries[name][1](cls, config)
+
+
+MODELS = Registry("model", "model.builders")
+LOSSES = Registry("loss function", "loss.builders")
@@ -2,7 +2,7 @@
 import subprocess
 import itertools
 import os
-from config import Config
+from config import Config, sequence_length_for
 
 # model_names = ["ResNet18CNN", "SimpleUNetMini","AttentionUNet", "DeepLabV3Plus", "ConvLSTM"]
 # loss_functions = ["DiceLoss", "DiceFocalLoss", "AsymmetricFocalTverskyLoss", "SoftIoULoss"]
@@ -14,7 +14,7 @@ for model_name, loss_fn in itertools.product(model_names, loss_functions):
     print(f"\n===== Running: Model = {model_name}, Loss = {loss_fn} =====")
 
     # Set SEQUENCE_LENGTH based on model
-    seq_len = 3 if model_name == "ConvLSTM" else 1
+    seq_len = sequence_length_for(model_name)
 
 
     # Build dynamic experiment name
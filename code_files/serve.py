@@ -0,0 +1,270 @@
+# serve.py
+# Local inference server: segmentation + ablation area over HTTP (TCP or Unix socket).
+# Concurrent single-frame requests are coalesced into micro-batches.
+import argparse
+import base64
+import io
+import json
+import os
+import queue
+import socketserver
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import cv2
+import torch
+from PIL import Image
+
+from config import Config
+from dataloader import preprocess_frame
+from backends import BACKENDS, load_inference_backend
+from predict import postprocess_predictions
+
+
+class _PendingFrame:
+    """One queued request; the batching thread fills `result` and sets `done`."""
+    __slots__ = ("image", "filename", "native_size", "enqueued_at", "done", "result", "error", "timings")
+
+    def __init__(self, image, filename, native_size):
+        self.image = image
+        self.filename = filename
+        self.native_size = native_size
+        self.enqueued_at = time.perf_counter()
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.timings = {}
+
+
+class MicroBatcher:
+    """
+    Coalesces concurrent frames into batches for one model.
+
+    A batch is dispatched as soon as it holds `max_batch_size` frames or the
+    oldest frame has waited `max_wait_ms`, whichever comes first. A single
+    thread owns the model, so no locking is needed around the forward pass.
+    """
+    def __init__(self, model, config, threshold, max_batch_size=16, max_wait_ms=10.0):
+        self.model = model
+        self.config = config
+        self.threshold = threshold
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self._queue = queue.Queue()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="micro-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, image, filename, native_size, timeout=None):
+        """Blocks until the frame has been processed. Returns (record, timings) or raises."""
+        pending = _PendingFrame(image, filename, native_size)
+        self._queue.put(pending)
+        if not pending.done.wait(timeout):
+            raise TimeoutError("Timed out waiting for the model")
+        if pending.error is not None:
+            raise pending.error
+        return pending.result, pending.timings
+
+    def close(self):
+        self._stopped.set()
+        self._queue.put(None)
+        self._thread.join()
+
+    def _collect_batch(self):
+        first = self._queue.get()
+        if first is None:
+            return []
+        batch = [first]
+        deadline = first.enqueued_at + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                self._stopped.set()
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        while not self._stopped.is_set():
+            batch = self._collect_batch()
+            if not batch:
+                continue
+            started = time.perf_counter()
+            try:
+                with torch.no_grad():
+                    data = torch.stack([item.image for item in batch]).to(self.config.DEVICE)
+                    pred_logits = self.model(data).cpu()
+                inferred = time.perf_counter()
+                records = postprocess_predictions(
+                    pred_logits, [item.filename for item in batch], [item.native_size for item in batch],
+                    self.config, self.threshold, keep_masks=True
+                )
+                finished = time.perf_counter()
+                for item, record in zip(batch, records):
+                    item.result = record
+                    item.timings = {
+                        "queue_ms": (started - item.enqueued_at) * 1000.0,
+                        "inference_ms": (inferred - started) * 1000.0,
+                        "postprocess_ms": (finished - inferred) * 1000.0,
+                        "batch_size": len(batch),
+                    }
+            except Exception as e:
+                for item in batch:
+                    item.error = e
+            finally:
+                for item in batch:
+                    item.done.set()
+
+
+class InferenceRequestHandler(BaseHTTPRequestHandler):
+    """
+    GET  /health                     -> {"status": "ok", "model": ...}
+    POST /segment?filename=..&mask=1 -> JSON record for one JPG/PNG frame sent as the request body.
+
+    The response carries ablation_area (mm^2), component stats, an optional
+    base64 PNG mask and a latency breakdown in milliseconds.
+    """
+    server_version = "BubbleSegmentationServer/1.0"
+
+    def address_string(self):
+        # Unix-socket clients have no (host, port) address
+        return self.client_address[0] if isinstance(self.client_address, tuple) and self.client_address else "unix"
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if urlparse(self.path).path == "/health":
+            self._send_json(200, {"status": "ok", "model": self.server.config.MODEL_NAME,
+                                  "threshold": self.server.batcher.threshold})
+        else:
+            self._send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        received = time.perf_counter()
+        url = urlparse(self.path)
+        if url.path != "/segment":
+            self._send_json(404, {"error": "not found"})
+            return
+        params = parse_qs(url.query)
+        filename = params.get("filename", ["frame.jpg"])[0]
+        want_mask = params.get("mask", ["0"])[0] in ("1", "true", "yes")
+
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            image = Image.open(io.BytesIO(self.rfile.read(length)))
+            image_tensor, native_size = preprocess_frame(image, self.server.config.IMAGE_SIZE, self.server.config.IN_CHANNELS)
+        except Exception as e:
+            self._send_json(400, {"error": f"could not decode image: {e}"})
+            return
+        decoded = time.perf_counter()
+
+        try:
+            record, timings = self.server.batcher.submit(image_tensor, filename, native_size, timeout=self.server.request_timeout)
+        except Exception as e:
+            self._send_json(500, {"error": str(e)})
+            return
+        returned = time.perf_counter()
+
+        mask = record.pop("mask")
+        if want_mask:
+            ok, png = cv2.imencode(".png", mask * 255)
+            record["mask_png"] = base64.b64encode(png.tobytes()).decode("ascii") if ok else None
+        encoded = time.perf_counter()
+
+        record["latency"] = {
+            "decode_ms": (decoded - received) * 1000.0,
+            **timings,
+            "encode_ms": (encoded - returned) * 1000.0,
+            "total_ms": (encoded - received) * 1000.0,
+        }
+        self._send_json(200, record)
+
+
+class _ServerMixin:
+    daemon_threads = True
+
+    def setup_inference(self, batcher, config, request_timeout=60.0, verbose=False):
+        self.batcher = batcher
+        self.config = config
+        self.request_timeout = request_timeout
+        self.verbose = verbose
+
+
+class InferenceHTTPServer(_ServerMixin, ThreadingHTTPServer):
+    pass
+
+
+class InferenceUnixServer(_ServerMixin, socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    pass
+
+
+def create_server(batcher, config, host=None, port=None, unix_socket=None, verbose=False):
+    """Builds a threaded HTTP server bound to TCP host:port or to a Unix socket path."""
+    if unix_socket:
+        if os.path.exists(unix_socket):
+            os.remove(unix_socket)
+        server = InferenceUnixServer(unix_socket, InferenceRequestHandler)
+    else:
+        server = InferenceHTTPServer((host or config.SERVE_HOST, config.SERVE_PORT if port is None else port), InferenceRequestHandler)
+    server.setup_inference(batcher, config, verbose=verbose)
+    return server
+
+
+def main():
+    config = Config()
+    parser = argparse.ArgumentParser(description="Serve segmentation / ablation area requests with micro-batching.")
+    parser.add_argument("--checkpoint", default=os.path.join(config.CHECKPOINT_DIR, config.EXPERIMENT_NAME, "best.pth.tar"))
+    parser.add_argument("--host", default=config.SERVE_HOST)
+    parser.add_argument("--port", type=int, default=config.SERVE_PORT)
+    parser.add_argument("--unix-socket", default=None, help="Listen on this Unix socket path instead of TCP.")
+    parser.add_argument("--max-batch-size", type=int, default=config.SERVE_MAX_BATCH_SIZE)
+    parser.add_argument("--max-wait-ms", type=float, default=config.SERVE_MAX_WAIT_MS)
+    parser.add_argument("--backend", choices=BACKENDS, default="torch")
+    parser.add_argument("--threshold", type=float, default=None)
+    parser.add_argument("--verbose", action="store_true", help="Log every request.")
+    args = parser.parse_args()
+
+    if config.SEQUENCE_LENGTH > 1:
+        print(f"ERROR: {config.MODEL_NAME} needs {config.SEQUENCE_LENGTH}-frame sequences; the server handles single frames.")
+        return
+
+    model, threshold = load_inference_backend(args.backend, args.checkpoint, config)
+    if model is None:
+        print(f"ERROR: Could not load checkpoint {args.checkpoint}. Cannot start server.")
+        return
+    if args.threshold is not None:
+        threshold = args.threshold
+
+    batcher = MicroBatcher(model, config, threshold, max_batch_size=args.max_batch_size, max_wait_ms=args.max_wait_ms)
+    server = create_server(batcher, config, host=args.host, port=args.port, unix_socket=args.unix_socket, verbose=args.verbose)
+    where = args.unix_socket or f"http://{args.host}:{args.port}"
+    print(f"Serving {config.MODEL_NAME} ({args.backend}) on {where} (max batch {args.max_batch_size}, max wait {args.max_wait_ms} ms, threshold {threshold:.4f})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\nShutting down.")
+    finally:
+        server.server_close()
+        batcher.close()
+        if args.unix_socket and os.path.exists(args.unix_socket):
+            os.remove(args.unix_socket)
+
+
+if __name__ == "__main__":
+    main()
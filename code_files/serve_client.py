@@ -0,0 +1,165 @@
+# serve_client.py
+# Load generator for serve.py: concurrent single-frame requests, reports p50/p99 latency and throughput.
+import argparse
+import http.client
+import json
+import os
+import socket
+import threading
+import time
+from urllib.parse import quote
+
+import numpy as np
+
+from config import Config
+from predict import resolve_image_files
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    """HTTPConnection over a Unix socket path."""
+    def __init__(self, socket_path, timeout=60):
+        super().__init__("localhost", timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+
+def make_connection(host, port, unix_socket=None, timeout=60):
+    if unix_socket:
+        return UnixHTTPConnection(unix_socket, timeout=timeout)
+    return http.client.HTTPConnection(host, port, timeout=timeout)
+
+
+def segment(connection, image_bytes, filename, want_mask=False):
+    """Sends one frame to /segment on an open connection. Returns the decoded JSON response."""
+    path = f"/segment?filename={quote(filename)}&mask={int(want_mask)}"
+    connection.request("POST", path, body=image_bytes, headers={"Content-Type": "image/jpeg"})
+    response = connection.getresponse()
+    payload = json.loads(response.read())
+    if response.status != 200:
+        raise RuntimeError(f"HTTP {response.status}: {payload.get('error')}")
+    return payload
+
+
+def run_load(frames, num_requests, concurrency, host, port, unix_socket=None, warmup=0):
+    """
+    Sends `num_requests` frames from `concurrency` client threads (each one
+    keeps a persistent connection and sends its next frame as soon as the
+    previous response arrives).
+
+    Returns:
+        dict: client latencies, server latency breakdowns and the wall-clock duration
+        from the first non-warmup request to the last response.
+    """
+    lock = threading.Lock()
+    counter = {"next": 0}
+    client_ms, server_latency, errors = [], [], []
+
+    def worker():
+        connection = make_connection(host, port, unix_socket)
+        try:
+            while True:
+                with lock:
+                    idx = counter["next"]
+                    counter["next"] += 1
+                    if idx == warmup: # throughput is measured from the first non-warmup request
+                        counter["measured_from"] = time.perf_counter()
+                if idx >= num_requests + warmup:
+                    return
+                filename, image_bytes = frames[idx % len(frames)]
+                started = time.perf_counter()
+                try:
+                    payload = segment(connection, image_bytes, filename)
+                except Exception as e:
+                    with lock:
+                        errors.append(str(e))
+                    connection.close()
+                    connection = make_connection(host, port, unix_socket)
+                    continue
+                elapsed = (time.perf_counter() - started) * 1000.0
+                if idx >= warmup:
+                    with lock:
+                        client_ms.append(elapsed)
+                        server_latency.append(payload["latency"])
+        finally:
+            connection.close()
+
+    threads = [threading.Thread(target=worker) for _ in range(max(1, concurrency))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    finished = time.perf_counter()
+    return {"client_ms": client_ms, "server_latency": server_latency, "errors": errors,
+            "duration_s": finished - counter.get("measured_from", finished)}
+
+
+def summarize(results, concurrency):
+    """Percentiles of client latency, throughput and mean server-side breakdown."""
+    latencies = np.array(results["client_ms"])
+    summary = {"concurrency": concurrency, "requests": int(len(latencies)), "errors": len(results["errors"])}
+    if len(latencies) == 0:
+        return summary
+    summary.update({
+        "throughput_fps": len(latencies) / results["duration_s"],
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p90_ms": float(np.percentile(latencies, 90)),
+        "p99_ms": float(np.percentile(latencies, 99)),
+        "mean_ms": float(latencies.mean()),
+    })
+    for key in ("decode_ms", "queue_ms", "inference_ms", "postprocess_ms", "encode_ms", "total_ms", "batch_size"):
+        values = [entry[key] for entry in results["server_latency"] if key in entry]
+        if values:
+            summary[f"server_{key}_mean"] = float(np.mean(values))
+    return summary
+
+
+def main():
+    config = Config()
+    parser = argparse.ArgumentParser(description="Load generator for serve.py.")
+    parser.add_argument("inputs", nargs="+", help="Directories and/or glob patterns of .jpg frames to send.")
+    parser.add_argument("--host", default=config.SERVE_HOST)
+    parser.add_argument("--port", type=int, default=config.SERVE_PORT)
+    parser.add_argument("--unix-socket", default=None)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16],
+                        help="One run per value (number of concurrent clients).")
+    parser.add_argument("--warmup", type=int, default=10, help="Requests per run excluded from the statistics.")
+    parser.add_argument("--output", default=None, help="Optional JSON report path.")
+    args = parser.parse_args()
+
+    image_files = resolve_image_files(args.inputs)
+    if not image_files:
+        print(f"ERROR: No .jpg frames found for {args.inputs}")
+        return
+    frames = []
+    for path in image_files[:256]:  # a small, in-memory pool is enough for load generation
+        with open(path, "rb") as f:
+            frames.append((os.path.basename(path), f.read()))
+
+    report = []
+    print(f"{'clients':>8} {'req':>6} {'fps':>8} {'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9} {'batch':>6} {'queue':>8} {'infer':>8}")
+    for concurrency in args.concurrency:
+        results = run_load(frames, args.requests, concurrency, args.host, args.port, args.unix_socket, warmup=args.warmup)
+        summary = summarize(results, concurrency)
+        report.append(summary)
+        if summary["requests"] == 0:
+            print(f"{concurrency:>8} no successful requests ({summary['errors']} errors)")
+            continue
+        print(f"{concurrency:>8} {summary['requests']:>6} {summary['throughput_fps']:>8.2f} {summary['p50_ms']:>9.1f} "
+              f"{summary['p90_ms']:>9.1f} {summary['p99_ms']:>9.1f} {summary.get('server_batch_size_mean', 0):>6.2f} "
+              f"{summary.get('server_queue_ms_mean', 0):>8.1f} {summary.get('server_inference_ms_mean', 0):>8.1f}")
+        if summary["errors"]:
+            print(f"         {summary['errors']} errors, first: {results['errors'][0]}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Saved load test report to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
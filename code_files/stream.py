@@ -0,0 +1,149 @@
+# stream.py
+# Stateful streaming inference for ConvLSTM: one recurrent step per incoming frame,
+# hidden state carried across frames and reset at pulse-series boundaries.
+import argparse
+import csv
+import os
+import re
+
+import torch
+from PIL import Image
+from tqdm import tqdm
+
+from config import Config
+from backends import load_model_for_inference
+from dataloader import preprocess_frame
+from metric import GroupedMetricAggregator
+from predict import FILENAME_PATTERN, FRAME_FIELDS, postprocess_predictions, resolve_image_files, save_pulse_summary
+
+
+def series_key(filename):
+    """
+    (experiment_id, dataset_idx, pulse_count) parsed from t3US<pulses>_<experiment>_<dataset>.jpg.
+    A pulse series is one (experiment_id, dataset_idx); unparseable names get their own series.
+    """
+    match = re.match(FILENAME_PATTERN, os.path.basename(filename))
+    if not match:
+        return (os.path.basename(filename), -1, -1)
+    return (match.group(2), int(match.group(3)), int(match.group(1)))
+
+
+def ordered_frame_source(image_paths):
+    """
+    Yields (filename, PIL image) in acquisition order: grouped by series, increasing pulse count.
+    Images are opened lazily, one at a time.
+    """
+    for path in sorted(image_paths, key=series_key):
+        with Image.open(path) as image:
+            image.load()
+            yield os.path.basename(path), image
+
+
+class StreamingSegmenter:
+    """
+    Wraps a model exposing `step(frame, state) -> (logits, state)` (ConvLSTM).
+
+    Each call costs one initial-CNN pass plus one cell update per layer instead
+    of a full SEQUENCE_LENGTH window. State is dropped whenever the series
+    changes or the pulse count does not increase (a new pulse series started).
+    """
+    def __init__(self, model, device="cpu"):
+        if not hasattr(model, "step"):
+            raise TypeError(f"{type(model).__name__} has no step() API; streaming needs a recurrent model (ConvLSTM).")
+        self.model = model.eval()
+        self.device = device
+        self.reset()
+
+    def reset(self):
+        self.state = None
+        self.current_series = None
+        self.last_pulses = None
+        self.frames_in_series = 0
+
+    def __call__(self, frame, filename):
+        """frame: (C, H, W) or (1, C, H, W) tensor. Returns (1, K, H, W) logits on the CPU."""
+        experiment_id, dataset_idx, pulses = series_key(filename)
+        series = (experiment_id, dataset_idx)
+        if series != self.current_series or (self.last_pulses is not None and pulses <= self.last_pulses):
+            self.state = None
+            self.current_series = series
+            self.frames_in_series = 0
+        self.last_pulses = pulses
+
+        if frame.ndim == 3:
+            frame = frame.unsqueeze(0)
+        with torch.no_grad():
+            logits, self.state = self.model.step(frame.to(self.device), self.state)
+        self.frames_in_series += 1
+        return logits.cpu()
+
+
+def run_stream(segmenter, frames, config, output_dir, threshold, save_masks=True):
+    """
+    Streams (filename, PIL image) frames through the segmenter, writing the same
+    per-frame CSV / per-pulse summary / masks as predict.py as each frame arrives.
+
+    Returns:
+        int: Number of frames processed.
+    """
+    mask_dir = os.path.join(output_dir, "masks") if save_masks else None
+    if mask_dir:
+        os.makedirs(mask_dir, exist_ok=True)
+    frames_path = os.path.join(output_dir, "ablation_area_per_frame.csv")
+    summary_path = os.path.join(output_dir, "ablation_area_per_pulse.csv")
+    grouped = GroupedMetricAggregator()
+    num_frames = 0
+
+    with open(frames_path, "w", newline="") as frames_file:
+        frames_writer = csv.DictWriter(frames_file, fieldnames=FRAME_FIELDS + ["frames_in_series"])
+        frames_writer.writeheader()
+        for filename, image in tqdm(frames, desc="Streaming"):
+            frame, native_size = preprocess_frame(image, config.IMAGE_SIZE, config.IN_CHANNELS)
+            logits = segmenter(frame, filename)
+            record = postprocess_predictions(logits, [filename], [native_size], config, threshold, mask_dir)[0]
+            record["frames_in_series"] = segmenter.frames_in_series
+            frames_writer.writerow(record)
+            frames_file.flush()
+            grouped.update((record["pulses"], record["experiment_id"], record["dataset_idx"]), record)
+            num_frames += 1
+            if segmenter.frames_in_series == 1 and num_frames > 1:
+                save_pulse_summary(grouped, summary_path) # refresh the summary whenever a series ends
+
+    save_pulse_summary(grouped, summary_path)
+    print(f"Streamed {num_frames} frames; results in {frames_path}")
+    return num_frames
+
+
+def main():
+    config = Config()
+    parser = argparse.ArgumentParser(description="Stateful streaming ConvLSTM inference over an ordered frame source.")
+    parser.add_argument("inputs", nargs="+", help="Directories and/or glob patterns of .jpg frames.")
+    parser.add_argument("--checkpoint", default=os.path.join(config.CHECKPOINT_DIR, config.EXPERIMENT_NAME, "best.pth.tar"))
+    parser.add_argument("--output-dir", default=os.path.join(config.PREDICT_OUTPUT_DIR, config.EXPERIMENT_NAME, "stream"))
+    parser.add_argument("--threshold", type=float, default=None)
+    parser.add_argument("--no-masks", action="store_true")
+    args = parser.parse_args()
+
+    image_files = resolve_image_files(args.inputs)
+    if not image_files:
+        print(f"ERROR: No .jpg frames found for {args.inputs}")
+        return
+
+    model, threshold = load_model_for_inference(args.checkpoint, config)
+    if model is None:
+        print(f"ERROR: Could not load checkpoint {args.checkpoint}. Cannot stream.")
+        return
+    if args.threshold is not None:
+        threshold = args.threshold
+
+    try:
+        segmenter = StreamingSegmenter(model, device=config.DEVICE)
+    except TypeError as e:
+        print(f"ERROR: {e}")
+        return
+    os.makedirs(args.output_dir, exist_ok=True)
+    run_stream(segmenter, ordered_frame_source(image_files), config, args.output_dir, threshold, save_masks=not args.no_masks)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,7 +2,6 @@
 import torch
 import os
 import numpy as np
-import matplotlib.pyplot as plt
 import pandas as pd
 from tqdm import tqdm
 from datetime import datetime
@@ -11,16 +10,22 @@ from PIL import Image # Needed for BILINEAR/NEAREST constants if used directly
 from torchvision import transforms # Needed by dataloader functions
 import cv2
 import re
+import json
 from glob import glob
 # Import necessary components
 from config import Config
-from model import *
-from loss import *
-from metric import calculate_all_metrics
+from metric import MetricAccumulator, ThresholdSweep, GroupedMetricAggregator, compute_sample_stats, metrics_from_stats
+from evaluator import PipelinedEvaluator
+from visualization import VisualizationWriter
+from tiling import TiledInference
+from optimize import optimize_from_config
+from prediction_cache import PredictionCache, PredictionCacheWriter, cache_dir
+from label_features import LabelFeatureStore, sample_label_files
 # Import the SINGLE dataset class and transforms from your dataloader.py
 from dataloader import UltrasoundSegmentationDataset, JointTransform, Resize, Grayscale, PILToTensor # <- Correct Import
-from train import get_model, get_loss_fn, load_checkpoint # Reuse functions from train.py
-from utils import plot_metrics_vs_pulses, plot_ablation_area_comparison,postprocess_mask, to_grayscale_numpy
+from model.builders import get_model
+from loss.builders import get_loss_fn
+from utils import load_checkpoint, plot_metrics_vs_pulses, plot_ablation_area_comparison, postprocess_batch
 
 # Suppress specific warnings if needed
 warnings.filterwarnings("ignore", message="Mean of empty slice")
@@ -34,9 +39,10 @@ def get_test_loader(config):
 
     # --- Define the same joint transform function used in training ---
     def joint_transform_fn(image, label):
-        # Resize first
-        image = image.resize(config.IMAGE_SIZE, Image.BILINEAR)
-        label = label.resize(config.IMAGE_SIZE, Image.NEAREST)
+        # Resize first (tiled inference keeps native resolution)
+        if not config.TILED_INFERENCE:
+            image = image.resize(config.IMAGE_SIZE, Image.BILINEAR)
+            label = label.resize(config.IMAGE_SIZE, Image.NEAREST)
         # Convert to Grayscale if needed
         if config.IN_CHANNELS == 1:
              image = image.convert('L')
@@ -72,150 +78,296 @@ def get_test_loader(config):
 
     test_loader = torch.utils.data.DataLoader(
         dataset,
-        batch_size=1, # Keep batch_size=1 for sample-wise visualization/saving
+        batch_size=config.TEST_BATCH_SIZE, # evaluate() splits batches back into per-sample records
         shuffle=False,
         num_workers=getattr(config, 'NUM_WORKERS', 2)
     )
     print(f"Test loader created with {len(dataset)} samples.")
     return test_loader
 
-def extract_2d_slice(tensor):
-    """Extracts a 2D NumPy slice from a tensor (handling B, C, H, W)."""
-    if tensor is None: return np.zeros((50,50)) # Handle None input
-    np_img = tensor.detach().cpu().numpy()
-    # Remove Batch and Channel dims if they are 1
-    while np_img.ndim > 2 and np_img.shape[0] == 1:
-        np_img = np_img[0]
-    # If still more than 2D (like C=1 remains), squeeze it
-    while np_img.ndim > 2 and np_img.shape[0] == 1: # Squeeze channel if present
-         np_img = np_img.squeeze(0)
-
-    if np_img.ndim != 2:
-        print(f"Warning: extract_2d_slice received unexpected final shape {np_img.shape}. Check tensor processing.")
-        # Attempt a final squeeze just in case
+def score_test_batch(pred_logits, target, filenames, config, first_idx=0, filename_pattern=r't3US(\d+)_(\d+)_(\d+)',
+                     target_boundary=None, target_distance=None):
+    """
+    Metric worker job for one test batch, decomposed into per-sample records.
+
+    Stats are computed for the whole batch at once and then sliced per sample,
+    so every record is identical to what a batch_size=1 pass would produce.
+    `target_boundary` / `target_distance` (ground-truth boundary maps and their
+    distance transforms) may come from the label feature store or be shared
+    when the same ground truth is scored for several models.
+
+    Returns:
+        list: One (record for individual_metrics.csv, per-sample stats from
+              compute_sample_stats, (pulses, experiment_id, dataset_idx) group key)
+              tuple per sample whose metrics could be computed.
+    """
+    try:
+        batch_stats = compute_sample_stats(pred_logits, target.float(), threshold=config.THRESHOLD,
+                                           target_boundary=target_boundary, target_distance=target_distance)
+        pred_binary = (torch.sigmoid(pred_logits) > config.THRESHOLD).float()
+        component_stats = None
+        if config.APPLY_POSTPROCESSING:
+            pred_binary, component_stats = postprocess_batch(pred_binary, min_size=config.MIN_COMPONENT_SIZE,
+                                                             num_workers=config.POSTPROCESS_NUM_WORKERS)
+        pred_areas = pred_binary.flatten(1).sum(dim=1).numpy()
+    except Exception as e:
+        print(f"Error calculating metrics for test samples {first_idx+1}-{first_idx+len(filenames)}: {e}")
+        return []
+
+    results = []
+    for i, filename in enumerate(filenames):
+        # Extract number of pulses from filename
+        match = re.match(filename_pattern, filename)
+        pulses = int(match.group(1)) * 20 if match else None
+        group_key = (pulses, match.group(2), int(match.group(3))) if match else (None, None, None)
+
+        # Compute metrics and ablation area
         try:
-            np_img = np.squeeze(np_img)
-            if np_img.ndim != 2: return np.zeros((50,50)) # Give up if still not 2D
-        except:
-            return np.zeros((50,50)) # Return dummy if squeeze fails
-    return np_img
-
-def evaluate(model, test_loader, criterion, config):
-    """Evaluates the model on the test set and saves visualizations."""
-    model.eval()
-    sample_metrics_list = []
-    total_test_loss = 0.0
+            sample_stats = {key: value[i:i + 1] for key, value in batch_stats.items()}
+            metrics = metrics_from_stats(sample_stats)
+            metrics['pulses'] = pulses
+            metrics['filename'] = filename
+            metrics['post_processed'] = config.APPLY_POSTPROCESSING
+
+            if component_stats is not None:
+                metrics['num_components'] = component_stats[i]['num_components']
+                metrics['largest_component_area'] = component_stats[i]['largest_area'] * config.PIXEL_AREA_MM2
+
+            # Compute ablation area from (post-processed) prediction
+            metrics['ablation_area'] = float(pred_areas[i]) * config.PIXEL_AREA_MM2
+
+            results.append((metrics, sample_stats, group_key))
+        except Exception as e:
+            print(f"Error calculating metrics for test sample {first_idx+i+1} ({filename}): {e}")
+    return results
+
+class TestRun:
+    """
+    Per-model state of one pass over the test set: per-sample records, metric
+    accumulator, threshold sweep, running loss and the visualization writer.
+
+    `evaluate` drives one TestRun; multi_eval.py drives several over the same
+    batches. Results are written under test_results/<config.EXPERIMENT_NAME>.
+    """
+    def __init__(self, config, criterion, grouped_metrics=None, save_visualizations=True):
+        self.config = config
+        self.criterion = criterion
+        self.grouped_metrics = grouped_metrics
+        self.sample_metrics_list = []
+        self.metric_accumulator = MetricAccumulator()
+        self.threshold_sweep = ThresholdSweep(num_bins=config.THRESHOLD_SWEEP_BINS)
+        self.pulses_sum, self.pulses_count = 0.0, 0
+        self.ablation_area_sum, self.ablation_area_count = 0.0, 0
+        self.total_test_loss = 0.0
+        self.num_loss_samples = 0
+
+        self.results_dir = os.path.join("test_results", config.EXPERIMENT_NAME)
+        os.makedirs(self.results_dir, exist_ok=True)
+        self.vis_writer = None
+        if save_visualizations:
+            vis_folder = os.path.join(self.results_dir, "visualizations")
+            print(f"Saving visualizations to: {vis_folder}")
+            self.vis_writer = VisualizationWriter(vis_folder, num_workers=config.VIS_NUM_WORKERS)
+
+    def score(self, *args, **kwargs):
+        """Evaluator job: score_test_batch tagged with this run, so one evaluator can serve several runs."""
+        return self, score_test_batch(*args, **kwargs)
+
+    def add_batch(self, evaluator, pred_logits, data, target, filenames, first_idx, target_boundary=None, target_distance=None):
+        """Loss, threshold sweep and visualizations now; metrics are submitted to `evaluator`."""
+        # Per-sample loss, so Test_Loss is the same mean as with batch_size=1
+        for i in range(pred_logits.shape[0]):
+            self.total_test_loss += self.criterion(pred_logits[i:i + 1], target[i:i + 1]).item()
+            self.num_loss_samples += 1
+
+        # Metrics, postprocessing and ablation area run on a worker thread
+        # while the next batch goes through the model.
+        collect_results(evaluator.submit(self.score, pred_logits.cpu(), target.cpu(), list(filenames), self.config,
+                                         first_idx, target_boundary=target_boundary, target_distance=target_distance))
+        self.threshold_sweep.update(pred_logits, target)
+
+        if self.vis_writer is not None:
+            pred_binary = (torch.sigmoid(pred_logits) > self.config.THRESHOLD).float()
+            data_vis = data[:, -1] if data.ndim == 5 else data
+            for i, filename in enumerate(filenames):
+                base_filename, _ = os.path.splitext(filename)
+                self.vis_writer.save_panel(f"{base_filename}_pred.png", data_vis[i].cpu(), target[i].cpu(), pred_binary[i].cpu())
+
+    def collect(self, batch_results):
+        for metrics, sample_stats, group_key in batch_results:
+            self.sample_metrics_list.append(metrics)
+            if self.grouped_metrics is not None:
+                TP, _, _, FN = sample_stats["counts"].sum(axis=0)
+                gt_ablation_area = (TP + FN) * self.config.PIXEL_AREA_MM2
+                self.grouped_metrics.update(group_key, {**metrics, "gt_ablation_area": gt_ablation_area})
+            self.metric_accumulator.update_from_stats(sample_stats)
+            if metrics['pulses'] is not None:
+                self.pulses_sum += metrics['pulses']
+                self.pulses_count += 1
+            self.ablation_area_sum += metrics['ablation_area']
+            self.ablation_area_count += 1
+
+    def finish(self):
+        """Flushes visualizations, writes individual_metrics.csv / threshold curves and returns the averages."""
+        if self.vis_writer is not None:
+            self.vis_writer.close()
+
+        # Save individual metrics clearly for further plotting
+        metrics_df = pd.DataFrame(self.sample_metrics_list)
+        metrics_csv_path = os.path.join(self.results_dir, "individual_metrics.csv")
+        metrics_df.to_csv(metrics_csv_path, index=False)
+        print(f"Saved individual sample metrics to {metrics_csv_path}")
+
+        # Metric curves over all thresholds from the same pass (informational only:
+        # the operating point itself is picked on validation and read from the checkpoint)
+        if self.threshold_sweep.num_samples > 0:
+            save_threshold_curves(self.threshold_sweep, self.config)
+
+        # Aggregate average metrics
+        if self.metric_accumulator.num_samples == 0:
+            print("ERROR: No metrics calculated.")
+            return {"Test_Loss": self.total_test_loss / self.num_loss_samples if self.num_loss_samples > 0 else 0.0}
+
+        avg_metrics = self.metric_accumulator.compute()
+        avg_metrics["pulses"] = self.pulses_sum / self.pulses_count if self.pulses_count > 0 else np.nan
+        avg_metrics["ablation_area"] = self.ablation_area_sum / self.ablation_area_count
+        avg_metrics["Test_Loss"] = self.total_test_loss / self.num_loss_samples
+        return avg_metrics
+
+    def abort(self, exc_type, exc_value, traceback):
+        if self.vis_writer is not None:
+            self.vis_writer.__exit__(exc_type, exc_value, traceback)
+
+def collect_results(completed):
+    """Routes finished TestRun.score jobs back to their runs."""
+    for run, batch_results in completed:
+        run.collect(batch_results)
+
+def label_feature_store(config, dataset):
+    """(LabelFeatureStore, label file per sample) for the test set, or (None, None) if disabled / unavailable."""
+    label_files = sample_label_files(dataset) if config.USE_LABEL_FEATURE_STORE else None
+    if label_files is None:
+        return None, None
+    return LabelFeatureStore(dataset.label_dir, config.LABEL_FEATURE_DIR), label_files
+
+def ground_truth_maps(label_store, label_files, first_idx, target):
+    """
+    (target_boundary, target_distance) for the batch starting at sample first_idx,
+    looked up in the label feature store; (None, None) if there is no store or
+    the labels do not match the target resolution.
+    """
+    if label_store is None:
+        return None, None
+    return label_store.batch_maps(label_files[first_idx:first_idx + target.shape[0]], target.shape[-2:])
+
+def iter_test_batches(test_loader, config, desc="Testing"):
+    """
+    Yields (data, target, filenames, first_idx) on config.DEVICE, skipping malformed batches.
+    first_idx is the running sample index used in error messages.
+    """
     num_batches = len(test_loader)
-    if num_batches == 0:
+    num_seen_samples = 0
+    expected_dims = 5 if config.SEQUENCE_LENGTH > 1 else 4
+    for idx, batch_data in enumerate(tqdm(test_loader, desc=desc)):
+        if not isinstance(batch_data, (list, tuple)) or len(batch_data) != 3:
+            print(f"Warning: Skipping malformed test batch {idx+1}/{num_batches}.")
+            continue
+
+        data, target, filenames = batch_data
+        first_idx = num_seen_samples
+        num_seen_samples += len(filenames)
+        data, target = data.to(config.DEVICE), target.to(config.DEVICE)
+        if data.ndim != expected_dims:
+            print(f"Warning: Test Batch {idx+1}: Unexpected INPUT data dimension. Got {data.ndim}, expected {expected_dims}. Skipping batch.")
+            continue
+        if target.ndim != 4:
+            print(f"Warning: Test Batch {idx+1}: Unexpected TARGET dimension. Got {target.ndim}, expected 4. Skipping batch.")
+            continue
+        yield data, target, filenames, first_idx
+
+def evaluate(model, test_loader, criterion, config, grouped_metrics=None, cache_writer=None):
+    """
+    Evaluates the model on the test set and saves visualizations.
+
+    If a GroupedMetricAggregator is passed, it is filled with streaming per
+    (pulses, experiment_id, dataset_idx) statistics of every per-sample metric,
+    the predicted ablation area and the ground-truth ablation area.
+    If a PredictionCacheWriter is passed, every batch's logits and targets are
+    appended to it for `evaluate_cached`.
+    """
+    model.eval()
+    if len(test_loader) == 0:
         print("ERROR: Test loader has 0 batches. Cannot evaluate.")
         return {}
 
-    vis_folder = os.path.join("test_results", config.EXPERIMENT_NAME, "visualizations")
-    os.makedirs(vis_folder, exist_ok=True)
-    print(f"Saving visualizations to: {vis_folder}")
-
-    filename_pattern = r't3US(\d+)_(\d+)_(\d+)'
-
-    with torch.no_grad():
-        for idx, batch_data in enumerate(tqdm(test_loader, desc="Testing")):
-            if not isinstance(batch_data, (list, tuple)) or len(batch_data) != 3:
-                print(f"Warning: Skipping malformed test batch {idx+1}/{num_batches}.")
-                continue
-
-            data, target, filename = batch_data 
-            filename = filename[0]  # batch_size=1
-            data, target = data.to(config.DEVICE), target.to(config.DEVICE)
-            expected_dims = 5 if config.SEQUENCE_LENGTH > 1 else 4
-            if data.ndim != expected_dims:
-                print(f"Warning: Test Batch {idx+1}: Unexpected INPUT data dimension. Got {data.ndim}, expected {expected_dims}. Skipping batch.")
-                continue
-            if target.ndim != 4:
-                print(f"Warning: Test Batch {idx+1}: Unexpected TARGET dimension. Got {target.ndim}, expected 4. Skipping batch.")
-                continue
-
-            # Forward pass and compute loss
-            pred_logits = model(data)
-            loss = criterion(pred_logits, target)
-            total_test_loss += loss.item()
-
-            # Extract number of pulses from filename
-            match = re.match(filename_pattern, filename)
-            pulses = int(match.group(1)) * 20 if match else None
-
-            # Compute metrics and ablation area
-            try:
-                # pred_prob = torch.sigmoid(pred_logits)
-                # pred_binary = (pred_prob > 0.5).float()
-
-                pred_prob = torch.sigmoid(pred_logits)
-                pred_binary = (pred_prob > 0.5).float()
-
-                if config.APPLY_POSTPROCESSING:
-                    pred_binary = postprocess_mask(pred_binary[0], min_size=config.MIN_COMPONENT_SIZE)
-                    pred_binary = pred_binary.unsqueeze(0)  # back to [B, 1, H, W]
-
-                metrics = calculate_all_metrics(pred_logits, target.float(), threshold=0.5)
-                metrics['pulses'] = pulses
-                metrics['filename'] = filename
-                metrics['post_processed'] = config.APPLY_POSTPROCESSING
-
-
-                # Compute ablation area from prediction
-                pred_np = extract_2d_slice(pred_binary)
-                pixel_area_mm2 = 0.0025  # Adjust if needed
-                ablation_area = np.sum(pred_np) * pixel_area_mm2
-                metrics['ablation_area'] = ablation_area
-
-                sample_metrics_list.append(metrics)
-            except Exception as e:
-                print(f"Error calculating metrics for test batch {idx+1}: {e}")
-
-
-            # Visualization preparation
-            pred_prob = torch.sigmoid(pred_logits)
-            pred_binary = (pred_prob > 0.5).float()
-
-            data_vis = data[:, -1] if data.ndim == 5 else data
-            img_np = extract_2d_slice(data_vis)
-            gt_np = extract_2d_slice(target)
-            pred_np = extract_2d_slice(pred_binary)
-
-            # Save visualizations with clear filename
-            try:
-                fig, axs = plt.subplots(1, 3, figsize=(12, 4))
-                axs[0].imshow(to_grayscale_numpy(img_np), cmap='gray', vmin=0, vmax=1); axs[0].set_title("Input Image")
-                axs[1].imshow(to_grayscale_numpy(gt_np), cmap='gray', vmin=0, vmax=1); axs[1].set_title("Ground Truth")
-                axs[2].imshow(to_grayscale_numpy(pred_np), cmap='gray', vmin=0, vmax=1); axs[2].set_title("Prediction")
-                for ax in axs: ax.axis("off")
-                plt.suptitle(f"{filename}", fontsize=10)
-                plt.tight_layout(rect=[0, 0.03, 1, 0.95])
-
-                base_filename, _ = os.path.splitext(filename)
-                plt.savefig(os.path.join(vis_folder, f"{base_filename}_pred.png"), dpi=150, bbox_inches='tight')
-            except Exception as e:
-                print(f"Error saving visualization for sample {idx+1}: {e}")
-            finally:
-                plt.close(fig)
-
-    # Save individual metrics clearly for further plotting
-    metrics_df = pd.DataFrame(sample_metrics_list)
-    metrics_csv_path = os.path.join("test_results", config.EXPERIMENT_NAME, "individual_metrics.csv")
-    metrics_df.to_csv(metrics_csv_path, index=False)
-    print(f"Saved individual sample metrics to {metrics_csv_path}")
-
-    # Aggregate average metrics
-    if not sample_metrics_list:
-        print("ERROR: No metrics calculated.")
-        return {"Test_Loss": total_test_loss / num_batches if num_batches > 0 else 0.0}
+    run = TestRun(config, criterion, grouped_metrics=grouped_metrics)
+    label_store, label_files = label_feature_store(config, test_loader.dataset)
+    evaluator = PipelinedEvaluator(num_workers=config.EVAL_NUM_WORKERS, max_pending=config.EVAL_MAX_PENDING)
+    try:
+        with torch.no_grad(), evaluator:
+            for data, target, filenames, first_idx in iter_test_batches(test_loader, config):
+                # Forward pass for the whole batch
+                pred_logits = model(data)
+                if cache_writer is not None:
+                    cache_writer.append(pred_logits, target, filenames)
+                target_boundary, target_distance = ground_truth_maps(label_store, label_files, first_idx, target)
+                run.add_batch(evaluator, pred_logits, data, target, filenames, first_idx,
+                              target_boundary=target_boundary, target_distance=target_distance)
+            collect_results(evaluator.drain())
+    except BaseException as e:
+        run.abort(type(e), e, e.__traceback__)
+        raise
+
+    return run.finish()
+
+def evaluate_cached(cache, criterion, config, grouped_metrics=None):
+    """
+    `evaluate` on the predictions stored in a PredictionCache instead of a model.
+
+    Threshold, postprocessing, pixel area and grouping come from `config`, so
+    any of them can change between runs. No visualizations are written (the
+    cache holds no images). With a "probs" cache the probabilities, and hence
+    Test_Loss, are resolved to 1/255.
+    """
+    if len(cache) == 0:
+        print("ERROR: Prediction cache is empty. Cannot evaluate.")
+        return {}
 
-    numeric_cols = metrics_df.select_dtypes(include=[np.number]).columns
-    avg_metrics = metrics_df[numeric_cols].mean(axis=0, skipna=True).to_dict()
-    avg_metrics["Test_Loss"] = total_test_loss / num_batches
+    run = TestRun(config, criterion, grouped_metrics=grouped_metrics, save_visualizations=False)
+    evaluator = PipelinedEvaluator(num_workers=config.EVAL_NUM_WORKERS, max_pending=config.EVAL_MAX_PENDING)
+    with torch.no_grad(), evaluator:
+        for pred_logits, target, filenames, first_idx in tqdm(cache.batches(config.TEST_BATCH_SIZE), desc="Scoring cached predictions",
+                                                              total=-(-len(cache) // config.TEST_BATCH_SIZE)):
+            run.add_batch(evaluator, pred_logits, None, target, filenames, first_idx)
+        collect_results(evaluator.drain())
 
-    return avg_metrics
+    return run.finish()
 
 # --- save_metrics_to_csv and main remain the same ---
 
+def save_grouped_metrics(grouped_metrics, config):
+    """Saves the streaming per-group aggregates so reports can be rebuilt without the per-sample CSV."""
+    grouped_path = os.path.join("test_results", config.EXPERIMENT_NAME, "grouped_metrics.json")
+    with open(grouped_path, "w") as f:
+        json.dump(grouped_metrics.state_dict(), f)
+    print(f"Saved grouped metrics to {grouped_path}")
+
+def save_threshold_curves(threshold_sweep, config):
+    """Saves micro and macro Dice/IoU/Precision/Recall vs. threshold curves to CSV."""
+    micro = threshold_sweep.curves("micro")
+    macro = threshold_sweep.curves("macro")
+    curves_df = pd.DataFrame({
+        "Threshold": micro["Threshold"],
+        **{k: v for k, v in micro.items() if k != "Threshold"},
+        **{f"{k} (Macro)": v for k, v in macro.items() if k != "Threshold"},
+    })
+    curves_path = os.path.join("test_results", config.EXPERIMENT_NAME, "threshold_curves.csv")
+    curves_df.to_csv(curves_path, index=False)
+
+    best_threshold, best_score = threshold_sweep.best_threshold(config.THRESHOLD_CRITERION, config.THRESHOLD_AVERAGE)
+    print(f"Saved threshold curves to {curves_path} "
+          f"(test-set optimum for {config.THRESHOLD_CRITERION}: {best_threshold:.4f} -> {best_score:.4f}, used: {config.THRESHOLD:.4f})")
+
 def save_metrics_to_csv(metrics, config):
     """Saves the aggregated test metrics to a CSV file."""
     results_dir = os.path.join("test_results", config.EXPERIMENT_NAME)
@@ -236,7 +388,12 @@ def save_metrics_to_csv(metrics, config):
     file_exists = os.path.isfile(csv_path)
     # Define header dynamically based on keys present in row_data
     header = list(row_data.keys())
-    df.to_csv(csv_path, mode='a', header=not file_exists, index=False, columns=header)
+    if file_exists and list(pd.read_csv(csv_path, nrows=0).columns) != header:
+        # Columns changed (e.g. rows written before the "(micro)" columns): rewrite the file with all of them
+        existing = pd.read_csv(csv_path, dtype=str, keep_default_na=False)
+        pd.concat([existing, df], ignore_index=True).to_csv(csv_path, index=False)
+    else:
+        df.to_csv(csv_path, mode='a', header=not file_exists, index=False, columns=header)
     print(f"Saved test metrics summary to {csv_path}")
 
 
@@ -256,24 +413,58 @@ def main():
 
     try:
         test_loader = get_test_loader(config)
-        model = get_model(config)
         criterion = get_loss_fn(config)
     except (AttributeError, ValueError, FileNotFoundError, ImportError) as e:
         print(f"Error during setup: {e}")
         print("Please check config.py, data paths, dataloader.py, and model/loss definitions.")
         return
 
-    # --- Load Checkpoint ---
     checkpoint_path = os.path.join(config.CHECKPOINT_DIR, config.EXPERIMENT_NAME, "best.pth.tar")
-    if os.path.isfile(checkpoint_path):
-        load_checkpoint(checkpoint_path, model, None, 0, config.DEVICE) # Pass None for optimizer
-    else:
+    if not os.path.isfile(checkpoint_path):
         print(f"ERROR: No checkpoint found at {checkpoint_path}. Cannot run evaluation.")
         return
 
+    # On a prediction cache hit the model is never run, so it is not built either
+    cache_path = cache_dir(config, checkpoint_path, test_loader.dataset) if config.PREDICTION_CACHE != "off" else None
+    cache_hit = cache_path is not None and PredictionCache.exists(cache_path)
+
+    # --- Load Checkpoint ---
+    if cache_hit:
+        checkpoint = torch.load(checkpoint_path, map_location="cpu") # only the threshold is needed
+    else:
+        try:
+            model = get_model(config)
+        except (AttributeError, ValueError, ImportError) as e:
+            print(f"Error during setup: {e}")
+            print("Please check config.py and the model definitions.")
+            return
+        checkpoint = load_checkpoint(checkpoint_path, model, None, 0, config.DEVICE) # Pass None for optimizer
+    if config.USE_CHECKPOINT_THRESHOLD and checkpoint is not None and "threshold" in checkpoint:
+        config.THRESHOLD = float(checkpoint["threshold"])
+        print(f"Using decision threshold from checkpoint: {config.THRESHOLD:.4f}")
+    else:
+        print(f"Using decision threshold from config: {config.THRESHOLD:.4f}")
+
+    if not cache_hit:
+        model = optimize_from_config(model.eval(), config)
+        if config.TILED_INFERENCE:
+            print(f"Tiled inference at native resolution: tile {config.TILE_SIZE}, overlap {config.TILE_OVERLAP}")
+            model = TiledInference.from_config(model, config)
+
     # --- Evaluate ---
     print("\n--- Starting Evaluation ---")
-    final_metrics = evaluate(model, test_loader, criterion, config)
+    grouped_metrics = GroupedMetricAggregator()
+    if cache_hit:
+        print(f"Re-scoring cached predictions from {cache_path} (model is not run)")
+        final_metrics = evaluate_cached(PredictionCache(cache_path), criterion, config, grouped_metrics=grouped_metrics)
+    elif cache_path is not None:
+        meta = {"checkpoint": os.path.abspath(checkpoint_path), "model_name": config.MODEL_NAME,
+                "test_image_dir": os.path.abspath(config.TEST_IMAGE_DIR)}
+        with PredictionCacheWriter(cache_path, len(test_loader.dataset), mode=config.PREDICTION_CACHE, meta=meta) as cache_writer:
+            final_metrics = evaluate(model, test_loader, criterion, config, grouped_metrics=grouped_metrics,
+                                     cache_writer=cache_writer)
+    else:
+        final_metrics = evaluate(model, test_loader, criterion, config, grouped_metrics=grouped_metrics)
 
     # --- Print and Save Results ---
     print("\n--- Average Test Metrics ---")
@@ -286,14 +477,16 @@ def main():
         #  Assessment of the histotripsy pulse-dependence for the accuracy, Dice Similarity Coefficient, and Hausdorff distance (maximum and mean). 
         metrics_csv_path = os.path.join("test_results", config.EXPERIMENT_NAME, "individual_metrics.csv")
         save_dir = os.path.join("test_results", config.EXPERIMENT_NAME)
-        plot_metrics_vs_pulses(metrics_csv_path, save_dir, config.EXPERIMENT_NAME)
+        save_grouped_metrics(grouped_metrics, config)
+        plot_metrics_vs_pulses(metrics_csv_path, save_dir, config.EXPERIMENT_NAME, grouped_metrics=grouped_metrics)
         mask_dir = config.TEST_LABEL_DIR
         plot_ablation_area_comparison(
             mask_folder=mask_dir,
             cnn_metrics_path=metrics_csv_path,
             save_path=save_dir,
             experiment_name=config.EXPERIMENT_NAME,
-            pixel_area_mm2=0.0025  # Adjust if needed
+            pixel_area_mm2=config.PIXEL_AREA_MM2,
+            grouped_metrics=grouped_metrics
         )
     else:
         print("Evaluation completed, but no metrics were calculated (check errors above).")
@@ -0,0 +1,103 @@
+# tiling.py
+# Sliding-window inference at native resolution: overlapping tiles, Gaussian-weighted blending.
+import torch
+import torch.nn.functional as F
+
+
+def tile_starts(length, tile, stride):
+    """Start offsets so that tiles of `tile` pixels every `stride` pixels cover [0, length)."""
+    if length <= tile:
+        return [0]
+    starts = list(range(0, length - tile + 1, stride))
+    if starts[-1] != length - tile:
+        starts.append(length - tile)  # last tile flush with the border
+    return starts
+
+
+def gaussian_weight_map(tile_h, tile_w, sigma_scale=0.125, min_weight=1e-3):
+    """(tile_h, tile_w) blending weights, 1 at the tile centre and decaying towards the borders."""
+    def window(n):
+        coords = torch.arange(n, dtype=torch.float32) - (n - 1) / 2.0
+        w = torch.exp(-0.5 * (coords / max(n * sigma_scale, 1e-6)) ** 2)
+        return w / w.max()
+    return (window(tile_h)[:, None] * window(tile_w)[None, :]).clamp_min(min_weight)
+
+
+def sliding_window_inference(model, data, tile_size, overlap=0.25, tile_batch_size=4, weight_map=None):
+    """
+    Runs `model` over overlapping tiles of `data` and blends the tile logits.
+
+    Args:
+        model: Callable mapping (N, C, th, tw) [or (N, T, C, th, tw)] to (N, K, th, tw) logits.
+        data (torch.Tensor): (B, C, H, W) or (B, T, C, H, W) at native resolution.
+        tile_size (tuple): (width, height), same convention as Config.IMAGE_SIZE.
+        overlap (float): Fraction of a tile shared with its neighbour, in [0, 1).
+        tile_batch_size (int): Tiles per forward pass; bounds peak activation memory.
+        weight_map (torch.Tensor, optional): (th, tw) blending weights. Default: Gaussian.
+
+    Returns:
+        torch.Tensor: (B, K, H, W) logits at the input resolution (on data's device).
+    """
+    tile_w, tile_h = tile_size
+    height, width = data.shape[-2:]
+    batch_size = data.shape[0]
+
+    # Frames smaller than a tile are zero-padded and cropped back at the end
+    pad_h, pad_w = max(0, tile_h - height), max(0, tile_w - width)
+    if pad_h or pad_w:
+        data = F.pad(data, (0, pad_w, 0, pad_h))
+    padded_h, padded_w = data.shape[-2:]
+
+    stride_h = max(1, int(round(tile_h * (1.0 - overlap))))
+    stride_w = max(1, int(round(tile_w * (1.0 - overlap))))
+    windows = [(y, x) for y in tile_starts(padded_h, tile_h, stride_h) for x in tile_starts(padded_w, tile_w, stride_w)]
+
+    if weight_map is None:
+        weight_map = gaussian_weight_map(tile_h, tile_w)
+    weight_map = weight_map.to(data.device)
+    weight_sum = torch.zeros(padded_h, padded_w, device=data.device)
+    for y, x in windows:
+        weight_sum[y:y + tile_h, x:x + tile_w] += weight_map
+
+    output = None
+    jobs = [(b, y, x) for b in range(batch_size) for y, x in windows]
+    with torch.no_grad():
+        for start in range(0, len(jobs), max(1, tile_batch_size)):
+            chunk = jobs[start:start + tile_batch_size]
+            tiles = torch.stack([data[b, ..., y:y + tile_h, x:x + tile_w] for b, y, x in chunk])
+            logits = model(tiles)
+            if output is None:
+                output = torch.zeros(batch_size, logits.shape[1], padded_h, padded_w, device=data.device)
+            for (b, y, x), tile_logits in zip(chunk, logits.to(data.device)):
+                output[b, :, y:y + tile_h, x:x + tile_w] += tile_logits * weight_map
+
+    return (output / weight_sum)[..., :height, :width]
+
+
+class TiledInference:
+    """
+    Wraps a model (or inference backend) so that calling it runs sliding-window inference.
+
+    Drop-in for the model in test.evaluate / predict.predict when frames are kept
+    at native resolution; a frame that is exactly one tile gives the model's
+    plain output.
+    """
+    def __init__(self, model, tile_size, overlap=0.25, tile_batch_size=4):
+        self.model = model
+        self.tile_size = tuple(tile_size)
+        self.overlap = overlap
+        self.tile_batch_size = tile_batch_size
+        self.weight_map = gaussian_weight_map(self.tile_size[1], self.tile_size[0])
+
+    @classmethod
+    def from_config(cls, model, config):
+        return cls(model, config.TILE_SIZE, overlap=config.TILE_OVERLAP, tile_batch_size=config.TILE_BATCH_SIZE)
+
+    def eval(self):
+        if hasattr(self.model, "eval"):
+            self.model.eval()
+        return self
+
+    def __call__(self, data):
+        return sliding_window_inference(self.model, data, self.tile_size, overlap=self.overlap,
+                                        tile_batch_size=self.tile_batch_size, weight_map=self.weight_map)
@@ -2,30 +2,21 @@
 import torch
 import torch.optim as optim
 import numpy as np
-import matplotlib.pyplot as plt
 import os
-from torch.utils.tensorboard.writer import SummaryWriter  # Import TensorBoard
 from tqdm import tqdm
 import pandas as pd # Import pandas for easier metrics aggregation
 import warnings
 import csv # Import csv module
 from datetime import datetime # For timestamping logs
 from config import Config
-from model import * # Imports __init__.py which should import all model classes
-from loss import *  # Imports __init__.py which should import all loss classes
+from model.builders import get_model # Models and losses are imported when built
+from loss.builders import get_loss_fn
 # Import the consolidated metrics function
-from metric import calculate_all_metrics
+from metric import MetricAccumulator, ThresholdSweep, compute_sample_stats
+from evaluator import PipelinedEvaluator
+from visualization import prediction_panel, panel_grid, write_png
 from dataloader import create_ultrasound_dataloaders
-from utils import freeze_resnet_layers, to_grayscale_numpy
-from utils import initialize_weights 
-from utils import EarlyStopping
-
-early_stopper = EarlyStopping(
-    patience=Config.PATIENCE,
-    monitor='val_iou',
-    mode='max',  # use 'min' if you're monitoring a loss
-    path='best_model.pt'
-)
+from utils import EarlyStopping, save_checkpoint
 
 
 
@@ -34,133 +25,11 @@ warnings.filterwarnings("ignore", message="Mean of empty slice")
 warnings.filterwarnings("ignore", category=RuntimeWarning)
 
 
-def get_model(config):
-    """Initializes the model based on the configuration."""
-    model_name = config.MODEL_NAME
-    in_channels = config.IN_CHANNELS
-    num_classes = config.NUM_CLASSES
-
-    print(f"--- Initializing Model: {model_name} ---")
-    print(f"Input Channels: {in_channels}, Num Classes: {num_classes}")
-
-    if model_name == "ResNet18CNN":
-        model = ResNet18CNN(
-            in_channels=in_channels,
-            num_classes=num_classes,
-            pretrained=config.PRETRAINED,
-            dropout_prob=config.DROPOUT_PROB  # <== Pass this
-        )
-        print(f"ResNet18CNN - Pretrained: {config.PRETRAINED}, Dropout: {config.DROPOUT_PROB}")
-
-        if config.FREEZE_BACKBONE:
-            freeze_resnet_layers(model, freeze_until=config.FREEZE_UNTIL)
-            print(f"Freezing ResNet layers up to: {config.FREEZE_UNTIL}")
-        elif model_name == "AttentionUNet":
-            model = AttentionUNet(
-                in_channels=in_channels,
-                num_classes=num_classes
-            )
-
-    elif model_name == "DeepLabV3Plus":
-        model = DeepLabV3Plus(
-            in_channels=in_channels,
-            num_classes=num_classes,
-            output_stride=config.DEEPLAB_OUTPUT_STRIDE, # Read from config
-            pretrained=config.PRETRAINED              # Read from config
-        )
-        print(f"DeepLabV3+ - Output Stride: {config.DEEPLAB_OUTPUT_STRIDE}, Pretrained: {config.PRETRAINED}")
-
-    elif model_name == "AttentionUNet":
-        model = AttentionUNet(
-            in_channels=in_channels,
-            num_classes=num_classes
-        )
-        
-    elif model_name == "ConvLSTM":
-        # Ensure dataloader.py provides sequential data (B, T, C, H, W)
-        # Ensure config.SEQUENCE_LENGTH > 1
-        if config.SEQUENCE_LENGTH <= 1:
-             raise ValueError("SEQUENCE_LENGTH must be > 1 in config.py to use ConvLSTM.")
-    
-        num_lstm_layers = len(config.CONVLSTM_HIDDEN_DIMS)
-        if len(config.CONVLSTM_KERNEL_SIZES) == 1:
-            kernel_sizes = config.CONVLSTM_KERNEL_SIZES * num_lstm_layers
-            print(f"ConvLSTM - Using kernel size {config.CONVLSTM_KERNEL_SIZES[0]} for all {num_lstm_layers} layers.")
-        elif len(config.CONVLSTM_KERNEL_SIZES) == num_lstm_layers:
-            kernel_sizes = config.CONVLSTM_KERNEL_SIZES
-            print(f"ConvLSTM - Using specific kernel sizes: {kernel_sizes}")
-        else:
-            raise ValueError("Config error: CONVLSTM_KERNEL_SIZES must have length 1 or match length of CONVLSTM_HIDDEN_DIMS")
-    
-        model = ConvLSTM( # This is ConvLSTMSeq aliased
-            in_channels=in_channels,
-            hidden_dims=config.CONVLSTM_HIDDEN_DIMS,
-            kernel_sizes=kernel_sizes,
-            num_classes=num_classes,
-            initial_cnn_out_channels=config.CONVLSTM_INITIAL_CNN_OUT_CHANNELS,
-            batch_first=config.CONVLSTM_BATCH_FIRST
-        )
-        print(f"ConvLSTM - Hidden Dims: {config.CONVLSTM_HIDDEN_DIMS}, Initial CNN Out: {config.CONVLSTM_INITIAL_CNN_OUT_CHANNELS}, Batch First: {config.CONVLSTM_BATCH_FIRST}")
-    elif model_name == "SimpleUNetMini":
-        model = SimpleUNetMini(
-            in_channels=in_channels,
-            num_classes=num_classes
-        )
-    elif model_name == "HRNetBinary":
-        model = HRNetBinary(
-            in_channels=in_channels,
-            num_classes=num_classes
-        )
-        print(f"HRNetBinary - In Channels: {in_channels}, Num Classes: {num_classes}")
-
-    else:
-        raise ValueError(f"Invalid or unsupported model name in config: '{model_name}'")
-
-
-    print("--- Model Initialized ---")
-    # initialize_weights(model)  # <--- Add this line
-    if not config.PRETRAINED:
-        initialize_weights(model)
-
-    return model.to(config.DEVICE)
-
-
-def get_loss_fn(config):
-    """Initializes the loss function based on the configuration."""
-    loss_fn_name = config.LOSS_FN
-    print(f"--- Initializing Loss Function: {loss_fn_name} ---")
-
-    if loss_fn_name == "DiceFocalLoss":
-        dice_w = getattr(config, 'LOSS_DICE_WEIGHT', 0.5)
-        focal_w = getattr(config, 'LOSS_FOCAL_WEIGHT', 0.5)
-        gamma = getattr(config, 'LOSS_GAMMA', 2.0) # Gamma specific to focal part
-        smooth = getattr(config, 'LOSS_SMOOTH', 1e-5)
-        criterion = DiceFocalLoss(dice_weight=dice_w, focal_weight=focal_w, gamma=gamma, smooth=smooth)
-        print(f"DiceFocalLoss Params - DiceW: {dice_w}, FocalW: {focal_w}, Gamma: {gamma}, Smooth: {smooth}")
-
-    elif loss_fn_name == "DiceLoss":
-        smooth = getattr(config, 'LOSS_SMOOTH', 1e-5)
-        criterion = DiceLoss(smooth=smooth)
-        print(f"DiceLoss Params - Smooth: {smooth}")
-
-    elif loss_fn_name == "AsymmetricFocalTverskyLoss":
-        alpha = getattr(config, 'LOSS_ALPHA', 0.3)
-        beta = getattr(config, 'LOSS_BETA', 0.7)
-        gamma_tversky = getattr(config, 'LOSS_GAMMA', 0.75) # Gamma specific to Tversky focal
-        smooth = getattr(config, 'LOSS_SMOOTH', 1e-5)
-        criterion = AsymmetricFocalTverskyLoss(alpha=alpha, beta=beta, gamma=gamma_tversky, smooth=smooth)
-        print(f"AsymmetricFocalTverskyLoss Params - Alpha: {alpha}, Beta: {beta}, Gamma: {gamma_tversky}, Smooth: {smooth}")
-    elif loss_fn_name == 'SoftIoULoss':
-        smooth = getattr(config, 'LOSS_SMOOTH', 1e-5) # Use the common smooth parameter
-        criterion = SoftIoULoss(smooth=smooth)
-        print(f"SoftIoULoss Params - Smooth: {smooth}")  
-    else:
-        raise ValueError(f"Invalid loss function name in config: '{loss_fn_name}'")
-
-    print("--- Loss Function Initialized ---")
-    return criterion
-
-def train_one_epoch(model, optimizer, criterion, train_loader, epoch, config, writer):
+def train_one_epoch(model, optimizer, criterion, train_loader, epoch, config, writer, teacher=None):
+    """
+    One pass over train_loader; returns the average loss. With a teacher
+    (distill.TeacherLogits), the criterion also gets the teacher's logits for the batch.
+    """
     model.train()
     loop = tqdm(train_loader, desc=f"Epoch {epoch+1}/{config.NUM_EPOCHS} (Train)")
     total_loss = 0
@@ -197,21 +66,24 @@ def train_one_epoch(model, optimizer, criterion, train_loader, epoch, config, wr
 
 
         # --- Input Shape Check (especially relevant if ConvLSTM is added back) ---
-        expected_dims = 5 if config.MODEL_NAME == "ConvLSTM" else 4
+        expected_dims = 5 if config.SEQUENCE_LENGTH > 1 else 4
         if data.ndim != expected_dims:
             print(f"Warning: Epoch {epoch+1}, Batch {batch_idx+1}: Unexpected input data dimension. Got {data.ndim}, expected {expected_dims} for model {config.MODEL_NAME}. Skipping batch.")
             continue
-        expected_target_dims = 4 if config.MODEL_NAME != "ConvLSTM" else 5
+        expected_target_dims = 5 if config.SEQUENCE_LENGTH > 1 else 4
         if targets.ndim != expected_target_dims:
             print(f"Warning: Epoch {epoch+1}, Batch {batch_idx+1}: Unexpected target dimension. Got {targets.ndim}, expected {expected_target_dims} for model {config.MODEL_NAME}. Skipping batch.")
             continue
         # --- End Shape Check ---
-        if config.MODEL_NAME == "ConvLSTM":
+        if config.SEQUENCE_LENGTH > 1:
             targets = targets[:, -1, :, :]
 
         optimizer.zero_grad()                         # 1. Clear old gradients
         predictions = model(data)                     # 2. Forward pass
-        loss = criterion(predictions, targets)        # 3. Compute loss
+        if teacher is not None:                       # 3. Compute loss (+ soft targets when distilling)
+            loss = criterion(predictions, targets, teacher(data, filename))
+        else:
+            loss = criterion(predictions, targets)
         loss.backward()                               # 4. Compute gradients (now they're populated!)
         torch.nn.utils.clip_grad_norm_(model.parameters(), max_norm=1.0)  # 5. Now clip them
         optimizer.step()                              # 6. Update weights
@@ -226,14 +98,32 @@ def train_one_epoch(model, optimizer, criterion, train_loader, epoch, config, wr
     writer.add_scalar("Loss/Train", avg_loss, epoch)
     return avg_loss
 
-def validate_one_epoch(model, criterion, val_loader, epoch, config, writer):
+def _validation_batch_stats(predictions, targets, threshold, batch_idx):
+    """Metric worker job: per-sample stats for one validation batch (None on failure)."""
+    try:
+        return compute_sample_stats(predictions, targets, threshold=threshold)
+    except Exception as e:
+        print(f"Error calculating metrics for validation batch {batch_idx+1}: {e}")
+        return None
+
+def validate_one_epoch(model, criterion, val_loader, epoch, config, writer, threshold_sweep=None):
+    """
+    Runs validation and returns (avg_val_loss, metrics dict). If a ThresholdSweep
+    is passed, it is filled with this epoch's probability histograms.
+    """
     model.eval()
     loop = tqdm(val_loader, desc=f"Epoch {epoch+1}/{config.NUM_EPOCHS} (Validation)")
-    batch_metrics_list = [] # Store metrics dict from each batch
+    metric_accumulator = MetricAccumulator() # Running epoch-level confusion counts and per-sample sums
     total_val_loss = 0.0
     num_batches = len(val_loader)
 
-    with torch.no_grad():
+    def accumulate(stats_list):
+        for stats in stats_list:
+            if stats is not None:
+                metric_accumulator.update_from_stats(stats)
+
+    evaluator = PipelinedEvaluator(num_workers=config.EVAL_NUM_WORKERS, max_pending=config.EVAL_MAX_PENDING)
+    with torch.no_grad(), evaluator:
         for batch_idx, batch_data in enumerate(loop):
             # Ensure batch has both data and targets
             if not isinstance(batch_data, (list, tuple)) or len(batch_data) != 3:
@@ -264,12 +154,12 @@ def validate_one_epoch(model, criterion, val_loader, epoch, config, writer):
                 break
 
             # --- Input Shape Check ---
-            expected_dims = 5 if config.MODEL_NAME == "ConvLSTM" else 4
+            expected_dims = 5 if config.SEQUENCE_LENGTH > 1 else 4
             if data.ndim != expected_dims:
                 print(f"Warning: Epoch {epoch+1}, Val Batch {batch_idx+1}: Unexpected input data dimension. Got {data.ndim}, expected {expected_dims} for model {config.MODEL_NAME}. Skipping batch.")
                 continue
             
-            expected_target_dims = 5 if config.MODEL_NAME == "ConvLSTM" else 4
+            expected_target_dims = 5 if config.SEQUENCE_LENGTH > 1 else 4
             if targets.ndim != expected_target_dims:
                 print(f"Warning: Epoch {epoch+1}, Val Batch {batch_idx+1}: Unexpected target dimension. Got {targets.ndim}, expected {expected_target_dims} for model {config.MODEL_NAME}. Skipping batch.")
                 continue
@@ -278,7 +168,7 @@ def validate_one_epoch(model, criterion, val_loader, epoch, config, writer):
             # if config.MODEL_NAME == "ConvLSTM":
             #     targets = targets[:, -1, :, :]
 
-            if config.MODEL_NAME == "ConvLSTM":
+            if config.SEQUENCE_LENGTH > 1:
                 targets = targets[:, -1, :, :]
 
             # if targets.ndim == 3:
@@ -298,25 +188,23 @@ def validate_one_epoch(model, criterion, val_loader, epoch, config, writer):
             loss = criterion(predictions, targets)
             total_val_loss += loss.item()
 
-            # --- Calculate all metrics for the current batch ---
-            try:
-                batch_metrics = calculate_all_metrics(predictions, targets, threshold=0.5)
-                batch_metrics_list.append(batch_metrics)
-            except Exception as e:
-                print(f"Error calculating metrics for validation batch {batch_idx+1}: {e}")
-                # Optionally append NaNs or skip this batch for metrics calculation
+            # --- Hand the batch to a metric worker; the next forward pass runs meanwhile ---
+            accumulate(evaluator.submit(_validation_batch_stats, predictions.cpu(), targets.cpu(), config.THRESHOLD, batch_idx))
+            if threshold_sweep is not None:
+                threshold_sweep.update(predictions, targets)
 
             # Update tqdm loop with batch loss
             loop.set_postfix(loss=loss.item())
 
+        accumulate(evaluator.drain())
+
     # --- Aggregate Metrics Across Batches ---
-    if not batch_metrics_list: # Handle case where no valid batches were processed
+    if metric_accumulator.num_samples == 0: # Handle case where no valid batches were processed
          print("Warning: No metrics calculated during validation.")
          # Return default/empty values to avoid crashing main loop
          return (total_val_loss / num_batches if num_batches > 0 else 0.0), {}
 
-    metrics_df = pd.DataFrame(batch_metrics_list)
-    avg_metrics_dict = metrics_df.mean(axis=0).to_dict()
+    avg_metrics_dict = metric_accumulator.compute()
     avg_val_loss = total_val_loss / num_batches if num_batches > 0 else 0.0
 
     # --- Log Metrics to TensorBoard ---
@@ -330,37 +218,6 @@ def validate_one_epoch(model, criterion, val_loader, epoch, config, writer):
 
     return avg_val_loss, avg_metrics_dict
 
-def save_checkpoint(model, optimizer, filename):
-    """Saves checkpoint."""
-    try:
-        print(f"=> Saving checkpoint to {filename}")
-        checkpoint = {
-            "state_dict": model.state_dict(),
-            "optimizer": optimizer.state_dict(),
-        }
-        os.makedirs(os.path.dirname(filename), exist_ok=True)
-        torch.save(checkpoint, filename)
-    except Exception as e:
-        print(f"Error saving checkpoint to {filename}: {e}")
-
-def load_checkpoint(checkpoint_file, model, optimizer, lr, device):
-    """Loads checkpoint."""
-    if not os.path.isfile(checkpoint_file):
-        print(f"=> Checkpoint file not found at {checkpoint_file}. Skipping load.")
-        return
-    print(f"=> Loading checkpoint from {checkpoint_file}")
-    try:
-        checkpoint = torch.load(checkpoint_file, map_location=device)
-        model.load_state_dict(checkpoint["state_dict"])
-        if optimizer is not None and "optimizer" in checkpoint:
-             optimizer.load_state_dict(checkpoint["optimizer"])
-             for param_group in optimizer.param_groups:
-                 param_group["lr"] = lr # Reset LR from config
-        print("=> Checkpoint loaded successfully")
-    except Exception as e:
-        print(f"=> Error loading checkpoint: {e}")
-
-
 # --- NEW: CSV Logging Function ---
 def log_metrics_to_csv(log_path, epoch, config, train_loss, val_loss, metrics_dict):
     """Appends metrics and config details for an epoch to a CSV file."""
@@ -446,6 +303,20 @@ def main():
     # --- Initialize Model, Loss, Optimizer ---
     model = get_model(config)
     criterion = get_loss_fn(config)
+
+    # --- Knowledge Distillation (optional) ---
+    teacher = None
+    if config.DISTILL_TEACHER_CHECKPOINT:
+        from loss.distillation import DistillationLoss
+        from distill import TeacherLogits, load_teacher, teacher_cache_dir
+        teacher_model, teacher_cfg = load_teacher(config)
+        # Augmented samples differ every epoch, so their teacher logits cannot be cached
+        cache_dir = None if config.USE_AUGMENTATION else teacher_cache_dir(config)
+        teacher = TeacherLogits(teacher_model, cache_dir=cache_dir, dataset=train_loader.dataset)
+        criterion = DistillationLoss(criterion, alpha=config.DISTILL_ALPHA, temperature=config.DISTILL_TEMPERATURE)
+        print(f"Distilling {config.MODEL_NAME} from {teacher_cfg.MODEL_NAME} ({config.DISTILL_TEACHER_CHECKPOINT}), "
+              f"alpha={config.DISTILL_ALPHA}, T={config.DISTILL_TEMPERATURE}, teacher logits "
+              f"{'cached in ' + cache_dir if cache_dir else 'computed per batch (augmentation on)'}")
     # optimizer = optim.Adam(model.parameters(), lr=config.LEARNING_RATE, weight_decay=config.WEIGHT_DECAY)
     if config.OPTIMIZER == "SGD":
         optimizer = optim.SGD(
@@ -473,22 +344,43 @@ def main():
 
 
     # --- TensorBoard Writer ---
+    from torch.utils.tensorboard.writer import SummaryWriter  # imported here so `import train` (test.py) skips TensorBoard
     writer = SummaryWriter(log_dir=experiment_dir)
     print(f"TensorBoard logs will be saved in: {experiment_dir}")
     print(f"Checkpoints will be saved in: {model_ckpt_dir}")
 
+    if teacher is not None: # Teacher's validation metrics, for the report and as its own TensorBoard run
+        teacher_writer = SummaryWriter(log_dir=os.path.join(experiment_dir, "teacher"))
+        _, teacher_metrics = validate_one_epoch(teacher_model, criterion, val_loader, 0, teacher_cfg, teacher_writer)
+        teacher_writer.close()
+        best_student_metrics = {}
+
 
     # --- Optional: Load Checkpoint ---
     # load_checkpoint_file = os.path.join(model_ckpt_dir, "best.pth.tar")
     # load_checkpoint(load_checkpoint_file, model, optimizer, config.LEARNING_RATE, config.DEVICE)
 
+    early_stopper = EarlyStopping(
+        patience=config.PATIENCE,
+        monitor='val_iou',
+        mode='max',  # use 'min' if you're monitoring a loss
+        path='best_model.pt'
+    )
+
     # --- Training Loop ---
     best_val_loss = float('inf')
     epochs_no_improve = 0 # Counter for early stopping
 
     for epoch in range(config.NUM_EPOCHS):
-        train_loss = train_one_epoch(model, optimizer, criterion, train_loader, epoch, config, writer)
-        val_loss, avg_val_metrics = validate_one_epoch(model, criterion, val_loader, epoch, config, writer)
+        train_loss = train_one_epoch(model, optimizer, criterion, train_loader, epoch, config, writer, teacher)
+        threshold_sweep = ThresholdSweep(num_bins=config.THRESHOLD_SWEEP_BINS)
+        val_loss, avg_val_metrics = validate_one_epoch(model, criterion, val_loader, epoch, config, writer, threshold_sweep)
+
+        best_threshold = None
+        if threshold_sweep.num_samples > 0:
+            best_threshold, best_threshold_score = threshold_sweep.best_threshold(config.THRESHOLD_CRITERION, config.THRESHOLD_AVERAGE)
+            writer.add_scalar("Threshold/Best", best_threshold, epoch)
+            writer.add_scalar(f"Threshold/Best_{config.THRESHOLD_CRITERION.replace(' ', '_')}", best_threshold_score, epoch)
 
         if scheduler is not None:
             scheduler.step()
@@ -496,6 +388,8 @@ def main():
 
         print(f"\n--- Epoch {epoch+1}/{config.NUM_EPOCHS} ---")
         print(f"Train Loss: {train_loss:.4f} | Val Loss: {val_loss:.4f}")
+        if best_threshold is not None:
+            print(f"Best Threshold ({config.THRESHOLD_CRITERION}, {config.THRESHOLD_AVERAGE}): {best_threshold:.4f} -> {best_threshold_score:.4f}")
 
         # Check if metrics dictionary is not empty before printing/logging
         if avg_val_metrics:
@@ -516,7 +410,7 @@ def main():
             # Save checkpoint periodically (e.g., every 2 epochs)
             if (epoch + 1) % 2 == 0 :
                 ckpt_path = os.path.join(model_ckpt_dir, f"epoch_{epoch+1}.pth.tar")
-                save_checkpoint(model, optimizer, filename=ckpt_path)
+                save_checkpoint(model, optimizer, filename=ckpt_path, threshold=best_threshold)
 
             # Save the best model based on validation loss
             # if val_loss < best_val_loss:
@@ -559,8 +453,10 @@ def main():
                 if early_stopper.best_score == val_iou:
                     # Save best model manually in your usual format
                     best_path = os.path.join(model_ckpt_dir, "best.pth.tar")
-                    save_checkpoint(model, optimizer, filename=best_path)
+                    save_checkpoint(model, optimizer, filename=best_path, threshold=best_threshold)
                     print(f"[*] Best model updated and saved to {best_path} (Val IoU: {val_iou:.4f})")
+                    if teacher is not None:
+                        best_student_metrics = avg_val_metrics
 
                 if early_stopper.early_stop:
                     print(f"\n[Early Stopping] Validation IoU did not improve for {config.PATIENCE} epochs. Stopping training.")
@@ -576,6 +472,13 @@ def main():
         print(f"Loading best model from {best_model_path} for final evaluation...")
         model.load_state_dict(torch.load(best_model_path))
 
+    if teacher is not None:
+        if teacher.cache_dir is not None:
+            print(f"Teacher logits: {teacher.hits} samples from the cache, {teacher.misses} computed")
+        from distill import distillation_report
+        distillation_report(teacher_model, model, teacher_metrics, best_student_metrics or avg_val_metrics,
+                            config, teacher_cfg, os.path.join(experiment_dir, "distillation_report.json"))
+
     writer.close()
     print("--- Training Finished ---")
     print(f"CSV log saved: {csv_log_path}")
@@ -585,25 +488,14 @@ def visualize_predictions(model, val_loader, config, epoch, writer, num_samples=
     """Visualizes predictions and saves/logs them."""
     print(f"--- Visualizing Predictions for Epoch {epoch+1} ---")
     model.eval()
-    images_shown = 0
     # Ensure num_samples is positive
     num_samples = max(1, num_samples) # Show at least 1 if possible
-
-    # Create figure with specified layout: num_samples rows, 3 columns
-    fig, axs = plt.subplots(num_samples, 3, figsize=(9, num_samples * 3)) # Width=9 (3*3), Height=num_samples*3
-    # Ensure axs is always a 2D array, even if num_samples is 1
-    if num_samples == 1:
-        axs = np.array([axs]) # Wrap in another array dimension
-
-    # Turn off all axes initially
-    for ax_row in axs:
-         for ax in ax_row:
-             ax.axis("off")
+    rows = [] # One [image | GT | prediction | overlay] panel per sample
 
     with torch.no_grad():
         # Iterate through val_loader until enough samples are collected or loader ends
         for batch_idx, batch_data in enumerate(val_loader):
-            if images_shown >= num_samples: break
+            if len(rows) >= num_samples: break
 
             # Basic batch integrity check
             if not isinstance(batch_data, (list, tuple)) or len(batch_data) != 3: continue
@@ -623,74 +515,31 @@ def visualize_predictions(model, val_loader, config, epoch, writer, num_samples=
             # --- Get Model Output ---
             outputs_raw = model(data)
             outputs_prob = torch.sigmoid(outputs_raw)
-            outputs_binary = (outputs_prob > 0.5).int()
+            outputs_binary = (outputs_prob > config.THRESHOLD).float()
 
-            # --- Plot samples from the current batch ---
+            # --- Build panels for samples from the current batch ---
             for i in range(data_vis.shape[0]):
-                if images_shown >= num_samples: break
+                if len(rows) >= num_samples: break
+                rows.append(prediction_panel(data_vis[i].cpu(), targets[i].cpu(), outputs_binary[i].cpu()))
 
-                # img_np = data_vis[i].cpu().numpy()
-                # label_np = targets[i].cpu().numpy()
-                # pred_np_binary = outputs_binary[i].cpu().numpy()
-
-
-                img_np = extract_2d_slice(data_vis[i])
-                label_np = extract_2d_slice(targets[i])
-                pred_np_binary = extract_2d_slice(outputs_binary[i])
-
-                # Plot Image in column 0 of the current row
-                axs[images_shown, 0].imshow(to_grayscale_numpy(img_np), cmap='gray', vmin=0, vmax=1)
-                axs[images_shown, 0].set_title(f"Image {images_shown+1}")
-                axs[images_shown, 0].axis("off") # Re-enable axis for this plot
-
-                # Plot Ground Truth in column 1
-                axs[images_shown, 1].imshow(to_grayscale_numpy(label_np), cmap='gray', vmin=0, vmax=1)
-                axs[images_shown, 1].set_title(f"GT {images_shown+1}")
-                axs[images_shown, 1].axis("off")
-
-                # Plot Prediction in column 2
-                axs[images_shown, 2].imshow(to_grayscale_numpy(pred_np_binary), cmap='gray', vmin=0, vmax=1)
-                axs[images_shown, 2].set_title(f"Pred {images_shown+1}")
-                axs[images_shown, 2].axis("off")
-
-                images_shown += 1
-
-    # Adjust layout if fewer images were shown than planned
-    if images_shown < num_samples:
-        print(f"Warning: Only able to visualize {images_shown} samples (requested {num_samples}).")
-        # Optional: Adjust figure size or remove empty rows if desired
-        # For simplicity, we just leave empty rows blank as axes are off
-
-    plt.tight_layout(pad=0.5)
+    if not rows:
+        print("Warning: No samples available for visualization.")
+        return
+    if len(rows) < num_samples:
+        print(f"Warning: Only able to visualize {len(rows)} samples (requested {num_samples}).")
 
-    # --- Save figure and log to TensorBoard ---
+    # --- Save grid and log to TensorBoard ---
+    grid = panel_grid(rows)
     vis_log_dir = os.path.join(config.LOG_DIR, config.EXPERIMENT_NAME, "visualizations")
     os.makedirs(vis_log_dir, exist_ok=True)
-    save_path = os.path.join(vis_log_dir, f"epoch_{epoch+1}_predictions.png")
-
-    try:
-        plt.savefig(save_path, bbox_inches='tight', dpi=150)
+    save_path = write_png(os.path.join(vis_log_dir, f"epoch_{epoch+1}_predictions.png"), grid)
+    if save_path:
         print(f"Saved validation visualization to {save_path}")
-        if writer:
-            # Read image and log to TensorBoard
-            try:
-                img = plt.imread(save_path)
-                if img.ndim == 3: img = np.transpose(img[:, :, :3], (2, 0, 1)) # HWC -> CHW (RGB)
-                elif img.ndim == 2: img = np.expand_dims(img, axis=0) # HW -> CHW (Grayscale)
-                writer.add_image(f"Validation_Predictions/Epoch_{epoch+1}", img, global_step=epoch)
-            except FileNotFoundError:
-                 print(f"Error: Could not read saved image {save_path} for TensorBoard logging.")
-    except Exception as e:
-        print(f"Error saving or logging visualization: {e}")
-    finally:
-        plt.close(fig) # Close the figure
-
-
-def extract_2d_slice(tensor):
-    np_img = tensor.cpu().numpy()
-    while np_img.ndim > 2:
-        np_img = np_img[0]
-    return np_img
+    if writer:
+        try:
+            writer.add_image(f"Validation_Predictions/Epoch_{epoch+1}", grid, global_step=epoch, dataformats="HWC")
+        except Exception as e:
+            print(f"Error logging visualization to TensorBoard: {e}")
 
 
 if __name__ == "__main__":
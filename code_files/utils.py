@@ -3,11 +3,13 @@
 import os
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
 import cv2
 import re
 from glob import glob
+from concurrent.futures import ThreadPoolExecutor
+import torch
 import torch.nn as nn
+from label_features import LabelFeatureStore
 
 def initialize_weights(model):
     for m in model.modules():
@@ -34,7 +36,7 @@ def freeze_resnet_layers(model, freeze_until="layer2"):
             freeze = False
 
 
-def plot_metrics_vs_pulses(metrics_csv_path, save_dir, experiment_name):
+def plot_metrics_vs_pulses(metrics_csv_path, save_dir, experiment_name, grouped_metrics=None):
     """
     Reads metrics from CSV and generates plots similar to research paper figures.
     
@@ -42,9 +44,12 @@ def plot_metrics_vs_pulses(metrics_csv_path, save_dir, experiment_name):
         metrics_csv_path (str): Path to CSV containing individual metrics per sample.
         save_dir (str): Directory where the plot image will be saved.
         experiment_name (str): Name of the experiment (used in plot title and filename).
+        grouped_metrics (GroupedMetricAggregator, optional): Streaming aggregates from
+            test.evaluate. When given, the CSV is not read.
     """
 
-    metrics_df = pd.read_csv(metrics_csv_path)
+    if grouped_metrics is None:
+        metrics_df = pd.read_csv(metrics_csv_path)
 
     metrics_to_plot = {
         "Accuracy": "Predictive Accuracy (%)",
@@ -53,17 +58,24 @@ def plot_metrics_vs_pulses(metrics_csv_path, save_dir, experiment_name):
         "Mean Hausdorff": "Mean Hausdorff Distance (mm)"
     }
 
+    import matplotlib.pyplot as plt # imported on first plot; keeps `import utils` (train / test startup) light
     fig, axes = plt.subplots(2, 2, figsize=(15, 10))
     axes = axes.flatten()
 
     for idx, (metric, ylabel) in enumerate(metrics_to_plot.items()):
         ax = axes[idx]
 
-        if metric not in metrics_df.columns:
-            print(f"Warning: Metric '{metric}' not found in DataFrame columns.")
-            continue
+        if grouped_metrics is not None:
+            grouped = grouped_metrics.summary(metric, by='pulses')
+            if len(grouped['pulses']) == 0:
+                print(f"Warning: Metric '{metric}' not found in grouped metrics.")
+                continue
+        else:
+            if metric not in metrics_df.columns:
+                print(f"Warning: Metric '{metric}' not found in DataFrame columns.")
+                continue
 
-        grouped = metrics_df.groupby('pulses')[metric].agg(['mean', 'std']).reset_index().sort_values(by='pulses')
+            grouped = metrics_df.groupby('pulses')[metric].agg(['mean', 'std']).reset_index().sort_values(by='pulses')
 
         ax.plot(grouped['pulses'], grouped['mean'], 'o-', color='dodgerblue', label='CNN')
         ax.fill_between(grouped['pulses'],
@@ -86,28 +98,12 @@ def plot_metrics_vs_pulses(metrics_csv_path, save_dir, experiment_name):
 
     print(f"Metrics plot saved to {plot_path}")
 
-def plot_ablation_area_comparison(
-    mask_folder,
-    cnn_metrics_path,
-    save_path,
-    experiment_name,
-    pixel_area_mm2=0.0025,
-    filename_pattern=r't3Label(\d+)_(\d+)_(\d+)'
-):
-    """
-    Generates the Ablation Area vs Pulses plot with both Ground Truth and CNN predictions.
-
-    Parameters:
-        mask_folder (str): Path to the ground truth mask folder (.png masks).
-        cnn_metrics_path (str): Path to CSV with CNN ablation area metrics.
-        save_path (str): Directory to save the plot.
-        experiment_name (str): Label for the CNN model.
-        pixel_area_mm2 (float): Area per pixel in mm².
-        filename_pattern (str): Regex pattern to extract pulses from filename.
-    """
+def _ablation_area_from_files(mask_folder, cnn_metrics_path, pixel_area_mm2, filename_pattern):
+    """Per-pulse GT (from the label feature store) and CNN (from the metrics CSV) ablation area mean/std."""
     # --- Ground Truth Ablation Area from Mask Files ---
     gt_data = []
     mask_files = glob(os.path.join(mask_folder, "*.png"))
+    label_store = LabelFeatureStore(mask_folder)
 
     for mask_file in mask_files:
         filename = os.path.basename(mask_file)
@@ -117,9 +113,7 @@ def plot_ablation_area_comparison(
             experiment_id = match.group(2)
             dataset_idx = int(match.group(3))
 
-            mask = cv2.imread(mask_file, cv2.IMREAD_GRAYSCALE)
-            _, binary_mask = cv2.threshold(mask, 127, 1, cv2.THRESH_BINARY)
-            ablation_area = np.sum(binary_mask) * pixel_area_mm2
+            ablation_area = label_store.scalars(filename)["area"] * pixel_area_mm2
 
             gt_data.append({
                 'pulses': pulses,
@@ -141,7 +135,39 @@ def plot_ablation_area_comparison(
     cnn_grouped = cnn_df.groupby('pulses')['ablation_area'].agg(['mean', 'std']).reset_index()
     cnn_grouped = cnn_grouped.sort_values(by='pulses')
 
+    return gt_grouped, cnn_grouped
+
+def plot_ablation_area_comparison(
+    mask_folder,
+    cnn_metrics_path,
+    save_path,
+    experiment_name,
+    pixel_area_mm2=0.0025,
+    filename_pattern=r't3Label(\d+)_(\d+)_(\d+)',
+    grouped_metrics=None
+):
+    """
+    Generates the Ablation Area vs Pulses plot with both Ground Truth and CNN predictions.
+
+    Parameters:
+        mask_folder (str): Path to the ground truth mask folder (.png masks).
+        cnn_metrics_path (str): Path to CSV with CNN ablation area metrics.
+        save_path (str): Directory to save the plot.
+        experiment_name (str): Label for the CNN model.
+        pixel_area_mm2 (float): Area per pixel in mm².
+        filename_pattern (str): Regex pattern to extract pulses from filename.
+        grouped_metrics (GroupedMetricAggregator, optional): Streaming aggregates from
+            test.evaluate holding 'ablation_area' and 'gt_ablation_area'. When given,
+            neither the masks nor the CSV are read.
+    """
+    if grouped_metrics is not None:
+        gt_grouped = grouped_metrics.summary('gt_ablation_area', by='pulses')
+        cnn_grouped = grouped_metrics.summary('ablation_area', by='pulses')
+    else:
+        gt_grouped, cnn_grouped = _ablation_area_from_files(mask_folder, cnn_metrics_path, pixel_area_mm2, filename_pattern)
+
     # --- Plot ---
+    import matplotlib.pyplot as plt
     plt.figure(figsize=(10, 6))
 
     # Ground Truth
@@ -177,6 +203,70 @@ import cv2
 import numpy as np
 import torch
 
+def _as_mask_batch(masks):
+    """Converts a mask tensor / array shaped [B, 1, H, W], [B, H, W], [1, H, W] or [H, W] to a uint8 (B, H, W) array."""
+    if isinstance(masks, torch.Tensor):
+        masks = masks.detach().cpu().numpy()
+    masks = np.asarray(masks)
+    if masks.ndim == 4:
+        masks = masks[:, 0]
+    elif masks.ndim == 2:
+        masks = masks[None]
+    return (masks > 0.5).astype(np.uint8)
+
+
+def filter_components(mask_np, min_size=100, connectivity=8):
+    """
+    Remove connected components smaller than min_size from one (H, W) uint8 mask.
+
+    Connected components are labelled once; kept components are selected with a
+    label -> {0, 1} lookup table, so the cost does not grow with the number of blobs.
+
+    Returns:
+        cleaned (np.ndarray): (H, W) uint8 mask.
+        component_stats (dict): num_components, largest_area (pixels) and
+            bboxes [(x, y, w, h), ...] of the kept components.
+    """
+    num_labels, labels, stats, _ = cv2.connectedComponentsWithStats(mask_np, connectivity=connectivity)
+
+    keep = stats[:, cv2.CC_STAT_AREA] >= min_size
+    keep[0] = False  # background
+    cleaned = keep.astype(np.uint8)[labels]
+
+    kept_stats = stats[keep]
+    component_stats = {
+        "num_components": int(keep.sum()),
+        "largest_area": int(kept_stats[:, cv2.CC_STAT_AREA].max()) if len(kept_stats) else 0,
+        "bboxes": [tuple(int(v) for v in row[:4]) for row in kept_stats],
+    }
+    return cleaned, component_stats
+
+
+def postprocess_batch(masks, min_size=100, num_workers=4):
+    """
+    Remove small connected components from a batch of binary masks.
+
+    Args:
+        masks (torch.Tensor or np.ndarray): [B, 1, H, W], [B, H, W], [1, H, W] or [H, W].
+        min_size (int): Minimum pixel area to keep.
+        num_workers (int): Threads used across the batch (OpenCV releases the GIL).
+    Returns:
+        torch.Tensor: Cleaned masks, shape [B, 1, H, W], float.
+        list[dict]: Per-mask component stats from filter_components.
+    """
+    batch = _as_mask_batch(masks)
+    if num_workers > 1 and len(batch) > 1:
+        with ThreadPoolExecutor(max_workers=min(num_workers, len(batch))) as pool:
+            results = list(pool.map(lambda m: filter_components(m, min_size), batch))
+    else:
+        results = [filter_components(m, min_size) for m in batch]
+
+    if not results:
+        return torch.zeros((0, 1) + batch.shape[1:]), []
+    cleaned = np.stack([r[0] for r in results])[:, None]
+    return torch.from_numpy(cleaned).float(), [r[1] for r in results]
+
+
 def postprocess_mask(mask_tensor, min_size=100):
     """
     Remove small connected components from binary mask.
@@ -186,16 +276,8 @@ def postprocess_mask(mask_tensor, min_size=100):
     Returns:
         torch.Tensor: Cleaned mask with small blobs removed.
     """
-    mask_np = mask_tensor.cpu().numpy().squeeze().astype(np.uint8)
-
-    num_components, output, stats, _ = cv2.connectedComponentsWithStats(mask_np, connectivity=8)
-
-    cleaned_mask = np.zeros_like(mask_np)
-    for i in range(1, num_components):  # skip background
-        if stats[i, cv2.CC_STAT_AREA] >= min_size:
-            cleaned_mask[output == i] = 1
-
-    return torch.tensor(cleaned_mask).unsqueeze(0).float()
+    cleaned, _ = postprocess_batch(mask_tensor, min_size=min_size, num_workers=1)
+    return cleaned[0]
 
 
 def to_grayscale_numpy(tensor):
@@ -255,3 +337,46 @@ class EarlyStopping:
         torch.save(model.state_dict(), self.path)
         if self.verbose:
             print(f"Saved best model checkpoint to {self.path}")
+
+
+def save_checkpoint(model, optimizer, filename, threshold=None, pruning=None):
+    """
+    Saves checkpoint. `threshold` is the decision threshold selected on validation;
+    `pruning` is the plan of a channel-pruned model (prune.py), needed to rebuild its shapes.
+    """
+    try:
+        print(f"=> Saving checkpoint to {filename}")
+        checkpoint = {
+            "state_dict": model.state_dict(),
+            "optimizer": optimizer.state_dict(),
+        }
+        if threshold is not None:
+            checkpoint["threshold"] = threshold
+        if pruning is not None:
+            checkpoint["pruning"] = pruning
+        os.makedirs(os.path.dirname(filename), exist_ok=True)
+        torch.save(checkpoint, filename)
+    except Exception as e:
+        print(f"Error saving checkpoint to {filename}: {e}")
+
+def load_checkpoint(checkpoint_file, model, optimizer, lr, device):
+    """Loads checkpoint. Returns the checkpoint dict, or None if it could not be loaded."""
+    if not os.path.isfile(checkpoint_file):
+        print(f"=> Checkpoint file not found at {checkpoint_file}. Skipping load.")
+        return None
+    print(f"=> Loading checkpoint from {checkpoint_file}")
+    try:
+        checkpoint = torch.load(checkpoint_file, map_location=device)
+        if "pruning" in checkpoint: # channel-pruned by prune.py: shrink the layers first
+            from prune import restore_pruning
+            restore_pruning(model, checkpoint["pruning"])
+        model.load_state_dict(checkpoint["state_dict"])
+        if optimizer is not None and "optimizer" in checkpoint:
+             optimizer.load_state_dict(checkpoint["optimizer"])
+             for param_group in optimizer.param_groups:
+                 param_group["lr"] = lr # Reset LR from config
+        print("=> Checkpoint loaded successfully")
+        return checkpoint
+    except Exception as e:
+        print(f"=> Error loading checkpoint: {e}")
+        return None
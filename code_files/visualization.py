@@ -0,0 +1,145 @@
+# visualization.py
+# Per-sample prediction panels built directly with numpy (no matplotlib figures).
+import os
+import numpy as np
+import cv2
+import torch
+
+from evaluator import PipelinedEvaluator
+
+# Overlay colours (RGB): true positive, false positive, false negative
+OVERLAY_COLORS = {
+    "tp": np.array([0, 255, 0], dtype=np.uint8),
+    "fp": np.array([255, 0, 0], dtype=np.uint8),
+    "fn": np.array([0, 128, 255], dtype=np.uint8),
+}
+PANEL_GAP = 4  # Pixels of white between panels and between rows
+
+
+def to_rgb_uint8(array):
+    """
+    Converts an image / mask in [0, 1] to an (H, W, 3) uint8 array.
+
+    Accepts tensors or numpy arrays shaped (H, W), (1, H, W), (3, H, W) or with
+    extra leading singleton dims (e.g. (1, 1, H, W)).
+    """
+    if isinstance(array, torch.Tensor):
+        array = array.detach().cpu().float().numpy()
+    array = np.asarray(array, dtype=np.float32)
+    while array.ndim > 3 and array.shape[0] == 1:
+        array = array[0]
+    if array.ndim == 3:
+        if array.shape[0] == 3:
+            array = np.transpose(array, (1, 2, 0))  # CHW -> HWC
+        else:
+            array = array[0]
+    if array.ndim != 2 and not (array.ndim == 3 and array.shape[2] == 3):
+        raise ValueError(f"Cannot build an image panel from shape {array.shape}")
+
+    array = (np.clip(array, 0.0, 1.0) * 255.0 + 0.5).astype(np.uint8)
+    if array.ndim == 2:
+        array = np.repeat(array[:, :, None], 3, axis=2)
+    return array
+
+
+def overlay_panel(image_rgb, target, prediction, alpha=0.5):
+    """Blends TP / FP / FN colours over the input image. Masks are binary (H, W)."""
+    panel = image_rgb.astype(np.float32)
+    for name, mask in (("tp", target & prediction), ("fp", ~target & prediction), ("fn", target & ~prediction)):
+        panel[mask] = (1.0 - alpha) * panel[mask] + alpha * OVERLAY_COLORS[name]
+    return (panel + 0.5).astype(np.uint8)
+
+
+def prediction_panel(image, target, prediction, overlay=True):
+    """
+    Builds one row [image | ground truth | prediction | overlay] as an (H, W', 3) uint8 array.
+
+    Args:
+        image: Input frame in [0, 1] (tensor or numpy; grayscale or RGB).
+        target: Ground-truth mask (values > 0.5 are foreground).
+        prediction: Binary prediction mask (values > 0.5 are foreground).
+        overlay (bool): Append the TP (green) / FP (red) / FN (blue) overlay panel.
+    """
+    image_rgb = to_rgb_uint8(image)
+    target_rgb = to_rgb_uint8(target)
+    prediction_rgb = to_rgb_uint8(prediction)
+    panels = [image_rgb, target_rgb, prediction_rgb]
+    if overlay:
+        panels.append(overlay_panel(image_rgb, target_rgb[:, :, 0] > 127, prediction_rgb[:, :, 0] > 127))
+
+    height = image_rgb.shape[0]
+    gap = np.full((height, PANEL_GAP, 3), 255, dtype=np.uint8)
+    row = [panels[0]]
+    for panel in panels[1:]:
+        row.extend([gap, panel])
+    return np.concatenate(row, axis=1)
+
+
+def panel_grid(rows):
+    """Stacks prediction_panel rows vertically (padding narrower rows) into one (H, W, 3) uint8 image."""
+    if not rows:
+        raise ValueError("panel_grid needs at least one row")
+    width = max(row.shape[1] for row in rows)
+    stacked = []
+    for i, row in enumerate(rows):
+        if row.shape[1] < width:
+            row = np.pad(row, ((0, 0), (0, width - row.shape[1]), (0, 0)), constant_values=255)
+        if i > 0:
+            stacked.append(np.full((PANEL_GAP, width, 3), 255, dtype=np.uint8))
+        stacked.append(row)
+    return np.concatenate(stacked, axis=0)
+
+
+def write_png(path, image_rgb):
+    """Encodes an (H, W, 3) RGB uint8 array to PNG. Returns the path, or None on failure."""
+    try:
+        if not cv2.imwrite(path, np.ascontiguousarray(image_rgb[:, :, ::-1])):  # OpenCV expects BGR
+            raise IOError("cv2.imwrite returned False")
+        return path
+    except Exception as e:
+        print(f"Error saving visualization {path}: {e}")
+        return None
+
+
+class VisualizationWriter:
+    """
+    Background PNG writer for prediction panels.
+
+    Panels are composed on the caller's thread (cheap numpy ops) and PNG
+    encoding + disk writes run on a small worker pool, so the inference loop
+    never waits on image I/O. At most `max_pending` panels are held in memory.
+
+    Usage:
+        with VisualizationWriter(out_dir, num_workers=2) as vis_writer:
+            vis_writer.save_panel("sample_pred.png", image, target, prediction)
+    """
+    def __init__(self, out_dir, num_workers=2, max_pending=16):
+        self.out_dir = out_dir
+        os.makedirs(out_dir, exist_ok=True)
+        self._pool = PipelinedEvaluator(num_workers=num_workers, max_pending=max_pending)
+        self.num_written = 0
+
+    def save(self, filename, image_rgb):
+        """Queues an already composed (H, W, 3) uint8 image for writing to out_dir/filename."""
+        self._count(self._pool.submit(write_png, os.path.join(self.out_dir, filename), image_rgb))
+
+    def save_panel(self, filename, image, target, prediction, overlay=True):
+        """Builds a prediction_panel row and queues it for writing."""
+        self.save(filename, prediction_panel(image, target, prediction, overlay=overlay))
+
+    def _count(self, results):
+        self.num_written += sum(1 for path in results if path is not None)
+
+    def close(self):
+        self._count(self._pool.drain())
+        self._pool.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None:
+            self._pool.__exit__(exc_type, exc_value, traceback)
+        else:
+            self.close()
+        return False